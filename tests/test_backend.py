@@ -2240,6 +2240,43 @@ class BackendTests(Tf2OnnxBackendTestBase):
             return tf.identity(y, name=_TFOUTPUT)
         self._run_test_case(func, [_OUTPUT], {_INPUT: x_val, _INPUT1: mean_val, _INPUT2: offset_val, _INPUT3: var_val})
 
+    def _test_layer_norm(self, x_shape, axis, epsilon):
+        x_val = np.random.random_sample(x_shape).astype(np.float32)
+        layer = tf.keras.layers.LayerNormalization(axis=axis, epsilon=epsilon)
+        layer.build(x_shape)
+        param_shape = [x_shape[a] for a in layer.axis]
+        layer.set_weights([np.random.random_sample(param_shape).astype(np.float32) for _ in range(2)])
+        def func(x):
+            return tf.identity(layer(x), name=_TFOUTPUT)
+        if self.config.opset >= 17:
+            graph_validator = lambda g: (check_op_count(g, "LayerNormalization", 1, disabled=False) and
+                                         check_op_count(g, "ReduceMean", 0, disabled=False))
+        else:
+            graph_validator = lambda g: (check_op_count(g, "ReduceMean", 2, disabled=False) and
+                                         check_op_count(g, "BatchNormalization", 0, disabled=False))
+        self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, rtol=1e-5, graph_validator=graph_validator)
+
+    def test_layer_norm_moments(self):
+        # keras computes moments when epsilon is too small for FusedBatchNormV3
+        self._test_layer_norm([2, 3, 8], -1, 1e-12)
+
+    def test_layer_norm_fused_batch_norm(self):
+        self._test_layer_norm([2, 3, 8], -1, 1e-3)
+        self._test_layer_norm([2, 3, 4, 5], [2, 3], 1e-3)
+
+    @check_opset_min_version(17, "LayerNormalization")
+    def test_layer_norm_params_of_higher_rank(self):
+        x_val = np.random.random_sample([2, 8]).astype(np.float32)
+        gamma = np.random.random_sample([1, 1, 1, 8]).astype(np.float32)
+        beta = np.random.random_sample([1, 1, 1, 8]).astype(np.float32)
+        def func(x):
+            mean, variance = tf.nn.moments(x, axes=[-1], keepdims=True)
+            # gamma and beta make the output rank 4, it can't be a LayerNormalization of rank 2
+            y = tf.nn.batch_normalization(x, mean, variance, beta, gamma, 1e-12)
+            return tf.identity(y, name=_TFOUTPUT)
+        self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, rtol=1e-5,
+                            graph_validator=lambda g: check_op_count(g, "LayerNormalization", 0, disabled=False))
+
     @check_opset_min_version(7, "batchnorm")
     def test_conv2d_batchnorm_fusion(self):
         x_shape = [1, 28, 28, 2]
@@ -4047,6 +4084,70 @@ class BackendTests(Tf2OnnxBackendTestBase):
             return tf.linalg.inv(x, name=_TFOUTPUT)
         self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, process_args={"extra_opset": [extra_opset]})
 
+    @test_ms_domain()
+    def test_ms_gelu(self, extra_opset):
+        x_val = np.random.random([2, 3, 8]).astype(np.float32) - 0.5
+        def func(x):
+            return tf.identity(tf.nn.gelu(x), name=_TFOUTPUT)
+        self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, process_args={"extra_opset": [extra_opset]},
+                            graph_validator=lambda g: (check_op_count(g, "Gelu", 1, disabled=False) and
+                                                       check_op_count(g, "Erf", 0, disabled=False)))
+
+    @test_ms_domain()
+    def test_ms_bias_fast_gelu(self, extra_opset):
+        x_val = np.random.random([6, 8]).astype(np.float32) - 0.5
+        bias = np.random.random([8]).astype(np.float32)
+        def func(x):
+            x_ = tf.nn.gelu(tf.nn.bias_add(x, bias), approximate=True)
+            return tf.identity(x_, name=_TFOUTPUT)
+        self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, process_args={"extra_opset": [extra_opset]},
+                            graph_validator=lambda g: (check_op_count(g, "FastGelu", 1, disabled=False) and
+                                                       check_op_count(g, "Add", 0, disabled=False)))
+
+    @test_ms_domain()
+    def test_ms_skip_layer_norm(self, extra_opset):
+        x_val = np.random.random([2, 3, 8]).astype(np.float32)
+        y_val = np.random.random([2, 3, 8]).astype(np.float32)
+        # keras lowers the layer with moments or, for large enough epsilon, with FusedBatchNormV3
+        for epsilon in [1e-12, 1e-3]:
+            layer = tf.keras.layers.LayerNormalization(epsilon=epsilon)
+            layer.build([2, 3, 8])
+            layer.set_weights([np.random.random([8]).astype(np.float32) for _ in range(2)])
+            def func(x, y):
+                return tf.identity(layer(x + y), name=_TFOUTPUT)
+            self._run_test_case(func, [_OUTPUT], {_INPUT: x_val, _INPUT1: y_val}, rtol=1e-5,
+                                process_args={"extra_opset": [extra_opset]},
+                                graph_validator=lambda g: check_op_count(g, "SkipLayerNormalization", 1,
+                                                                         disabled=False))
+
+    @test_ms_domain()
+    def test_ms_attention(self, extra_opset):
+        batch_size, seq_len, num_heads, head_size = 2, 5, 2, 4
+        hidden_size = num_heads * head_size
+        x_val = np.random.random([batch_size, seq_len, hidden_size]).astype(np.float32)
+        mask_val = np.ones([batch_size, seq_len], dtype=np.int32)
+        mask_val[1, 3:] = 0
+        weights = [np.random.random([hidden_size, hidden_size]).astype(np.float32) for _ in range(3)]
+        biases = [np.random.random([hidden_size]).astype(np.float32) for _ in range(3)]
+        def func(x, mask):
+            # multi-head self attention as bert computes it
+            x_2d = tf.reshape(x, [-1, hidden_size])
+            def split_heads(w, b):
+                t = tf.reshape(tf.matmul(x_2d, w) + b, [batch_size, seq_len, num_heads, head_size])
+                return tf.transpose(t, [0, 2, 1, 3])
+            q, k, v = [split_heads(w, b) for w, b in zip(weights, biases)]
+            scores = tf.matmul(q, k, transpose_b=True) * (1.0 / np.sqrt(head_size))
+            attention_mask = tf.cast(tf.reshape(mask, [batch_size, 1, seq_len]), tf.float32)
+            attention_mask = tf.expand_dims(tf.ones([batch_size, seq_len, 1]) * attention_mask, axis=[1])
+            scores += (1.0 - attention_mask) * -10000.0
+            context = tf.matmul(tf.nn.softmax(scores), v)
+            context = tf.transpose(context, [0, 2, 1, 3])
+            return tf.identity(tf.reshape(context, [batch_size * seq_len, hidden_size]), name=_TFOUTPUT)
+        self._run_test_case(func, [_OUTPUT], {_INPUT: x_val, _INPUT1: mask_val}, rtol=1e-5,
+                            process_args={"extra_opset": [extra_opset]},
+                            graph_validator=lambda g: (check_op_count(g, "Attention", 1, disabled=False) and
+                                                       check_op_count(g, "Softmax", 0, disabled=False)))
+
     @check_opset_min_version(12)
     def test_squared_distance(self):
         x_val = np.random.random([4, 5]).astype(np.float32)
@@ -4324,6 +4425,47 @@ class BackendTests(Tf2OnnxBackendTestBase):
         with self.assertRaises(ValueError):
             self._run_test_case(func3, [_OUTPUT], {_INPUT: x_val})
 
+    @check_tf_min_version("1.14")
+    def test_rfft_ops_power_of_2(self):
+        def func(x):
+            op_ = tf.signal.rfft(x)
+            return tf.abs(op_, name=_TFOUTPUT)
+        for shape in [[4], [3, 8], [2, 3, 64]]:
+            x_val = make_xval(shape).astype(np.float32)
+            self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, rtol=1e-4, atol=1e-4)
+
+    @check_tf_min_version("1.14")
+    def test_rfft_ops_fft_length(self):
+        x_val = make_xval([3, 12]).astype(np.float32)
+        for fft_length in [8, 10, 16]:
+            def func(x):
+                op_ = tf.signal.rfft(x, fft_length=[fft_length])
+                return tf.abs(op_, name=_TFOUTPUT)
+            self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, rtol=1e-4, atol=1e-4)
+
+    @check_tf_min_version("1.14")
+    def test_rfft_ops_fft_stages(self):
+        x_val = np.random.uniform(-1, 1, [2, 1024]).astype(np.float32)
+        def func(x):
+            op_ = tf.signal.rfft(x)
+            return tf.abs(op_, name=_TFOUTPUT)
+        def graph_validator(g):
+            # no dense DFT matrix, neither as constant nor as MatMul
+            return all(node.type != "MatMul" for node in g.get_nodes()) and \
+                all(node.get_tensor_value(as_list=False).size <= 1024 for node in g.get_nodes() if node.is_const())
+        self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, rtol=1e-3, atol=1e-3, graph_validator=graph_validator)
+
+    @check_tf_min_version("1.14")
+    @check_opset_min_version(17, "DFT")
+    def test_rfft_ops_dft(self):
+        x_val = make_xval([3, 12]).astype(np.float32)
+        for fft_length in [12, 8, 16]:
+            def func(x):
+                op_ = tf.signal.rfft(x, fft_length=[fft_length])
+                return tf.abs(op_, name=_TFOUTPUT)
+            self._run_test_case(func, [_OUTPUT], {_INPUT: x_val}, rtol=1e-4, atol=1e-4,
+                                graph_validator=lambda g: check_op_count(g, "DFT", 1, disabled=False))
+
     @check_opset_min_version(11, "topk")
     def test_invert_permutation(self):
 
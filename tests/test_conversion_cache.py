@@ -0,0 +1,82 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Unit Tests for the cache of converted models."""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from tf2onnx import conversion_cache
+
+
+# pylint: disable=missing-docstring
+
+class ConversionCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_make_key(self):
+        model_dir = os.path.join(self.tmp_dir, "saved_model")
+        os.makedirs(os.path.join(model_dir, "variables"))
+        self._write("saved_model/saved_model.pb", b"graph")
+        self._write("saved_model/variables/variables.index", b"index")
+        key = conversion_cache.make_key([model_dir], {"opset": 13})
+        self.assertEqual(key, conversion_cache.make_key([model_dir], {"opset": 13}))
+        self.assertNotEqual(key, conversion_cache.make_key([model_dir], {"opset": 12}))
+        self._write("saved_model/variables/variables.index", b"index2")
+        self.assertNotEqual(key, conversion_cache.make_key([model_dir], {"opset": 13}))
+
+    def test_get_and_put(self):
+        cache = conversion_cache.ConversionCache(self.cache_dir, 1000)
+        output = os.path.join(self.tmp_dir, "model.onnx")
+        self.assertFalse(cache.get("k", output))
+        self._write("model.onnx", b"model")
+        self._write("model.onnx.data", b"weights")
+        # the data file isn't cached unless the conversion wrote it
+        cache.put("j", output)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cache_dir, "j"))), ["model"])
+        cache.put("k", output, external_data=True)
+        os.remove(output)
+        os.remove(output + ".data")
+
+        other = os.path.join(self.tmp_dir, "other.onnx")
+        self.assertTrue(cache.get("k", other))
+        with open(other, "rb") as f:
+            self.assertEqual(f.read(), b"model")
+        with open(other + ".data", "rb") as f:
+            self.assertEqual(f.read(), b"weights")
+
+    def test_evict_least_recently_used(self):
+        cache = conversion_cache.ConversionCache(self.cache_dir, 250)
+        output = self._write("model.onnx", b"x" * 100)
+        cache.put("a", output)
+        cache.put("b", output)
+        now = time.time()
+        os.utime(os.path.join(self.cache_dir, "a"), (now - 100, now - 100))
+        os.utime(os.path.join(self.cache_dir, "b"), (now - 50, now - 50))
+        # a is used again, b becomes the oldest entry
+        self.assertTrue(cache.get("a", output))
+        cache.put("c", output)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ["a", "c"])
+
+        # entries larger than the cache are not stored
+        cache.put("d", self._write("big.onnx", b"x" * 300))
+        self.assertFalse(cache.get("d", output))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,10 @@
 """ Test convert.py """
 
 import os
+import shutil
+import subprocess
 import sys
+import tempfile
 import unittest
 
 from tf2onnx import convert
@@ -28,6 +31,15 @@ def run_test_case(args, paths_to_check=None):
 class Tf2OnnxConvertTest(unittest.TestCase):
     """ teat cases for convert.py """
 
+    def setUp(self):
+        # every test converts, the cache is only hit within a test
+        self.cache_dir = tempfile.mkdtemp()
+        os.environ["TF2ONNX_CACHE_DIR"] = self.cache_dir
+
+    def tearDown(self):
+        del os.environ["TF2ONNX_CACHE_DIR"]
+        shutil.rmtree(self.cache_dir)
+
     def test_convert_saved_model(self):
         """ convert saved model """
         self.assertTrue(run_test_case(['',
@@ -52,6 +64,49 @@ class Tf2OnnxConvertTest(unittest.TestCase):
                                       ],
                                       paths_to_check=['converted_saved_model.onnx', 'frozen_graph.pb']))
 
+    def test_convert_with_optimizer_report(self):
+        """ convert graphdef and write optimizer report """
+        self.assertTrue(run_test_case(['',
+                                       '--input',
+                                       'tests/models/regression/graphdef/frozen.pb',
+                                       '--inputs',
+                                       'X:0',
+                                       '--outputs',
+                                       'pred:0',
+                                       '--output',
+                                       'converted_graphdef.onnx',
+                                       '--optimizer_report',
+                                       'optimizer_report.json'],
+                                      paths_to_check=['converted_graphdef.onnx', 'optimizer_report.json']))
+
+    def test_convert_float16(self):
+        """ convert graphdef to float16 """
+        self.assertTrue(run_test_case(['',
+                                       '--input',
+                                       'tests/models/regression/graphdef/frozen.pb',
+                                       '--inputs',
+                                       'X:0',
+                                       '--outputs',
+                                       'pred:0',
+                                       '--float16',
+                                       '--output',
+                                       'converted_graphdef.onnx']))
+
+    def test_convert_quantize(self):
+        """ convert graphdef and quantize it """
+        self.assertTrue(run_test_case(['',
+                                       '--input',
+                                       'tests/models/regression/graphdef/frozen.pb',
+                                       '--inputs',
+                                       'X:0',
+                                       '--outputs',
+                                       'pred:0',
+                                       '--opset',
+                                       '13',
+                                       '--quantize',
+                                       '--output',
+                                       'converted_graphdef.onnx']))
+
     @check_tf_min_version("2.2")
     def test_convert_large_model(self):
         """ convert saved model to onnx large model format """
@@ -64,6 +119,139 @@ class Tf2OnnxConvertTest(unittest.TestCase):
                                        '--output',
                                        'converted_saved_model.zip']))
 
+    @check_tf_min_version("2.2")
+    def test_convert_external_data(self):
+        """ convert saved model to onnx with tensors in an external data file """
+        self.assertTrue(run_test_case(['',
+                                       '--large_model',
+                                       '--external_data',
+                                       '--saved-model',
+                                       'tests/models/regression/saved_model',
+                                       '--tag',
+                                       'serve',
+                                       '--output',
+                                       'converted_saved_model.onnx'],
+                                      paths_to_check=['converted_saved_model.onnx', 'converted_saved_model.onnx.data']))
+
+    def test_convert_stream_variables(self):
+        """ convert saved model reading its variables from the checkpoint """
+        self.assertTrue(run_test_case(['',
+                                       '--stream_variables',
+                                       '--saved-model',
+                                       'tests/models/regression/saved_model',
+                                       '--tag',
+                                       'serve',
+                                       '--output',
+                                       'converted_saved_model.onnx']))
+
+    def test_convert_cache(self):
+        """ convert saved model twice, the second time from the cache """
+        args = ['', '--saved-model', 'tests/models/regression/saved_model', '--tag', 'serve']
+        output = ['--output', 'converted_saved_model.onnx']
+        self.assertTrue(run_test_case(args + ['--no-cache'] + output))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+        self.assertTrue(run_test_case(args + output))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertTrue(run_test_case(args + output))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        # other options are another entry
+        self.assertTrue(run_test_case(args + ['--opset', '10'] + output))
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_convert_cache_hit_without_tf(self):
+        """ a model from the cache doesn't need tensorflow """
+        args = ['', '--saved-model', 'tests/models/regression/saved_model', '--tag', 'serve',
+                '--output', 'converted_saved_model.onnx']
+        self.assertTrue(run_test_case(args))
+        script = ("import sys; from tf2onnx import convert; sys.argv = {!r}; convert.main(); "
+                  "sys.exit('tensorflow' in sys.modules)".format(args))
+        subprocess.check_call([sys.executable, '-c', script])
+        self.assertTrue(os.path.exists('converted_saved_model.onnx'))
+        os.remove('converted_saved_model.onnx')
+
+    def test_convert_refresh_weights(self):
+        """ convert saved model with provenance, then refresh its weights """
+        args = ['', '--saved-model', 'tests/models/regression/saved_model', '--tag', 'serve']
+        old_model = os.path.join(self.cache_dir, 'old_saved_model.onnx')
+        sys.argv = args + ['--provenance', '--output', old_model]
+        convert.main()
+        self.assertTrue(os.path.exists(old_model + '.provenance.json'))
+        output = 'converted_saved_model.onnx'
+        self.assertTrue(run_test_case(args + ['--refresh-weights', old_model, '--output', output],
+                                      [output, output + '.provenance.json']))
+
+    @check_tf_min_version("2.2")
+    def test_convert_weight_store(self):
+        """ convert two saved models sharing a weight into one weight store """
+        import numpy as np
+        import tensorflow as tf
+
+        shared = np.random.uniform(-1, 1, [64, 64]).astype(np.float32)
+
+        class Model(tf.Module):
+            def __init__(self):
+                super().__init__()
+                self.w1 = tf.Variable(shared)
+                self.w2 = tf.Variable(np.random.uniform(-1, 1, [64, 32]).astype(np.float32))
+
+            @tf.function(input_signature=[tf.TensorSpec([None, 64], tf.float32, name="x")])
+            def __call__(self, x):
+                return {"y": tf.matmul(tf.nn.relu(tf.matmul(x, self.w1)), self.w2)}
+
+        data_path = os.path.join(self.cache_dir, 'weights', 'weights.data')
+        sizes = []
+        for name in ['model1', 'model2']:
+            model = Model()
+            model_path = os.path.join(self.cache_dir, name)
+            tf.saved_model.save(model, model_path, signatures=model.__call__)
+            sys.argv = ['', '--saved-model', model_path, '--weight_store', os.path.join(self.cache_dir, 'weights'),
+                        '--output', os.path.join(self.cache_dir, name + '.onnx')]
+            convert.main()
+            sizes.append(os.path.getsize(data_path))
+        # the second model only adds its own weight
+        self.assertEqual(sizes, [64 * 64 * 4 + 64 * 32 * 4, 64 * 64 * 4 + 2 * 64 * 32 * 4])
+
+    @check_tf_min_version("2.2")
+    def test_convert_multiple_signatures(self):
+        """ convert several signatures of a saved model into one model """
+        import numpy as np
+        import onnx
+        import tensorflow as tf
+
+        class Model(tf.Module):
+            def __init__(self):
+                super().__init__()
+                self.w1 = tf.Variable(np.random.uniform(-1, 1, [8, 4]).astype(np.float32))
+                self.w2 = tf.Variable(np.random.uniform(-1, 1, [4, 8]).astype(np.float32))
+
+            @tf.function(input_signature=[tf.TensorSpec([None, 8], tf.float32, name="x")])
+            def encode(self, x):
+                return {"code": tf.nn.relu(tf.matmul(x, self.w1))}
+
+            @tf.function(input_signature=[tf.TensorSpec([None, 4], tf.float32, name="code")])
+            def decode(self, code):
+                return {"y": tf.matmul(code, self.w2)}
+
+            @tf.function(input_signature=[tf.TensorSpec([None, 8], tf.float32, name="x")])
+            def serve(self, x):
+                return {"y": self.decode(self.encode(x)["code"])["y"]}
+
+        model = Model()
+        model_path = os.path.join(self.cache_dir, 'multiple_signatures')
+        tf.saved_model.save(model, model_path,
+                            signatures={'serving_default': model.serve, 'encode': model.encode, 'decode': model.decode})
+        output = os.path.join(self.cache_dir, 'converted_saved_model.onnx')
+        sys.argv = ['', '--saved-model', model_path, '--signature_def', 'serving_default,encode,decode',
+                    '--output', output]
+        convert.main()
+        model_proto = onnx.load(output)
+        self.assertEqual(sorted(i.name for i in model_proto.graph.input), ['code:0', 'x:0'])
+        self.assertEqual([o.name for o in model_proto.graph.output],
+                         ['serving_default/y:0', 'encode/code:0', 'decode/y:0'])
+        # one initializer per variable, the encoder is computed once
+        self.assertEqual(len(model_proto.graph.initializer), 2)
+        self.assertEqual(sorted(n.op_type for n in model_proto.graph.node), ['MatMul', 'MatMul', 'MatMul', 'Relu'])
+
     def test_convert_graphdef(self):
         """ convert graphdef """
         self.assertTrue(run_test_case(['',
@@ -0,0 +1,150 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Unit Tests for float16 conversion."""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+from onnx import helper, numpy_helper, TensorProto, OperatorSetIdProto
+from backend_test_base import Tf2OnnxBackendTestBase
+from common import unittest_main, group_nodes_by_type, check_opset_min_version
+from tf2onnx import constants, optimizer
+from tf2onnx.float16 import convert_float_to_float16
+from tf2onnx.graph import GraphUtil
+
+
+# pylint: disable=missing-docstring,invalid-name,unused-argument,using-constant-test
+
+class Float16Tests(Tf2OnnxBackendTestBase):
+    """Convert models to float16 and compare the results with the float models in onnxruntime."""
+
+    def make_model(self, graph):
+        imp = OperatorSetIdProto()
+        imp.version = self.config.opset
+        model_proto = helper.make_model(graph, producer_name="onnx-tests", opset_imports=[imp])
+        model_proto.ir_version = constants.OPSET_TO_IR_VERSION.get(self.config.opset, model_proto.ir_version)
+        return model_proto
+
+    def run_and_compare(self, model_proto, feed_dict, output_names, op_block_list=None, rtol=1e-2, atol=1e-2):
+        g = GraphUtil.create_graph_from_onnx_model(model_proto)
+        g = convert_float_to_float16(g, op_block_list)
+        g = optimizer.optimize_graph(g, catch_errors=False)
+        new_proto = g.make_model("float16")
+
+        origin_path = self.save_onnx_model(model_proto, feed_dict, postfix="_origin")
+        new_path = self.save_onnx_model(new_proto, feed_dict, postfix="_fp16")
+        expected = self.run_onnxruntime(origin_path, feed_dict, output_names)
+        actual = self.run_onnxruntime(new_path, feed_dict, output_names)
+        for expected_val, actual_val in zip(expected, actual):
+            self.assertEqual(expected_val.dtype, actual_val.dtype)
+            self.assertAllClose(expected_val, actual_val, rtol=rtol, atol=atol)
+        return g
+
+    def _make_matmul_softmax_model(self):
+        w = np.random.uniform(-1, 1, [4, 5]).astype(np.float32)
+        b = np.random.uniform(-1, 1, [5]).astype(np.float32)
+        nodes = [
+            helper.make_node("MatMul", ["X", "W"], ["mm"]),
+            helper.make_node("Add", ["mm", "B"], ["add"]),
+            helper.make_node("Relu", ["add"], ["relu"]),
+            helper.make_node("Softmax", ["relu"], ["sm"], axis=1),
+            helper.make_node("Mul", ["sm", "add"], ["Y"]),
+        ]
+        graph = helper.make_graph(
+            nodes, "test_float16",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [3, 4])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [3, 5])],
+            initializer=[numpy_helper.from_array(w, "W"), numpy_helper.from_array(b, "B")])
+        return self.make_model(graph)
+
+    def test_float16_keeps_float_io_and_blocked_ops(self):
+        model_proto = self._make_matmul_softmax_model()
+        feed_dict = {"X": np.random.uniform(-1, 1, [3, 4]).astype(np.float32)}
+        g = self.run_and_compare(model_proto, feed_dict, ["Y"])
+
+        self.assertEqual(g.get_dtype("X"), TensorProto.FLOAT)
+        self.assertEqual(g.get_dtype("Y"), TensorProto.FLOAT)
+        ops = group_nodes_by_type(g)
+        self.assertEqual(g.get_dtype(ops["MatMul"][0].output[0]), TensorProto.FLOAT16)
+        self.assertEqual(g.get_dtype(ops["Softmax"][0].output[0]), TensorProto.FLOAT)
+        # weights are converted, no cast is needed for them
+        for node in g.get_nodes():
+            if node.is_const():
+                self.assertEqual(g.get_dtype(node.output[0]), TensorProto.FLOAT16)
+        # input, output and both sides of the softmax
+        self.assertEqual(len(ops["Cast"]), 4)
+
+    def test_float16_without_block_list(self):
+        model_proto = self._make_matmul_softmax_model()
+        feed_dict = {"X": np.random.uniform(-1, 1, [3, 4]).astype(np.float32)}
+        g = self.run_and_compare(model_proto, feed_dict, ["Y"], op_block_list=[])
+
+        ops = group_nodes_by_type(g)
+        self.assertEqual(g.get_dtype(ops["Softmax"][0].output[0]), TensorProto.FLOAT16)
+        self.assertEqual(len(ops["Cast"]), 2)
+
+    def test_float16_const_shared_by_blocked_op(self):
+        c = np.random.uniform(1, 2, [2, 3]).astype(np.float32)
+        nodes = [
+            helper.make_node("Mul", ["X", "C"], ["mul"]),
+            helper.make_node("Pow", ["mul", "C"], ["pow"]),
+            helper.make_node("Add", ["pow", "mul"], ["Y"]),
+        ]
+        graph = helper.make_graph(
+            nodes, "test_float16",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [2, 3])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [2, 3])],
+            initializer=[numpy_helper.from_array(c, "C")])
+        feed_dict = {"X": np.random.uniform(1, 2, [2, 3]).astype(np.float32)}
+        g = self.run_and_compare(self.make_model(graph), feed_dict, ["Y"])
+
+        ops = group_nodes_by_type(g)
+        self.assertEqual(g.get_dtype(ops["Pow"][0].input[1]), TensorProto.FLOAT)
+        self.assertEqual(g.get_dtype(ops["Mul"][0].input[1]), TensorProto.FLOAT16)
+
+    def test_float16_back_to_back_casts_collapsed(self):
+        nodes = [
+            helper.make_node("Cast", ["X"], ["cast"], to=TensorProto.FLOAT),
+            helper.make_node("Exp", ["cast"], ["Y"]),
+        ]
+        graph = helper.make_graph(
+            nodes, "test_float16",
+            [helper.make_tensor_value_info("X", TensorProto.INT32, [2, 3])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [2, 3])])
+        feed_dict = {"X": np.random.randint(-4, 4, [2, 3]).astype(np.int32)}
+        g = self.run_and_compare(self.make_model(graph), feed_dict, ["Y"], rtol=1e-6, atol=1e-6)
+
+        # int -> float16 -> float is the same as int -> float
+        ops = group_nodes_by_type(g)
+        self.assertEqual(len(ops["Cast"]), 1)
+        self.assertEqual(ops["Cast"][0].get_attr_value("to"), TensorProto.FLOAT)
+
+    @check_opset_min_version(9, "ConstantOfShape")
+    def test_float16_non_float_tensors_untouched(self):
+        nodes = [
+            helper.make_node("Shape", ["X"], ["shape"]),
+            helper.make_node("ConstantOfShape", ["shape"], ["ones"],
+                             value=helper.make_tensor("value", TensorProto.FLOAT, [1], [1.5])),
+            helper.make_node("Add", ["X", "ones"], ["add"]),
+            helper.make_node("Cast", ["add"], ["Z"], to=TensorProto.INT64),
+            helper.make_node("Greater", ["add", "X"], ["Y"]),
+        ]
+        graph = helper.make_graph(
+            nodes, "test_float16",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [2, 3])],
+            [helper.make_tensor_value_info("Y", TensorProto.BOOL, [2, 3]),
+             helper.make_tensor_value_info("Z", TensorProto.INT64, [2, 3])])
+        feed_dict = {"X": np.random.uniform(-4, 4, [2, 3]).astype(np.float32)}
+        g = self.run_and_compare(self.make_model(graph), feed_dict, ["Y", "Z"])
+
+        ops = group_nodes_by_type(g)
+        self.assertEqual(g.get_dtype("Y"), TensorProto.BOOL)
+        self.assertEqual(g.get_dtype("Z"), TensorProto.INT64)
+        self.assertEqual(g.get_dtype(ops["ConstantOfShape"][0].output[0]), TensorProto.FLOAT16)
+
+
+if __name__ == "__main__":
+    unittest_main()
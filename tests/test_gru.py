@@ -14,7 +14,8 @@ import tensorflow as tf
 from tensorflow.python.ops import init_ops
 from tensorflow.python.ops import variable_scope
 from backend_test_base import Tf2OnnxBackendTestBase
-from common import unittest_main, check_gru_count, check_opset_after_tf_version, skip_tf2
+from common import unittest_main, check_gru_count, check_opset_after_tf_version, skip_tf2, check_op_count, \
+    check_tf_min_version
 from tf2onnx.tf_loader import is_tf2
 
 # pylint: disable=missing-docstring,invalid-name,unused-argument,using-constant-test,cell-var-from-loop
@@ -655,5 +656,37 @@ class GRUTests(Tf2OnnxBackendTestBase):
         # graph_validator=lambda g: check_gru_count(g, 2))
 
 
+    @check_tf_min_version("2.0")
+    def test_keras_gru(self):
+        x_val = np.random.uniform(size=[3, 4, 2]).astype(np.float32)
+        layer = tf.keras.layers.GRU(5, return_sequences=True, return_state=True, bias_initializer="random_uniform")
+
+        def func(x):
+            outputs, h = layer(x)
+            return tf.identity(outputs, name="output"), tf.identity(h, name="h")
+
+        feed_dict = {"input_1:0": x_val}
+        output_names_with_port = ["output:0", "h:0"]
+        self.run_test_case(func, feed_dict, [], output_names_with_port, rtol=1e-05, atol=1e-06,
+                           graph_validator=lambda g: check_op_count(g, "GRU", 1, disabled=False) and
+                           check_op_count(g, "Loop", 0, disabled=False))
+
+    @check_opset_after_tf_version("1.15", 10, "might need ReverseV2")
+    @check_tf_min_version("2.0")
+    def test_keras_bigru(self):
+        x_val = np.random.uniform(size=[3, 4, 2]).astype(np.float32)
+        h_val = np.random.uniform(size=[3, 5]).astype(np.float32)
+        layer = tf.keras.layers.Bidirectional(tf.keras.layers.GRU(5, return_sequences=True))
+
+        def func(x, h0):
+            outputs = layer(x, initial_state=[h0, h0])
+            return tf.identity(outputs, name="output")
+
+        feed_dict = {"input_1:0": x_val, "input_2:0": h_val}
+        self.run_test_case(func, feed_dict, [], ["output:0"], rtol=1e-05, atol=1e-06,
+                           graph_validator=lambda g: check_op_count(g, "GRU", 1, disabled=False) and
+                           check_op_count(g, "Loop", 0, disabled=False))
+
+
 if __name__ == '__main__':
     unittest_main()
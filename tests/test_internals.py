@@ -7,18 +7,23 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import os
+import subprocess
+import sys
 from collections import namedtuple
 
 import graphviz as gv
 import numpy as np
+import onnx
 from onnx import TensorProto
 from onnx import helper, numpy_helper
 
 import tensorflow as tf
-from tf2onnx import utils, tf_utils
+from tf2onnx import constants, utils, tf_utils
 from tf2onnx.graph_matcher import OpTypePattern, GraphMatcher
-from tf2onnx.graph import GraphUtil
+from tf2onnx.graph import ExternalTensorStorage, GraphUtil
 from tf2onnx.tf_loader import tf_reset_default_graph, tf_session
+from tf2onnx.weight_store import WeightStore
 
 from backend_test_base import Tf2OnnxBackendTestBase
 from common import unittest_main
@@ -273,6 +278,198 @@ class Tf2OnnxInternalTests(Tf2OnnxBackendTestBase):
 
             self.assertTrue(np.array_equal(expected, actual))
 
+    def test_tensor_data_raw(self):
+        tensors = {
+            "float": np.random.randn(3, 4).astype(np.float32),
+            "half": np.random.randn(5).astype(np.float16),
+            "double": np.random.randn(2, 2, 2).astype(np.float64),
+            "int8": np.array([[-3, 4], [127, -128]], dtype=np.int8),
+            "uint16": np.array([1, 65535], dtype=np.uint16),
+            "int64": np.array([[1, -2 ** 40, 3]], dtype=np.int64),
+            "bool": np.array([True, False, True]),
+            "complex": np.array([1 + 2j, -3j], dtype=np.complex64),
+        }
+        for name, data in tensors.items():
+            # make_tensor_proto puts some dtypes in the typed fields, frozen graphs use tensor_content
+            tf_tensor = tf.make_tensor_proto(np.zeros([0], dtype=data.dtype), shape=data.shape)
+            tf_tensor.tensor_content = data.tobytes()
+            self.assertTrue(np.array_equal(tf_utils.get_tf_tensor_data(tf_tensor), data))
+            onnx_tensor = tf_utils.tf_to_onnx_tensor(tf_tensor, name=name)
+            self.assertEqual(onnx_tensor.raw_data, data.tobytes())
+            self.assertEqual(onnx_tensor, numpy_helper.from_array(data, name))
+
+        # values moved out by compress_graph_def are passed in
+        data = np.random.randn(20, 20).astype(np.float32)
+        tf_tensor = tf.make_tensor_proto(data)
+        tensor_content = tf_tensor.tensor_content
+        tf_tensor.tensor_content = b""
+        onnx_tensor = tf_utils.tf_to_onnx_tensor(tf_tensor, name="W", tensor_content=tensor_content)
+        self.assertTrue(np.array_equal(numpy_helper.to_array(onnx_tensor), data))
+
+        # values not in tensor_content are decoded
+        tf_tensor = tf.make_tensor_proto(np.array([b"a", b"bc"]))
+        onnx_tensor = tf_utils.tf_to_onnx_tensor(tf_tensor, name="S")
+        self.assertEqual(list(onnx_tensor.string_data), [b"a", b"bc"])
+        tf_tensor = tf.make_tensor_proto(1.5, shape=[2, 3])
+        onnx_tensor = tf_utils.tf_to_onnx_tensor(tf_tensor, name="F")
+        self.assertTrue(np.array_equal(numpy_helper.to_array(onnx_tensor), np.full([2, 3], 1.5, dtype=np.float32)))
+
+    def test_save_onnx_external_data(self):
+        w1 = np.random.randn(40, 40).astype(np.float32)
+        w2 = np.random.randn(40, 33).astype(np.float32)
+        nodes = [
+            helper.make_node("MatMul", ["X", "W1"], ["Y1"], name="matmul"),
+            helper.make_node("MatMul", ["Y1", "W2"], ["Y"], name="matmul2"),
+        ]
+        graph_proto = helper.make_graph(
+            nodes, "test_external_data",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [2, 40])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [2, 33])],
+            initializer=[numpy_helper.from_array(w1, "W1"), numpy_helper.from_array(w2, "W2")])
+        g = GraphUtil.create_graph_from_onnx_graph(graph_proto)
+        storage = ExternalTensorStorage()
+        model_proto = g.make_model("test", external_tensor_storage=storage)
+
+        model_path = os.path.join(self.test_data_directory, "model.onnx")
+        utils.save_onnx_external_data(model_path, model_proto, storage)
+        self.assertTrue(os.path.exists(model_path + ".data"))
+        loaded = onnx.load_model(model_path, load_external_data=False)
+        external = [t for t in loaded.graph.initializer if t.data_location == TensorProto.EXTERNAL]
+        self.assertEqual(len(external), 2)
+        for t in external:
+            entries = {entry.key: entry.value for entry in t.external_data}
+            self.assertEqual(entries["location"], "model.onnx.data")
+            self.assertEqual(int(entries["offset"]) % constants.EXTERNAL_DATA_ALIGNMENT, 0)
+            self.assertEqual(int(entries["length"]), 4 * np.prod(t.dims))
+
+        x = np.random.randn(2, 40).astype(np.float32)
+        actual = self.run_onnxruntime(model_path, {"X": x}, ["Y"])[0]
+        self.assertAllClose(np.dot(x, w1).dot(w2), actual, rtol=1e-5, atol=1e-5)
+
+    def test_save_weight_store(self):
+        w1 = np.random.randn(40, 40).astype(np.float32)
+        w2 = np.random.randn(40, 33).astype(np.float32)
+        w3 = np.random.randn(40, 33).astype(np.float32)
+        store_dir = os.path.join(self.test_data_directory, "weights")
+
+        def save(name, w):
+            nodes = [
+                helper.make_node("MatMul", ["X", "W1"], ["Y1"], name="matmul"),
+                helper.make_node("MatMul", ["Y1", "W2"], ["Y"], name="matmul2"),
+            ]
+            graph_proto = helper.make_graph(
+                nodes, "test_weight_store",
+                [helper.make_tensor_value_info("X", TensorProto.FLOAT, [2, 40])],
+                [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [2, 33])],
+                initializer=[numpy_helper.from_array(w1, "W1"), numpy_helper.from_array(w, "W2")])
+            g = GraphUtil.create_graph_from_onnx_graph(graph_proto)
+            # the store is opened again for each model, as by separate conversions
+            storage = WeightStore(store_dir)
+            model_path = os.path.join(self.test_data_directory, name)
+            added = storage.save_model(model_path, g.make_model("test", external_tensor_storage=storage))
+            loaded = onnx.load_model(model_path, load_external_data=False)
+            offsets = {}
+            for t in loaded.graph.initializer:
+                self.assertEqual(t.data_location, TensorProto.EXTERNAL)
+                entries = {entry.key: entry.value for entry in t.external_data}
+                self.assertEqual(entries["location"], "weights/weights.data")
+                self.assertEqual(int(entries["offset"]) % constants.EXTERNAL_DATA_ALIGNMENT, 0)
+                offsets[t.name] = int(entries["offset"])
+            return model_path, added, offsets
+
+        model_path1, added1, offsets1 = save("model1.onnx", w2)
+        model_path2, added2, offsets2 = save("model2.onnx", w3)
+        self.assertEqual(added1, w1.nbytes + w2.nbytes)
+        # only the tensor which differs is added
+        self.assertEqual(added2, w3.nbytes)
+        self.assertEqual(offsets1["W1"], offsets2["W1"])
+        self.assertNotEqual(offsets1["W2"], offsets2["W2"])
+        _, added3, offsets3 = save("model3.onnx", w2)
+        self.assertEqual(added3, 0)
+        self.assertEqual(offsets1, offsets3)
+
+        x = np.random.randn(2, 40).astype(np.float32)
+        actual = self.run_onnxruntime(model_path1, {"X": x}, ["Y"])[0]
+        self.assertAllClose(np.dot(x, w1).dot(w2), actual, rtol=1e-5, atol=1e-5)
+        actual = self.run_onnxruntime(model_path2, {"X": x}, ["Y"])[0]
+        self.assertAllClose(np.dot(x, w1).dot(w3), actual, rtol=1e-5, atol=1e-5)
+
+    def test_save_model_streaming(self):
+        w1 = np.random.randn(40, 40).astype(np.float32)
+        w2 = np.random.randn(40, 33).astype(np.float32)
+        nodes = [
+            helper.make_node("MatMul", ["X", "W1"], ["Y1"], name="matmul"),
+            helper.make_node("MatMul", ["Y1", "W2"], ["Y2"], name="matmul2"),
+            helper.make_node("Add", ["Y2", "B"], ["Y"], name="add"),
+        ]
+        graph_proto = helper.make_graph(
+            nodes, "test_save_model",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [2, 40])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [2, 33])],
+            initializer=[numpy_helper.from_array(w1, "W1"), numpy_helper.from_array(w2, "W2"),
+                         numpy_helper.from_array(np.array(1.5, dtype=np.float32), "B")])
+        g = GraphUtil.create_graph_from_onnx_graph(graph_proto)
+        expected = g.make_model("test")
+
+        model_path = os.path.join(self.test_data_directory, "model.onnx")
+        g.save_model(model_path, "test")
+        loaded = onnx.load_model(model_path)
+        self.assertEqual(len(loaded.graph.initializer), 3)
+        self.assertEqual(loaded, expected)
+
+        x = np.random.randn(2, 40).astype(np.float32)
+        actual = self.run_onnxruntime(model_path, {"X": x}, ["Y"])[0]
+        self.assertAllClose(np.dot(x, w1).dot(w2) + 1.5, actual, rtol=1e-5, atol=1e-5)
+
+    def test_model_proto_from_file_skip_tensor_data(self):
+        w1 = np.random.randn(40, 40).astype(np.float32)
+        w2 = np.random.randn(40, 33).astype(np.float32)
+        body = helper.make_graph(
+            [helper.make_node("Constant", [], ["C"], value=numpy_helper.from_array(w2, "c"), name="const")],
+            "then_branch", [], [helper.make_tensor_value_info("C", TensorProto.FLOAT, [40, 33])])
+        nodes = [
+            helper.make_node("MatMul", ["X", "W1"], ["Y1"], name="matmul"),
+            helper.make_node("If", ["Cond"], ["W2"], then_branch=body, else_branch=body, name="if"),
+            helper.make_node("MatMul", ["Y1", "W2"], ["Y"], name="matmul2"),
+            helper.make_node("Identity", ["Names"], ["N"], name="identity"),
+        ]
+        graph_proto = helper.make_graph(
+            nodes, "test_skip_tensor_data",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [2, 40]),
+             helper.make_tensor_value_info("Cond", TensorProto.BOOL, [])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [2, 33]),
+             helper.make_tensor_value_info("N", TensorProto.STRING, [2])],
+            initializer=[numpy_helper.from_array(w1, "W1"),
+                         helper.make_tensor("Names", TensorProto.STRING, [2], [b"a", b"b"])])
+        g = GraphUtil.create_graph_from_onnx_graph(graph_proto)
+        model_path = os.path.join(self.test_data_directory, "model.onnx")
+        # the initializers are saved in graph fields of their own
+        g.save_model(model_path, "test")
+
+        expected = onnx.load_model(model_path)
+        def get_tensors(graph_proto):
+            tensors = list(graph_proto.initializer)
+            for node in graph_proto.node:
+                for attr in node.attribute:
+                    if attr.HasField("t"):
+                        tensors.append(attr.t)
+                    if attr.HasField("g"):
+                        tensors.extend(get_tensors(attr.g))
+            return tensors
+
+        tensors = get_tensors(expected.graph)
+        self.assertEqual(len(tensors), 4)
+        for t in tensors:
+            t.ClearField("raw_data")
+            t.ClearField("string_data")
+        actual = utils.model_proto_from_file(model_path, skip_tensor_data=True)
+        self.assertEqual(actual, expected)
+        self.assertEqual(utils.model_proto_from_file(model_path), onnx.load_model(model_path))
+        # tools like dump-onnx.py use it without loading tensorflow
+        script = ("import sys; from tf2onnx import utils; utils.model_proto_from_file({!r}, skip_tensor_data=True); "
+                  "sys.exit('tensorflow' in sys.modules)".format(model_path))
+        subprocess.check_call([sys.executable, '-c', script])
+
 
 if __name__ == '__main__':
     unittest_main()
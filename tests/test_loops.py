@@ -12,7 +12,8 @@ import numpy as np
 import tensorflow as tf
 
 from backend_test_base import Tf2OnnxBackendTestBase
-from common import unittest_main, check_tf_min_version, check_tf_max_version, check_onnxruntime_min_version
+from common import unittest_main, check_tf_min_version, check_tf_max_version, check_onnxruntime_min_version, \
+    check_opset_min_version, check_op_count
 from tf2onnx.tf_loader import is_tf2
 
 
@@ -92,6 +93,27 @@ class LoopTests(Tf2OnnxBackendTestBase):
         output_names_with_port = ["output:0", "i:0"]
         self.run_test_case(func, {_INPUT: x_val}, [], output_names_with_port, rtol=1e-06)
 
+    @check_tf_min_version("2.0")
+    def test_while_loop_with_ta_overwritten_in_every_iteration(self):
+        def func(i, inputs):
+            output_ta = tf.TensorArray(dtype=tf.float32, size=1)
+
+            c = lambda i, *_: tf.less(i, 5)
+
+            def b(i, out_ta):
+                x = tf.gather(inputs, i)
+                out_ta_new = out_ta.write(0, x * 2.)
+                return tf.add(i, 1), out_ta_new
+
+            i_final, out_final = tf.while_loop(c, b, [i, output_ta])
+            return tf.identity(i_final, name="i"), tf.identity(out_final.stack(), name="output_ta")
+
+        input_names_with_port = ["input_1:0", "input_2:0"]
+        feed_dict = {"input_1:0": np.array(0, dtype=np.int32),
+                     "input_2:0": np.array([2.0, 16.0, 5.0, 1.6, 5.0], dtype=np.float32)}
+        output_names_with_port = ["i:0", "output_ta:0"]
+        self.run_test_case(func, feed_dict, input_names_with_port, output_names_with_port, rtol=1e-06)
+
     def test_while_loop_with_ta_read_simple(self):
         def func(i, inputs_2):
             input_ta = tf.TensorArray(dtype=tf.float32, size=0, dynamic_size=True).unstack(inputs_2)
@@ -222,6 +244,45 @@ class LoopTests(Tf2OnnxBackendTestBase):
         output_names_with_port = ["i:0", "output_ta:0", "output_ta2:0"]
         self.run_test_case(func, feed_dict, input_names_with_port, output_names_with_port, rtol=1e-06)
 
+    def _run_while_loop_over_ta_test(self, as_session=False):
+        def func(inputs):
+            input_ta = tf.TensorArray(dtype=tf.float32, size=0, dynamic_size=True).unstack(inputs)
+            output_ta = tf.TensorArray(dtype=tf.float32, size=0, dynamic_size=True)
+
+            c = lambda i, *_: tf.less(i, tf.shape(inputs)[0])
+
+            def b(i, acc, out_ta):
+                x = input_ta.read(i)
+                acc = acc + x
+                out_ta_new = out_ta.write(i, x * 2. + acc)
+                return tf.add(i, 1), acc, out_ta_new
+
+            _, acc_final, out_final = tf.while_loop(c, b, [tf.constant(0), tf.constant(0.), output_ta])
+            return tf.identity(acc_final, name="acc"), tf.identity(out_final.stack(), name="output_ta")
+
+        feed_dict = {"input_1:0": np.array([2.0, 16.0, 5.0, 1.6, 5.0, 6.0, 7.0, 8.0, 9.0, 10.], dtype=np.float32)}
+        output_names_with_port = ["acc:0", "output_ta:0"]
+        self.run_test_case(func, feed_dict, [], output_names_with_port, rtol=1e-06, as_session=as_session,
+                           graph_validator=lambda g: (check_op_count(g, "Scan", 1, disabled=False) and
+                                                      check_op_count(g, "Loop", 0, disabled=False)))
+
+    @check_tf_max_version("1.15", "tf2 while loops are not converted by the loop rewriter")
+    @check_opset_min_version(9, "Scan")
+    def test_while_loop_over_ta_converted_to_scan(self):
+        self._run_while_loop_over_ta_test()
+
+    @check_tf_min_version("2.0")
+    @check_opset_min_version(9, "Scan")
+    def test_while_loop_v1_over_ta_converted_to_scan(self):
+        # tf2 makes v1 while loops in graph mode with control flow v2 disabled
+        control_flow_v2 = tf.compat.v1.control_flow_v2_enabled()
+        tf.compat.v1.disable_control_flow_v2()
+        try:
+            self._run_while_loop_over_ta_test(as_session=True)
+        finally:
+            if control_flow_v2:
+                tf.compat.v1.enable_control_flow_v2()
+
     @check_onnxruntime_min_version(
         "0.5.0",
         "disable this case due to onnxruntime loop issue: https://github.com/microsoft/onnxruntime/issues/1272"
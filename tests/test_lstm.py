@@ -14,7 +14,8 @@ import tensorflow as tf
 from tensorflow.python.ops import init_ops
 from tensorflow.python.ops import variable_scope
 from backend_test_base import Tf2OnnxBackendTestBase
-from common import unittest_main, check_opset_after_tf_version, skip_tf2, skip_tf_versions
+from common import unittest_main, check_opset_after_tf_version, skip_tf2, skip_tf_versions, check_lstm_count, \
+    check_op_count, check_tf_min_version
 
 from tf2onnx.tf_loader import is_tf2
 
@@ -708,5 +709,54 @@ class LSTMTests(Tf2OnnxBackendTestBase):
         self.run_test_case(func, feed_dict, input_names_with_port, output_names_with_port, rtol=1e-3, atol=1e-06)
 
 
+    @check_tf_min_version("2.0")
+    def test_keras_lstm(self):
+        x_val = np.random.uniform(size=[3, 4, 2]).astype(np.float32)
+        layer = tf.keras.layers.LSTM(5, return_sequences=True, return_state=True, bias_initializer="random_uniform")
+
+        def func(x):
+            outputs, h, c = layer(x)
+            return tf.identity(outputs, name="output"), tf.identity(h, name="h"), tf.identity(c, name="c")
+
+        feed_dict = {"input_1:0": x_val}
+        output_names_with_port = ["output:0", "h:0", "c:0"]
+        self.run_test_case(func, feed_dict, [], output_names_with_port, rtol=1e-05, atol=1e-06,
+                           graph_validator=lambda g: check_lstm_count(g, 1) and
+                           check_op_count(g, "Loop", 0, disabled=False))
+
+    @check_tf_min_version("2.0")
+    def test_keras_lstm_initial_state_no_bias(self):
+        x_val = np.random.uniform(size=[3, 4, 2]).astype(np.float32)
+        h_val = np.random.uniform(size=[3, 5]).astype(np.float32)
+        c_val = np.random.uniform(size=[3, 5]).astype(np.float32)
+        layer = tf.keras.layers.LSTM(5, use_bias=False, activation="relu")
+
+        def func(x, h0, c0):
+            outputs = layer(x, initial_state=[h0, c0])
+            return tf.identity(outputs, name="output")
+
+        feed_dict = {"input_1:0": x_val, "input_2:0": h_val, "input_3:0": c_val}
+        self.run_test_case(func, feed_dict, [], ["output:0"], rtol=1e-05, atol=1e-06,
+                           graph_validator=lambda g: check_lstm_count(g, 1) and
+                           check_op_count(g, "Loop", 0, disabled=False))
+
+    @check_opset_after_tf_version("1.15", 10, "might need ReverseV2")
+    @check_tf_min_version("2.0")
+    def test_keras_bilstm(self):
+        x_val = np.random.uniform(size=[3, 4, 2]).astype(np.float32)
+        layer = tf.keras.layers.Bidirectional(tf.keras.layers.LSTM(5, return_sequences=True, return_state=True))
+
+        def func(x):
+            outputs, fw_h, fw_c, bw_h, bw_c = layer(x)
+            return tf.identity(outputs, name="output"), tf.identity(fw_h, name="fw_h"), \
+                   tf.identity(bw_c, name="bw_c")
+
+        feed_dict = {"input_1:0": x_val}
+        output_names_with_port = ["output:0", "fw_h:0", "bw_c:0"]
+        self.run_test_case(func, feed_dict, [], output_names_with_port, rtol=1e-05, atol=1e-06,
+                           graph_validator=lambda g: check_lstm_count(g, 1) and
+                           check_op_count(g, "Loop", 0, disabled=False))
+
+
 if __name__ == '__main__':
     unittest_main()
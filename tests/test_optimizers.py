@@ -12,8 +12,10 @@ import numpy as np
 from onnx import helper, TensorProto, OperatorSetIdProto
 from backend_test_base import Tf2OnnxBackendTestBase
 from common import unittest_main, group_nodes_by_type, check_opset_min_version, check_opset_max_version, get_test_config
-from tf2onnx import utils, constants
+from tf2onnx import utils, constants, optimizer
 from tf2onnx.graph import GraphUtil
+from tf2onnx.optimizer.optimizer_base import GraphOptimizerBase
+from tf2onnx.optimizer.transpose_optimizer import TransposeOptimizer
 
 
 # pylint: disable=missing-docstring,invalid-name,unused-argument,using-constant-test
@@ -22,13 +24,13 @@ class OptimizerTests(Tf2OnnxBackendTestBase):
     """Run original model proto and modified model proto with onnxruntime, compare the results."""
 
     def run_and_compare(self, output_names_with_port, onnx_feed_dict, origin_proto, op_type,
-                        remaining_op_num, debug=False, rtol=1e-07):
+                        remaining_op_num, debug=False, rtol=1e-07, target=None):
         utils.make_sure(op_type is not None, "op_type should be specified")
         utils.make_sure(remaining_op_num is not None, "remaining_op_num should be specified")
 
         origin_model_path = self.save_onnx_model(origin_proto, onnx_feed_dict, postfix="_origin")
 
-        new_proto = GraphUtil.optimize_model_proto(origin_proto)
+        new_proto = GraphUtil.optimize_model_proto(origin_proto, target)
 
         self.assertTrue(new_proto, msg="model proto after optimizer should not be None")
 
@@ -77,6 +79,166 @@ class OptimizerTests(Tf2OnnxBackendTestBase):
             pass
         return model_proto
 
+    def test_optimization_report(self):
+        node1 = helper.make_node("Transpose", ["X"], ["Y"], perm=[1, 0], name="trans_1")
+        node2 = helper.make_node("Transpose", ["Y"], ["Z"], perm=[1, 0], name="trans_2")
+        node3 = helper.make_node("Relu", ["Z"], ["res"], name="relu")
+        graph = helper.make_graph(
+            [node1, node2, node3],
+            "test_optimization_report",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3))],
+            [helper.make_tensor_value_info("res", TensorProto.FLOAT, (2, 3))],
+        )
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+
+        report = optimizer.OptimizationReport()
+        g = GraphUtil.create_graph_from_onnx_model(model_proto)
+        GraphUtil.optimize_graph(g, report=report)
+
+        result = report.to_dict()
+        self.assertGreaterEqual(result["iterations"], 2)
+        self.assertEqual(len(result["passes"]), result["iterations"] * len(optimizer._get_optimizers()))
+        changed_passes = [p for p in result["passes"] if p["node_delta"]]
+        self.assertTrue(all(p["changed"] for p in changed_passes))
+        self.assertEqual(sum(p["node_delta"].get("Transpose", 0) for p in changed_passes), -2)
+        self.assertEqual(sum(p["subgraphs"]["main"].get("Transpose", 0) for p in changed_passes), -2)
+        self.assertTrue(all(p["wall_time"] >= 0 and p["peak_memory_delta"] >= 0 for p in result["passes"]))
+
+    def test_optimize_body_graphs_in_parallel(self):
+        def _make_branch(name, op_type):
+            nodes = [helper.make_node("Transpose", ["X"], [name + "_t1"], perm=[1, 0], name=name + "_trans1"),
+                     helper.make_node("Transpose", [name + "_t1"], [name + "_t2"], perm=[1, 0], name=name + "_trans2"),
+                     helper.make_node(op_type, [name + "_t2"], [name + "_out"], name=name + "_op")]
+            return helper.make_graph(nodes, name, [],
+                                     [helper.make_tensor_value_info(name + "_out", TensorProto.FLOAT, (2, 3))])
+
+        nodes = []
+        outputs = []
+        for i in range(3):
+            nodes.append(helper.make_node("If", ["cond"], ["Y%d" % i], name="if_%d" % i,
+                                          then_branch=_make_branch("then_%d" % i, "Relu"),
+                                          else_branch=_make_branch("else_%d" % i, "Neg")))
+            outputs.append(helper.make_tensor_value_info("Y%d" % i, TensorProto.FLOAT, (2, 3)))
+        graph = helper.make_graph(
+            nodes,
+            "test_optimize_body_graphs_in_parallel",
+            [helper.make_tensor_value_info("cond", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3))],
+            outputs,
+        )
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+
+        new_protos = []
+        for _ in range(2):
+            utils.INTERNAL_NAME = 1000
+            g = GraphUtil.create_graph_from_onnx_model(model_proto)
+            g = optimizer.optimize_graph(g, catch_errors=False, num_workers=2)
+            new_protos.append(g.make_model("parallel"))
+        self.assertEqual(new_protos[0].SerializeToString(), new_protos[1].SerializeToString())
+
+        for node in new_protos[0].graph.node:
+            for attr in node.attribute:
+                self.assertEqual(GraphUtil.get_node_count_from_onnx_graph(attr.g)["Transpose"], 0)
+
+        output_names = ["Y0", "Y1", "Y2"]
+        for cond in [True, False]:
+            feed_dict = {"cond": np.array(cond), "X": np.random.randn(2, 3).astype(np.float32)}
+            origin_path = self.save_onnx_model(model_proto, feed_dict, postfix="_origin")
+            new_path = self.save_onnx_model(new_protos[0], feed_dict, postfix="_opt")
+            expected = self.run_onnxruntime(origin_path, feed_dict, output_names)
+            actual = self.run_onnxruntime(new_path, feed_dict, output_names)
+            for expected_val, actual_val in zip(expected, actual):
+                self.assertAllClose(expected_val, actual_val)
+
+    def test_body_graph_payload_size(self):
+        # the payload of a body graph doesn't carry the main graph and its weights
+        def _make_branch(name):
+            nodes = [helper.make_node("Transpose", ["X"], [name + "_t1"], perm=[1, 0], name=name + "_trans1"),
+                     helper.make_node("Transpose", [name + "_t1"], [name + "_out"], perm=[1, 0], name=name + "_trans2")]
+            return helper.make_graph(nodes, name, [],
+                                     [helper.make_tensor_value_info(name + "_out", TensorProto.FLOAT, (2, 3))])
+
+        nodes = [self._make_onnx_const(np.random.randn(1000, 1000).astype(np.float32), "W"),
+                 helper.make_node("MatMul", ["V", "W"], ["Z"], name="matmul")]
+        for i in range(2):
+            nodes.append(helper.make_node("If", ["cond"], ["Y%d" % i], name="if_%d" % i,
+                                          then_branch=_make_branch("then_%d" % i),
+                                          else_branch=_make_branch("else_%d" % i)))
+        graph = helper.make_graph(
+            nodes, "test_body_graph_payload_size",
+            [helper.make_tensor_value_info("cond", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("V", TensorProto.FLOAT, (2, 1000))],
+            [helper.make_tensor_value_info("Y0", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("Y1", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("Z", TensorProto.FLOAT, (2, 1000))],
+        )
+        g = GraphUtil.create_graph_from_onnx_model(self.make_model(graph, producer_name="onnx-tests"))
+        opt = TransposeOptimizer()
+        # the optimizer keeps the graph it works on
+        g = opt._optimize_at_current_graph_level(g)  # pylint: disable=protected-access
+        body_graphs = [(node, attr, b_g) for node in g.get_nodes()
+                       for attr, b_g in sorted((node.get_body_graphs() or {}).items())]
+        self.assertEqual(len(body_graphs), 4)
+        payloads = opt._make_worker_payloads(  # pylint: disable=protected-access
+            g, body_graphs, opt._optimize_at_current_graph_level)  # pylint: disable=protected-access
+        for (_, _, b_g), payload in zip(body_graphs, payloads):
+            body_size = len(b_g.make_graph("body").SerializeToString())
+            self.assertLess(len(payload), 100 * body_size)
+
+    def test_optimize_nested_body_graphs_in_parallel(self):
+        # the branches read the const X from the main graph, two scopes up
+        def _make_branch(name, op_type):
+            nodes = [helper.make_node("Transpose", ["X"], [name + "_t1"], perm=[1, 0], name=name + "_trans1"),
+                     helper.make_node(op_type, [name + "_t1"], [name + "_t2"], name=name + "_op"),
+                     helper.make_node("Transpose", [name + "_t2"], [name + "_out"], perm=[1, 0], name=name + "_trans2")]
+            return helper.make_graph(nodes, name, [],
+                                     [helper.make_tensor_value_info(name + "_out", TensorProto.FLOAT, (2, 3))])
+
+        body_nodes = [helper.make_node("Identity", ["cond_in"], ["cond_out"], name="cond_identity"),
+                      helper.make_node("Identity", ["v_in"], ["v_out"], name="v_identity")]
+        for i in range(2):
+            body_nodes.append(helper.make_node("If", ["cond_in"], ["Y%d" % i], name="if_%d" % i,
+                                               then_branch=_make_branch("then_%d" % i, "Relu"),
+                                               else_branch=_make_branch("else_%d" % i, "Neg")))
+        body_nodes.append(helper.make_node("Add", ["Y0", "Y1"], ["Y"], name="add"))
+        body = helper.make_graph(
+            body_nodes, "body",
+            [helper.make_tensor_value_info("i", TensorProto.INT64, ()),
+             helper.make_tensor_value_info("cond_in", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("v_in", TensorProto.FLOAT, (2, 3))],
+            [helper.make_tensor_value_info("cond_out", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("v_out", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("Y", TensorProto.FLOAT, (2, 3))])
+        graph = helper.make_graph(
+            [self._make_onnx_const(np.random.randn(2, 3).astype(np.float32), "X"),
+             helper.make_node("Loop", ["trip_cnt", "cond", "V"], ["V_final", "Z"], name="loop", body=body)],
+            "test_optimize_nested_body_graphs_in_parallel",
+            [helper.make_tensor_value_info("trip_cnt", TensorProto.INT64, ()),
+             helper.make_tensor_value_info("cond", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("V", TensorProto.FLOAT, (2, 3))],
+            [helper.make_tensor_value_info("V_final", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("Z", TensorProto.FLOAT, (2, 2, 3))],
+        )
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+
+        g = GraphUtil.create_graph_from_onnx_model(model_proto)
+        loop_body = g.get_node_by_name("loop").get_body_graphs()["body"]
+        outer_graph = GraphOptimizerBase._make_outer_scope_graph(  # pylint: disable=protected-access
+            loop_body, loop_body.get_node_by_name("if_0"))
+        self.assertTrue(outer_graph.get_node_by_output("X").is_const())
+
+        g = optimizer.optimize_graph(g, catch_errors=False, num_workers=2)
+        new_proto = g.make_model("parallel")
+        feed_dict = {"trip_cnt": np.array(2, dtype=np.int64), "cond": np.array(True),
+                     "V": np.random.randn(2, 3).astype(np.float32)}
+        origin_path = self.save_onnx_model(model_proto, feed_dict, postfix="_origin")
+        new_path = self.save_onnx_model(new_proto, feed_dict, postfix="_opt")
+        expected = self.run_onnxruntime(origin_path, feed_dict, ["V_final", "Z"])
+        actual = self.run_onnxruntime(new_path, feed_dict, ["V_final", "Z"])
+        for expected_val, actual_val in zip(expected, actual):
+            self.assertAllClose(expected_val, actual_val)
+
     # Tranpose Optimizer Tests Start
 
     def run_transpose_compare(self, output_names_with_port, onnx_feed_dict, origin_proto,
@@ -522,6 +684,52 @@ class OptimizerTests(Tf2OnnxBackendTestBase):
         self.run_transpose_compare(["Y"], {"array": np.random.randn(10, 3, 4, 5).astype(np.float32)},
                                    model_proto, remaining_transpose_num=0)
 
+    def test_loop_invariant_moved_out_of_body(self):
+        # for(...){w = reshape(W, [6]); s = cast(2); v = v + w * s}, w and s don't depend on the iteration
+        shape_const = self._make_onnx_const(np.array([6], dtype=np.int64), "shape_const")
+        scale_const = self._make_onnx_const(np.array(2, dtype=np.int64), "scale_const")
+        body_nodes = [
+            shape_const,
+            scale_const,
+            helper.make_node("Reshape", ["W", "shape_const"], ["W_flat"], name="reshape"),
+            helper.make_node("Cast", ["scale_const"], ["scale"], to=TensorProto.FLOAT, name="cast"),
+            helper.make_node("Mul", ["W_flat", "scale"], ["W_scaled"], name="mul"),
+            helper.make_node("Add", ["loop_var", "W_scaled"], ["loop_var_out"], name="add"),
+            helper.make_node("Identity", ["loop_condition"], ["loop_cond_output"], name="cond_identity"),
+        ]
+        body = helper.make_graph(
+            body_nodes,
+            "loop_subgraph",
+            [helper.make_tensor_value_info("loop_iter_num", TensorProto.INT64, ()),
+             helper.make_tensor_value_info("loop_condition", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("loop_var", TensorProto.FLOAT, (6,))
+             ],
+            [helper.make_tensor_value_info("loop_cond_output", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("loop_var_out", TensorProto.FLOAT, (6,))
+             ],
+        )
+        # trip count is a graph input so that the loop can't be unrolled
+        cond = self._make_onnx_const(np.array(True, dtype=np.bool), "cond")
+        loop_node = helper.make_node("Loop", ["M", "cond", "X"], ["Y"], name="loop", body=body)
+
+        graph = helper.make_graph(
+            [cond, loop_node],
+            "loop_invariant_moved_out_of_body",
+            [helper.make_tensor_value_info("M", TensorProto.INT64, ()),
+             helper.make_tensor_value_info("X", TensorProto.FLOAT, (6,)),
+             helper.make_tensor_value_info("W", TensorProto.FLOAT, (2, 3))],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, (6,))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        feed_dict = {"M": np.array(3, dtype=np.int64),
+                     "X": np.random.randn(6).astype(np.float32),
+                     "W": np.random.randn(2, 3).astype(np.float32)}
+        new_proto = self.run_and_compare(["Y"], feed_dict, model_proto, "Reshape", 1)
+        loop_node = [n for n in new_proto.graph.node if n.op_type == "Loop"][0]
+        body_ops = [n.op_type for n in loop_node.attribute[0].g.node]
+        self.assertEqual(sorted(body_ops), ["Add", "Identity"])
+
     def test_trans_with_sub(self):
         io_shape = [2, 3, 4, 5]
         const_shapes = [[2, 4, 5, 3], [4, 5, 3], [5, 3], [3]]
@@ -1241,6 +1449,402 @@ class OptimizerTests(Tf2OnnxBackendTestBase):
 
     # Const Fold Optimizer Tests End
 
+    # Reshape Optimizer Tests Start
+
+    def test_reshape_chain_collapsed(self):
+        shape1 = self._make_onnx_const(np.array([6, 4], dtype=np.int64), "shape1")
+        shape2 = self._make_onnx_const(np.array([4, 1, 6], dtype=np.int64), "shape2")
+        node1 = helper.make_node("Reshape", ["X", "shape1"], ["Y1"], name="reshape1")
+        node2 = helper.make_node("Flatten", ["Y1"], ["Y2"], axis=0, name="flatten")
+        node3 = helper.make_node("Identity", ["Y2"], ["Y3"], name="identity")
+        node4 = helper.make_node("Reshape", ["Y3", "shape2"], ["Y4"], name="reshape2")
+        node5 = helper.make_node("Relu", ["Y4"], ["res"], name="relu")
+
+        graph = helper.make_graph(
+            [shape1, shape2, node1, node2, node3, node4, node5],
+            "test_reshape_chain_collapsed",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3, 4))],
+            [helper.make_tensor_value_info("res", TensorProto.FLOAT, (4, 1, 6))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        new_proto = self.run_and_compare(["res"], {"X": np.random.randn(2, 3, 4).astype(np.float32)}, model_proto,
+                                         "Reshape", 1)
+        self.assertEqual(GraphUtil.get_node_count_from_onnx_graph(new_proto.graph)["Flatten"], 0)
+
+    def test_reshape_chain_noop_removed(self):
+        shape1 = self._make_onnx_const(np.array([6, 4], dtype=np.int64), "shape1")
+        shape2 = self._make_onnx_const(np.array([2, 3, 4], dtype=np.int64), "shape2")
+        node1 = helper.make_node("Reshape", ["X", "shape1"], ["Y1"], name="reshape1")
+        node2 = helper.make_node("Reshape", ["Y1", "shape2"], ["Y2"], name="reshape2")
+        node3 = helper.make_node("Relu", ["Y2"], ["res"], name="relu")
+
+        graph = helper.make_graph(
+            [shape1, shape2, node1, node2, node3],
+            "test_reshape_chain_noop_removed",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3, 4))],
+            [helper.make_tensor_value_info("res", TensorProto.FLOAT, (2, 3, 4))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        self.run_and_compare(["res"], {"X": np.random.randn(2, 3, 4).astype(np.float32)}, model_proto,
+                             "Reshape", 0)
+
+    def test_reshape_chain_with_unknown_dim(self):
+        shape1 = self._make_onnx_const(np.array([-1, 12], dtype=np.int64), "shape1")
+        node1 = helper.make_node("Reshape", ["X", "shape1"], ["Y1"], name="reshape1")
+        node2 = helper.make_node("Flatten", ["Y1"], ["Y2"], axis=1, name="flatten")
+        node3 = helper.make_node("Relu", ["Y2"], ["res"], name="relu")
+
+        graph = helper.make_graph(
+            [shape1, node1, node2, node3],
+            "test_reshape_chain_with_unknown_dim",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, ("N", 3, 4))],
+            [helper.make_tensor_value_info("res", TensorProto.FLOAT, ("N", 12))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        self.run_and_compare(["res"], {"X": np.random.randn(5, 3, 4).astype(np.float32)}, model_proto,
+                             "Flatten", 0)
+
+    # Reshape Optimizer Tests End
+
+    # Control Flow Optimizer Tests Start
+
+    def _make_loop_body(self):
+        # v = v + X; scan output is v * 2
+        body = helper.make_graph(
+            [helper.make_node("Add", ["loop_var", "X"], ["loop_var_out"], name="add"),
+             helper.make_node("Add", ["loop_var_out", "loop_var_out"], ["scan_out"], name="double"),
+             helper.make_node("Identity", ["loop_condition"], ["loop_cond_output"], name="cond_identity")],
+            "loop_subgraph",
+            [helper.make_tensor_value_info("loop_iter_num", TensorProto.INT64, ()),
+             helper.make_tensor_value_info("loop_condition", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("loop_var", TensorProto.FLOAT, (2, 3))
+             ],
+            [helper.make_tensor_value_info("loop_cond_output", TensorProto.BOOL, ()),
+             helper.make_tensor_value_info("loop_var_out", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("scan_out", TensorProto.FLOAT, (2, 3))
+             ],
+        )
+        return body
+
+    def test_if_with_const_cond_replaced_by_branch(self):
+        then_branch = helper.make_graph(
+            [helper.make_node("Add", ["X", "X"], ["then_out"], name="then_add")],
+            "then_branch", [], [helper.make_tensor_value_info("then_out", TensorProto.FLOAT, (2, 3))])
+        else_branch = helper.make_graph(
+            [helper.make_node("Sub", ["X", "X"], ["else_out"], name="else_sub")],
+            "else_branch", [], [helper.make_tensor_value_info("else_out", TensorProto.FLOAT, (2, 3))])
+        cond = self._make_onnx_const(np.array(True, dtype=np.bool), "cond")
+        if_node = helper.make_node("If", ["cond"], ["Y"], name="if",
+                                   then_branch=then_branch, else_branch=else_branch)
+        graph = helper.make_graph(
+            [cond, if_node],
+            "test_if_with_const_cond",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3))],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, (2, 3))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        new_proto = self.run_and_compare(["Y"], {"X": np.random.randn(2, 3).astype(np.float32)}, model_proto,
+                                         "If", 0)
+        ops = GraphUtil.get_node_count_from_onnx_graph(new_proto.graph)
+        self.assertEqual(ops["Add"], 1)
+        self.assertEqual(ops["Sub"], 0)
+
+    def test_loop_with_const_trip_count_unrolled(self):
+        trip_cnt = self._make_onnx_const(np.array(3, dtype=np.int64), "trip_cnt")
+        cond = self._make_onnx_const(np.array(True, dtype=np.bool), "cond")
+        loop_node = helper.make_node("Loop", ["trip_cnt", "cond", "X"], ["Y", "Z"], name="loop",
+                                     body=self._make_loop_body())
+        graph = helper.make_graph(
+            [trip_cnt, cond, loop_node],
+            "test_loop_with_const_trip_count_unrolled",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3))],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("Z", TensorProto.FLOAT, (3, 2, 3))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        self.run_and_compare(["Y", "Z"], {"X": np.random.randn(2, 3).astype(np.float32)}, model_proto,
+                             "Loop", 0)
+
+    def test_loop_exceeding_unroll_budget_kept(self):
+        trip_cnt = self._make_onnx_const(np.array(1000, dtype=np.int64), "trip_cnt")
+        cond = self._make_onnx_const(np.array(True, dtype=np.bool), "cond")
+        loop_node = helper.make_node("Loop", ["trip_cnt", "cond", "X"], ["Y", "Z"], name="loop",
+                                     body=self._make_loop_body())
+        graph = helper.make_graph(
+            [trip_cnt, cond, loop_node],
+            "test_loop_exceeding_unroll_budget_kept",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3))],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("Z", TensorProto.FLOAT, (1000, 2, 3))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        self.run_and_compare(["Y", "Z"], {"X": np.random.randn(2, 3).astype(np.float32)}, model_proto,
+                             "Loop", 1)
+
+    def test_loop_unroll_budget_option(self):
+        trip_cnt = self._make_onnx_const(np.array(3, dtype=np.int64), "trip_cnt")
+        cond = self._make_onnx_const(np.array(True, dtype=np.bool), "cond")
+        loop_node = helper.make_node("Loop", ["trip_cnt", "cond", "X"], ["Y", "Z"], name="loop",
+                                     body=self._make_loop_body())
+        graph = helper.make_graph(
+            [trip_cnt, cond, loop_node],
+            "test_loop_unroll_budget_option",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3))],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, (2, 3)),
+             helper.make_tensor_value_info("Z", TensorProto.FLOAT, (3, 2, 3))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        for max_unroll_nodes, loops in [(0, 1), (optimizer.DEFAULT_MAX_UNROLL_NODES, 0)]:
+            g = GraphUtil.create_graph_from_onnx_model(model_proto)
+            g = optimizer.optimize_graph(g, catch_errors=False, max_unroll_nodes=max_unroll_nodes)
+            self.assertEqual(g.dump_node_statistics()["Loop"], loops)
+
+    # Control Flow Optimizer Tests End
+
+    # Fused Activation Optimizer Tests Start
+
+    def _make_ms_model(self, graph):
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        model_proto.opset_import.append(helper.make_opsetid(constants.MICROSOFT_DOMAIN, 1))
+        return model_proto
+
+    def test_fuse_conv_relu(self):
+        w = np.random.randn(4, 3, 3, 3).astype(np.float32)
+        node1 = helper.make_node("Conv", ["X", "W"], ["Y"], name="conv", pads=[1, 1, 1, 1])
+        node2 = helper.make_node("Relu", ["Y"], ["Z"], name="relu")
+
+        graph = helper.make_graph(
+            [node1, node2],
+            "conv-relu-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (1, 3, 8, 8))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (1, 4, 8, 8))],
+            [helper.make_tensor("W", TensorProto.FLOAT, w.shape, w.flatten())],
+        )
+
+        model_proto = self._make_ms_model(graph)
+        new_proto = self.run_and_compare(["Z"], {"X": np.random.randn(1, 3, 8, 8).astype(np.float32)},
+                                         model_proto, "Relu", 0, target=[constants.TARGET_FUSED_ACTIVATION])
+        ops = GraphUtil.get_node_count_from_onnx_graph(new_proto.graph)
+        self.assertEqual(ops.get("FusedConv"), 1)
+        self.assertEqual(ops.get("Conv", 0), 0)
+
+    def test_fuse_gemm_leaky_relu(self):
+        w = np.random.randn(5, 4).astype(np.float32)
+        b = np.random.randn(4).astype(np.float32)
+        node1 = helper.make_node("Gemm", ["X", "W", "B"], ["Y"], name="gemm")
+        node2 = helper.make_node("LeakyRelu", ["Y"], ["Z"], name="leaky_relu", alpha=0.2)
+
+        graph = helper.make_graph(
+            [node1, node2],
+            "gemm-leaky-relu-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (3, 5))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (3, 4))],
+            [helper.make_tensor("W", TensorProto.FLOAT, w.shape, w.flatten()),
+             helper.make_tensor("B", TensorProto.FLOAT, b.shape, b.flatten())],
+        )
+
+        model_proto = self._make_ms_model(graph)
+        new_proto = self.run_and_compare(["Z"], {"X": np.random.randn(3, 5).astype(np.float32)},
+                                         model_proto, "LeakyRelu", 0,
+                                         target=[constants.TARGET_FUSED_ACTIVATION])
+        ops = GraphUtil.get_node_count_from_onnx_graph(new_proto.graph)
+        self.assertEqual(ops.get("FusedGemm"), 1)
+
+    @check_opset_min_version(11, "Clip")
+    def test_fuse_conv_clip_without_min(self):
+        w = np.random.randn(4, 3, 3, 3).astype(np.float32)
+        for clip_inputs in [["Y", "", "max"], ["Y", "min"]]:
+            node1 = helper.make_node("Conv", ["X", "W"], ["Y"], name="conv", pads=[1, 1, 1, 1])
+            node2 = helper.make_node("Clip", clip_inputs, ["Z"], name="clip")
+
+            graph = helper.make_graph(
+                [node1, node2],
+                "conv-clip-test",
+                [helper.make_tensor_value_info("X", TensorProto.FLOAT, (1, 3, 8, 8))],
+                [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (1, 4, 8, 8))],
+                [helper.make_tensor("W", TensorProto.FLOAT, w.shape, w.flatten()),
+                 helper.make_tensor("min", TensorProto.FLOAT, [], [-0.5]),
+                 helper.make_tensor("max", TensorProto.FLOAT, [], [0.5])],
+            )
+
+            model_proto = self._make_ms_model(graph)
+            new_proto = self.run_and_compare(["Z"], {"X": np.random.randn(1, 3, 8, 8).astype(np.float32)},
+                                             model_proto, "Clip", 0, rtol=1e-05,
+                                             target=[constants.TARGET_FUSED_ACTIVATION])
+            ops = GraphUtil.get_node_count_from_onnx_graph(new_proto.graph)
+            self.assertEqual(ops.get("FusedConv"), 1)
+
+    def test_fuse_activation_needs_ms_domain(self):
+        w = np.random.randn(4, 3, 3, 3).astype(np.float32)
+        node1 = helper.make_node("Conv", ["X", "W"], ["Y"], name="conv")
+        node2 = helper.make_node("Relu", ["Y"], ["Z"], name="relu")
+
+        graph = helper.make_graph(
+            [node1, node2],
+            "conv-relu-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (1, 3, 8, 8))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (1, 4, 6, 6))],
+            [helper.make_tensor("W", TensorProto.FLOAT, w.shape, w.flatten())],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        self.run_and_compare(["Z"], {"X": np.random.randn(1, 3, 8, 8).astype(np.float32)},
+                             model_proto, "Relu", 1, target=[constants.TARGET_FUSED_ACTIVATION])
+        # the com.microsoft domain alone doesn't fuse, it's also used for other contrib ops
+        self.run_and_compare(["Z"], {"X": np.random.randn(1, 3, 8, 8).astype(np.float32)},
+                             self._make_ms_model(graph), "Relu", 1)
+
+    def test_nhwc_conv(self):
+        w = np.random.randn(4, 3, 3, 3).astype(np.float32)
+        node1 = helper.make_node("Transpose", ["X"], ["X_nchw"], name="trans1", perm=constants.NHWC_TO_NCHW)
+        node2 = helper.make_node("Conv", ["X_nchw", "W"], ["Y"], name="conv", pads=[1, 1, 1, 1])
+        node3 = helper.make_node("Transpose", ["Y"], ["Z"], name="trans2", perm=constants.NCHW_TO_NHWC)
+
+        graph = helper.make_graph(
+            [node1, node2, node3],
+            "nhwc-conv-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (1, 8, 8, 3))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (1, 8, 8, 4))],
+            [helper.make_tensor("W", TensorProto.FLOAT, w.shape, w.flatten())],
+        )
+
+        # onnxruntime has no cpu kernel for NhwcConv so the model is only checked structurally
+        model_proto = self._make_ms_model(graph)
+        g = GraphUtil.create_graph_from_onnx_model(model_proto, target=[constants.TARGET_NHWC_CONV])
+        g = GraphUtil.optimize_graph(g)
+        ops = group_nodes_by_type(g)
+        self.assertEqual(len(ops.get("NhwcConv", [])), 1)
+        self.assertEqual(len(ops.get("Transpose", [])), 0)
+        self.assertEqual(ops["NhwcConv"][0].input[0], "X")
+
+        g = GraphUtil.create_graph_from_onnx_model(model_proto)
+        g = GraphUtil.optimize_graph(g)
+        self.assertEqual(len(group_nodes_by_type(g).get("NhwcConv", [])), 0)
+
+    # Fused Activation Optimizer Tests End
+
+    # Affine Fold Optimizer Tests Start
+
+    def test_fold_batchnorm_into_conv1d(self):
+        w = np.random.randn(4, 3, 3).astype(np.float32)
+        scale, bias, mean = [np.random.randn(4).astype(np.float32) for _ in range(3)]
+        var = np.random.uniform(0.5, 2, [4]).astype(np.float32)
+        node1 = helper.make_node("Conv", ["X", "W"], ["Y"], name="conv")
+        node2 = helper.make_node("BatchNormalization", ["Y", "scale", "bias", "mean", "var"], ["Z"], name="bn",
+                                 epsilon=1e-3)
+
+        graph = helper.make_graph(
+            [node1, node2],
+            "conv1d-bn-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3, 8))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (2, 4, 6))],
+            [helper.make_tensor(name, TensorProto.FLOAT, val.shape, val.flatten())
+             for name, val in [("W", w), ("scale", scale), ("bias", bias), ("mean", mean), ("var", var)]],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        self.run_and_compare(["Z"], {"X": np.random.randn(2, 3, 8).astype(np.float32)}, model_proto,
+                             "BatchNormalization", 0, rtol=1e-5)
+
+    def test_fold_mul_add_into_conv3d(self):
+        w = np.random.randn(4, 2, 1, 2, 2).astype(np.float32)
+        b = np.random.randn(4).astype(np.float32)
+        mul = np.random.randn(4, 1, 1, 1).astype(np.float32)
+        add = np.random.randn(1, 4, 1, 1, 1).astype(np.float32)
+        node1 = helper.make_node("Conv", ["X", "W", "B"], ["Y"], name="conv")
+        node2 = helper.make_node("Mul", ["Y", "mul_val"], ["Y1"], name="mul")
+        node3 = helper.make_node("Add", ["add_val", "Y1"], ["Z"], name="add")
+
+        graph = helper.make_graph(
+            [node1, node2, node3],
+            "conv3d-mul-add-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (1, 2, 3, 4, 4))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (1, 4, 3, 3, 3))],
+            [helper.make_tensor(name, TensorProto.FLOAT, val.shape, val.flatten())
+             for name, val in [("W", w), ("B", b), ("mul_val", mul), ("add_val", add)]],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        new_proto = self.run_and_compare(["Z"], {"X": np.random.randn(1, 2, 3, 4, 4).astype(np.float32)},
+                                         model_proto, "Mul", 0, rtol=1e-5)
+        self.assertEqual(GraphUtil.get_node_count_from_onnx_graph(new_proto.graph).get("Add", 0), 0)
+
+    def test_fold_batchnorm_and_sub_into_gemm(self):
+        w = np.random.randn(4, 5).astype(np.float32)
+        b = np.random.randn(1, 4).astype(np.float32)
+        scale, bias, mean = [np.random.randn(4).astype(np.float32) for _ in range(3)]
+        var = np.random.uniform(0.5, 2, [4]).astype(np.float32)
+        sub = np.random.randn(4).astype(np.float32)
+        node1 = helper.make_node("Gemm", ["X", "W", "B"], ["Y"], name="gemm", transB=1, beta=0.5)
+        node2 = helper.make_node("BatchNormalization", ["Y", "scale", "bias", "mean", "var"], ["Y1"], name="bn")
+        node3 = helper.make_node("Sub", ["sub_val", "Y1"], ["Z"], name="sub")
+
+        graph = helper.make_graph(
+            [node1, node2, node3],
+            "gemm-bn-sub-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (3, 5))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (3, 4))],
+            [helper.make_tensor(name, TensorProto.FLOAT, val.shape, val.flatten())
+             for name, val in [("W", w), ("B", b), ("scale", scale), ("bias", bias), ("mean", mean),
+                               ("var", var), ("sub_val", sub)]],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        new_proto = self.run_and_compare(["Z"], {"X": np.random.randn(3, 5).astype(np.float32)}, model_proto,
+                                         "BatchNormalization", 0, rtol=1e-5)
+        self.assertEqual(GraphUtil.get_node_count_from_onnx_graph(new_proto.graph).get("Sub", 0), 0)
+
+    def test_fold_mul_into_matmul(self):
+        w = np.random.randn(5, 4).astype(np.float32)
+        mul = np.random.randn(4).astype(np.float32)
+        add = np.random.randn(4).astype(np.float32)
+        node1 = helper.make_node("MatMul", ["X", "W"], ["Y"], name="matmul")
+        node2 = helper.make_node("Mul", ["Y", "mul_val"], ["Y1"], name="mul")
+        node3 = helper.make_node("Add", ["Y1", "add_val"], ["Z"], name="add")
+
+        graph = helper.make_graph(
+            [node1, node2, node3],
+            "matmul-mul-add-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3, 5))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (2, 3, 4))],
+            [helper.make_tensor(name, TensorProto.FLOAT, val.shape, val.flatten())
+             for name, val in [("W", w), ("mul_val", mul), ("add_val", add)]],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        new_proto = self.run_and_compare(["Z"], {"X": np.random.randn(2, 3, 5).astype(np.float32)}, model_proto,
+                                         "Mul", 0, rtol=1e-5)
+        # matmul has no bias, the add stays
+        self.assertEqual(GraphUtil.get_node_count_from_onnx_graph(new_proto.graph)["Add"], 1)
+
+    def test_fold_affine_skips_non_channel_broadcast(self):
+        w = np.random.randn(5, 4).astype(np.float32)
+        mul = np.random.randn(3, 1).astype(np.float32)
+        node1 = helper.make_node("MatMul", ["X", "W"], ["Y"], name="matmul")
+        node2 = helper.make_node("Mul", ["Y", "mul_val"], ["Z"], name="mul")
+
+        graph = helper.make_graph(
+            [node1, node2],
+            "matmul-mul-test",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, (2, 3, 5))],
+            [helper.make_tensor_value_info("Z", TensorProto.FLOAT, (2, 3, 4))],
+            [helper.make_tensor(name, TensorProto.FLOAT, val.shape, val.flatten())
+             for name, val in [("W", w), ("mul_val", mul)]],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        self.run_and_compare(["Z"], {"X": np.random.randn(2, 3, 5).astype(np.float32)}, model_proto,
+                             "Mul", 1)
+
+    # Affine Fold Optimizer Tests End
+
     def test_transpose_back_to_back_non_const(self):
 
         node0 = helper.make_node("Transpose", ["u"], ["v"], perm=[0, 2, 3, 1], name="trans_0")
@@ -1289,6 +1893,23 @@ class OptimizerTests(Tf2OnnxBackendTestBase):
         self.run_and_compare(["res", "res2", "res3"], {"u": np.random.randn(1, 2, 3).astype(np.float32)}, model_proto,
                              "Cast", 5)
 
+    def test_cast_back_to_back_float16_round_trip(self):
+        node0 = helper.make_node("Relu", ["u"], ["v"], name="relu")
+        node1 = helper.make_node("Cast", ["v"], ["w"], to=TensorProto.FLOAT16, name="cast_0")
+        node2 = helper.make_node("Cast", ["w"], ["x"], to=TensorProto.FLOAT, name="cast_1")
+        node3 = helper.make_node("Neg", ["x"], ["res"], name="neg")
+
+        graph = helper.make_graph(
+            [node0, node1, node2, node3],
+            "test-cast-back-to-back-float16-round-trip",
+            [helper.make_tensor_value_info("u", TensorProto.FLOAT, (1, 2, 3))],
+            [helper.make_tensor_value_info("res", TensorProto.FLOAT, (1, 2, 3))],
+        )
+
+        model_proto = self.make_model(graph, producer_name="onnx-tests")
+        self.run_and_compare(["res"], {"u": np.random.randn(1, 2, 3).astype(np.float32)}, model_proto,
+                             "Cast", 0, rtol=1e-3)
+
     @check_opset_max_version(8, "until opset 8 scales is in attributes")
     def test_upsample_all_ones_removed(self):
         shape = (1, 1, 32, 32)
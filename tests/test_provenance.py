@@ -0,0 +1,129 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Unit Tests for refreshing the weights of converted models from their provenance."""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import numpy as np
+import tensorflow as tf
+from onnx import numpy_helper
+from backend_test_base import Tf2OnnxBackendTestBase
+from common import unittest_main
+from tf2onnx import optimizer, provenance
+from tf2onnx.tf_loader import tf_placeholder, tf_reset_default_graph
+from tf2onnx.tf_utils import GraphDefConstValues
+from tf2onnx.tfonnx import process_tf_graph
+
+
+# pylint: disable=missing-docstring,invalid-name,unused-argument,using-constant-test
+
+class ProvenanceTests(Tf2OnnxBackendTestBase):
+    """Convert a graph with one set of weights, refresh it with another and compare with converting it again."""
+
+    def _make_graph_def(self, make_graph, seed):
+        np.random.seed(seed)
+        tf_reset_default_graph()
+        with tf.Graph().as_default() as tf_graph:
+            make_graph()
+        return tf_graph.as_graph_def(add_shapes=True)
+
+    def _convert(self, graph_def, input_names, output_names):
+        g = process_tf_graph(graph_def, opset=self.config.opset, input_names=input_names,
+                             output_names=output_names, target=self.config.target, record_provenance=True)
+        g = optimizer.optimize_graph(g, catch_errors=False)
+        return g, g.make_model("test")
+
+    def _refresh(self, make_graph, input_names, output_names):
+        old_graph_def = self._make_graph_def(make_graph, 1)
+        g, model_proto = self._convert(old_graph_def, input_names, output_names)
+        model_provenance = provenance.make_provenance(g, GraphDefConstValues(old_graph_def))
+
+        new_graph_def = self._make_graph_def(make_graph, 2)
+        provenance.refresh_initializers(model_proto, model_provenance, GraphDefConstValues(new_graph_def))
+        return model_provenance, model_proto, self._convert(new_graph_def, input_names, output_names)[1]
+
+    def assert_same_initializers(self, model_proto, expected_proto):
+        # names made during the conversion differ between conversions, the order of the initializers doesn't
+        actual = [numpy_helper.to_array(t) for t in model_proto.graph.initializer]
+        expected = [numpy_helper.to_array(t) for t in expected_proto.graph.initializer]
+        self.assertEqual(len(actual), len(expected))
+        for expected_val, actual_val in zip(expected, actual):
+            self.assertEqual(expected_val.dtype, actual_val.dtype)
+            self.assertAllEqual(expected_val, actual_val)
+
+    def test_refresh_conv_batchnorm(self):
+        def make_graph():
+            x = tf_placeholder(tf.float32, [None, 6, 6, 3], name="input")
+            w = tf.constant(np.random.uniform(-1, 1, [3, 3, 3, 4]).astype(np.float32))
+            conv = tf.nn.conv2d(x, w, strides=[1, 1, 1, 1], padding="SAME")
+            params = [tf.constant(np.random.uniform(0.5, 1.5, [4]).astype(np.float32)) for _ in range(4)]
+            bn, _, _ = tf.compat.v1.nn.fused_batch_norm(conv, params[0], params[1], params[2], params[3],
+                                                        is_training=False)
+            tf.identity(tf.nn.relu(bn), name="output")
+
+        model_provenance, model_proto, expected_proto = self._refresh(make_graph, ["input:0"], ["output:0"])
+        # the kernel is transposed and the batchnorm folded into it
+        weights = [r for r in model_provenance["initializers"].values() if len(provenance.get_sources(r)) > 1]
+        self.assertTrue(weights)
+        self.assert_same_initializers(model_proto, expected_proto)
+
+    def test_refresh_matmul_bias(self):
+        def make_graph():
+            x = tf_placeholder(tf.float32, [None, 5], name="input")
+            w = tf.constant(np.random.uniform(-1, 1, [5, 3]).astype(np.float32))
+            b = tf.constant(np.random.uniform(-1, 1, [3]).astype(np.float32))
+            tf.identity(tf.matmul(x, w) + b, name="output")
+
+        model_provenance, model_proto, expected_proto = self._refresh(make_graph, ["input:0"], ["output:0"])
+        self.assertEqual(model_provenance["tainted"], [])
+        self.assert_same_initializers(model_proto, expected_proto)
+
+    def test_refresh_needs_conversion(self):
+        def make_graph():
+            x = tf_placeholder(tf.float32, [2, 3], name="input")
+            a = tf.constant(np.random.uniform(-1, 1, [2, 3]).astype(np.float32), name="a")
+            tf.identity(x * tf.exp(a), name="output")
+
+        # tensorflow folds exp(a), its recipe is unknown
+        with self.assertRaises(ValueError):
+            self._refresh(make_graph, ["input:0"], ["output:0"])
+
+    def test_evaluate_recipe(self):
+        w = provenance.Tensor(np.arange(6, dtype=np.float32).reshape([2, 3]), provenance.source("w"))
+        fixed = provenance.Tensor(np.array([2], dtype=np.float32))
+        val = ((w.transpose([1, 0]) * fixed.reshape([1, 1]) + 1.5).sqrt()).astype(np.float16)
+        self.assertEqual(provenance.get_sources(val.recipe), {"w"})
+        new_w = np.random.uniform(-1, 1, [2, 3]).astype(np.float32) ** 2
+        expected = np.sqrt(new_w.T * np.array([[2]], dtype=np.float32) + 1.5).astype(np.float16)
+        self.assertAllEqual(provenance.evaluate(val.recipe, {"w": new_w}), expected)
+        # values without sources have no recipe
+        self.assertIsNone((fixed * 2).recipe)
+
+    def test_array_literal_taints(self):
+        w = provenance.Tensor(np.arange(6, dtype=np.float32).reshape([2, 3]), provenance.source("w"))
+        # arrays which don't come from tensorflow aren't copied into the recipes
+        val = (w * np.array([1, 2, 3], dtype=np.float32)).transpose([1, 0]) + 1.5
+        self.assertEqual(val.recipe, {"tainted": ["w"]})
+        self.assertEqual(provenance.get_sources(val.recipe), {"w"})
+        # arrays filled with a single value are written as the value
+        val = w + np.zeros([2, 3], dtype=np.float32)
+        self.assertEqual(val.recipe["inputs"][1], {"value": 0.0, "dtype": "float32", "shape": [2, 3]})
+        self.assertAllEqual(provenance.evaluate(val.recipe, {"w": w.value}), w.value)
+
+    def test_no_recipes_by_default(self):
+        np.random.seed(1)
+        tf_reset_default_graph()
+        with tf.Graph().as_default() as tf_graph:
+            x = tf_placeholder(tf.float32, [None, 5], name="input")
+            w = tf.constant(np.random.uniform(-1, 1, [5, 3]).astype(np.float32))
+            tf.identity(tf.matmul(x, w) * 2., name="output")
+        g = process_tf_graph(tf_graph.as_graph_def(add_shapes=True), opset=self.config.opset,
+                             input_names=["input:0"], output_names=["output:0"])
+        g = optimizer.optimize_graph(g, catch_errors=False)
+        self.assertTrue(all(node.provenance is None for node in g.get_nodes()))
+
+if __name__ == "__main__":
+    unittest_main()
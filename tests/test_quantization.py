@@ -0,0 +1,161 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Unit Tests for QDQ quantization."""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+
+import numpy as np
+from onnx import helper, numpy_helper, TensorProto, OperatorSetIdProto
+from backend_test_base import Tf2OnnxBackendTestBase
+from common import unittest_main, group_nodes_by_type, check_opset_min_version
+from tf2onnx import constants, quantization
+from tf2onnx.graph import GraphUtil
+
+
+# pylint: disable=missing-docstring,invalid-name,unused-argument,using-constant-test
+
+class QuantizationTests(Tf2OnnxBackendTestBase):
+    """Quantize models and compare the results with the float models in onnxruntime."""
+
+    def make_model(self, graph):
+        imp = OperatorSetIdProto()
+        imp.version = self.config.opset
+        model_proto = helper.make_model(graph, producer_name="onnx-tests", opset_imports=[imp])
+        model_proto.ir_version = constants.OPSET_TO_IR_VERSION.get(self.config.opset, model_proto.ir_version)
+        return model_proto
+
+    def run_and_compare(self, model_proto, feed_dict, output_names, feeds=None, per_channel=True, atol=0.05):
+        g = GraphUtil.create_graph_from_onnx_model(model_proto)
+        g = quantization.quantize_graph(g, feeds, per_channel=per_channel)
+        new_proto = g.make_model("quantized")
+
+        origin_path = self.save_onnx_model(model_proto, feed_dict, postfix="_origin")
+        new_path = self.save_onnx_model(new_proto, feed_dict, postfix="_quantized")
+        expected = self.run_onnxruntime(origin_path, feed_dict, output_names)
+        actual = self.run_onnxruntime(new_path, feed_dict, output_names)
+        for expected_val, actual_val in zip(expected, actual):
+            self.assertAllClose(expected_val, actual_val, rtol=0, atol=atol)
+        return g
+
+    def _make_matmul_model(self, w, transpose=False):
+        nodes = [helper.make_node("Relu", ["X"], ["relu"])]
+        if transpose:
+            nodes.append(helper.make_node("Gemm", ["relu", "W"], ["Y"], transB=1))
+        else:
+            nodes.append(helper.make_node("MatMul", ["relu", "W"], ["Y"]))
+        out_dim = w.shape[0] if transpose else w.shape[1]
+        graph = helper.make_graph(
+            nodes, "test_quantization",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [2, 8])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [2, out_dim])],
+            initializer=[numpy_helper.from_array(w, "W")])
+        return self.make_model(graph)
+
+    def test_quantize_weight_per_channel(self):
+        w = np.random.uniform(-1, 1, [3, 8, 4]).astype(np.float32)
+        w[1] *= 100
+        w_quant, scale = quantization.quantize_weight(w, axis=0)
+        self.assertEqual(w_quant.dtype, np.int8)
+        self.assertEqual(scale.shape, (3,))
+        self.assertEqual(np.max(np.abs(w_quant)), 127)
+        # each channel keeps its own precision
+        self.assertAllClose(w, w_quant * scale.reshape([3, 1, 1]), rtol=0, atol=np.max(scale) / 2 + 1e-6)
+        for i in range(3):
+            self.assertTrue(np.max(np.abs(w[i] - w_quant[i] * scale[i])) <= scale[i] / 2 + 1e-6)
+
+    def test_get_activation_params(self):
+        scale, zero_point = quantization.get_activation_params(-1., 3.)
+        self.assertAlmostEqual(float(scale), 4. / 255, places=6)
+        self.assertEqual(zero_point, 64)
+        # zero is always in the range
+        scale, zero_point = quantization.get_activation_params(2., 6.)
+        self.assertEqual(zero_point, 0)
+        self.assertAlmostEqual(float(scale), 6. / 255, places=6)
+
+    @check_opset_min_version(10, "QuantizeLinear")
+    def test_quantize_weights_only(self):
+        w = np.random.uniform(-1, 1, [8, 16]).astype(np.float32)
+        feed_dict = {"X": np.random.uniform(-1, 1, [2, 8]).astype(np.float32)}
+        g = self.run_and_compare(self._make_matmul_model(w), feed_dict, ["Y"])
+
+        ops = group_nodes_by_type(g)
+        self.assertEqual(len(ops["DequantizeLinear"]), 1)
+        self.assertNotIn("QuantizeLinear", ops)
+        dequant = ops["DequantizeLinear"][0]
+        self.assertEqual(g.get_dtype(dequant.input[0]), TensorProto.INT8)
+        if g.opset >= 13:
+            self.assertEqual(dequant.get_attr_value("axis"), 1)
+            self.assertEqual(g.get_shape(dequant.input[1]), [16])
+
+    @check_opset_min_version(13, "DequantizeLinear with axis")
+    def test_quantize_gemm_trans_b_per_channel(self):
+        w = np.random.uniform(-1, 1, [16, 8]).astype(np.float32)
+        feed_dict = {"X": np.random.uniform(-1, 1, [2, 8]).astype(np.float32)}
+        g = self.run_and_compare(self._make_matmul_model(w, transpose=True), feed_dict, ["Y"])
+
+        dequant = group_nodes_by_type(g)["DequantizeLinear"][0]
+        self.assertEqual(dequant.get_attr_value("axis"), 0)
+
+    @check_opset_min_version(10, "QuantizeLinear")
+    def test_quantize_with_calibration(self):
+        w = np.random.uniform(-1, 1, [4, 3, 3, 3]).astype(np.float32)
+        nodes = [
+            helper.make_node("Conv", ["X", "W"], ["conv"], pads=[1, 1, 1, 1]),
+            helper.make_node("Relu", ["conv"], ["relu"]),
+            helper.make_node("Conv", ["relu", "W2"], ["Y"]),
+        ]
+        w2 = np.random.uniform(-1, 1, [8, 4, 1, 1]).astype(np.float32)
+        graph = helper.make_graph(
+            nodes, "test_quantization",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [1, 3, 6, 6])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [1, 8, 6, 6])],
+            initializer=[numpy_helper.from_array(w, "W"), numpy_helper.from_array(w2, "W2")])
+        samples = np.random.uniform(-1, 1, [4, 1, 3, 6, 6]).astype(np.float32)
+        os.makedirs(self.test_data_directory, exist_ok=True)
+        data_path = os.path.join(self.test_data_directory, "calibration.npz")
+        np.savez(data_path, X=samples)
+        feeds = quantization.load_calibration_data([data_path])
+
+        feed_dict = {"X": samples[0]}
+        g = self.run_and_compare(self.make_model(graph), feed_dict, ["Y"], feeds=feeds, atol=0.2)
+
+        ops = group_nodes_by_type(g)
+        # both convs get their input and weight quantized
+        self.assertEqual(len(ops["QuantizeLinear"]), 2)
+        self.assertEqual(len(ops["DequantizeLinear"]), 4)
+        for node in ops["QuantizeLinear"]:
+            self.assertEqual(g.get_dtype(node.output[0]), TensorProto.UINT8)
+        # the input of the second conv is a relu, its zero point is 0
+        quant = [n for n in ops["QuantizeLinear"] if n.input[0] == "relu"][0]
+        self.assertEqual(quant.inputs[2].get_tensor_value(), 0)
+
+    @check_opset_min_version(10, "QuantizeLinear")
+    def test_quantize_keeps_dequantized_inputs(self):
+        w = np.random.uniform(-1, 1, [8, 16]).astype(np.float32)
+        nodes = [
+            helper.make_node("QuantizeLinear", ["X", "s", "zp"], ["q"]),
+            helper.make_node("DequantizeLinear", ["q", "s", "zp"], ["dq"]),
+            helper.make_node("MatMul", ["dq", "W"], ["Y"]),
+        ]
+        graph = helper.make_graph(
+            nodes, "test_quantization",
+            [helper.make_tensor_value_info("X", TensorProto.FLOAT, [2, 8])],
+            [helper.make_tensor_value_info("Y", TensorProto.FLOAT, [2, 16])],
+            initializer=[numpy_helper.from_array(w, "W"),
+                         numpy_helper.from_array(np.array(0.01, dtype=np.float32), "s"),
+                         numpy_helper.from_array(np.array(128, dtype=np.uint8), "zp")])
+        feed_dict = {"X": np.random.uniform(-1, 1, [2, 8]).astype(np.float32)}
+        g = self.run_and_compare(self.make_model(graph), feed_dict, ["Y"], feeds=[feed_dict])
+
+        ops = group_nodes_by_type(g)
+        self.assertEqual(len(ops["QuantizeLinear"]), 1)
+        self.assertEqual(len(ops["DequantizeLinear"]), 2)
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -0,0 +1,158 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Unit Tests for converting frozen GraphDefs with _output_shapes without importing them into tensorflow."""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+
+import numpy as np
+import tensorflow as tf
+from onnx import TensorProto
+from backend_test_base import Tf2OnnxBackendTestBase
+from common import unittest_main, group_nodes_by_type
+from tf2onnx import optimizer, tf_utils, utils
+from tf2onnx.tf_loader import from_graphdef, merge_duplicated_nodes, tf_placeholder, tf_reset_default_graph, \
+    tf_session
+from tf2onnx.tfonnx import process_tf_graph
+
+
+# pylint: disable=missing-docstring,invalid-name,unused-argument,using-constant-test
+
+class GraphDefTests(Tf2OnnxBackendTestBase):
+    """Convert GraphDefs directly and through tf.import_graph_def and compare the results."""
+
+    def _make_graph_def(self, make_graph):
+        tf_reset_default_graph()
+        with tf.Graph().as_default() as tf_graph:
+            make_graph()
+        return tf_graph.as_graph_def(add_shapes=True)
+
+    def _run_tf(self, graph_def, feed_dict, output_names):
+        with tf.Graph().as_default() as tf_graph:
+            tf.import_graph_def(graph_def, name='')
+        with tf_session(graph=tf_graph) as sess:
+            return sess.run(output_names, feed_dict=feed_dict)
+
+    def run_and_compare(self, graph_def, feed_dict, output_names, rtol=1e-5, atol=1e-5):
+        self.assertTrue(tf_utils.graph_def_has_output_shapes(graph_def))
+        expected = self._run_tf(graph_def, feed_dict, output_names)
+        g = process_tf_graph(graph_def, opset=self.config.opset, input_names=list(feed_dict.keys()),
+                             output_names=output_names, target=self.config.target)
+        g = optimizer.optimize_graph(g, catch_errors=False)
+        actual = self.run_backend(g, output_names, feed_dict)
+        for expected_val, actual_val in zip(expected, actual):
+            self.assertEqual(expected_val.dtype, actual_val.dtype)
+            self.assertAllClose(expected_val, actual_val, rtol=rtol, atol=atol)
+        return g
+
+    def test_graph_def_needs_output_shapes(self):
+        def make_graph():
+            x = tf_placeholder(tf.float32, [2, 3], name="input")
+            tf.identity(tf.nn.relu(x), name="output")
+
+        graph_def = self._make_graph_def(make_graph)
+        self.assertTrue(tf_utils.graph_def_has_output_shapes(graph_def))
+        for node in graph_def.node:
+            del node.attr["_output_shapes"]
+        self.assertFalse(tf_utils.graph_def_has_output_shapes(graph_def))
+        with self.assertRaises(ValueError):
+            process_tf_graph(graph_def, opset=self.config.opset)
+
+    def test_graph_def_conv_multiple_outputs(self):
+        w = np.random.uniform(-1, 1, [3, 3, 3, 4]).astype(np.float32)
+
+        def make_graph():
+            x = tf_placeholder(tf.float32, [None, 6, 6, 3], name="input")
+            conv = tf.nn.conv2d(x, w, strides=[1, 1, 1, 1], padding="SAME")
+            left, right = tf.split(conv, 2, axis=3)
+            _, indices = tf.math.top_k(tf.reduce_sum(left, axis=[1, 2]), k=2)
+            with tf.control_dependencies([indices]):
+                tf.identity(tf.concat([right, tf.nn.relu(left)], axis=3), name="output")
+            tf.identity(indices, name="indices")
+
+        graph_def = self._make_graph_def(make_graph)
+        feed_dict = {"input:0": np.random.uniform(-1, 1, [2, 6, 6, 3]).astype(np.float32)}
+        g = self.run_and_compare(graph_def, feed_dict, ["output:0", "indices:0"])
+        self.assertEqual(g.get_shape("output:0"), [-1, 6, 6, 4])
+        self.assertEqual(g.get_dtype("indices:0"), TensorProto.INT32)
+
+    def test_graph_def_folds_constants_with_tf(self):
+        def make_graph():
+            x = tf_placeholder(tf.float32, [2, 3], name="input")
+            a = tf.constant(np.arange(6, dtype=np.float32).reshape([2, 3]))
+            tf.identity(x * tf.exp(a), name="output")
+
+        graph_def = self._make_graph_def(make_graph)
+        feed_dict = {"input:0": np.random.uniform(-1, 1, [2, 3]).astype(np.float32)}
+        g = self.run_and_compare(graph_def, feed_dict, ["output:0"])
+        self.assertNotIn("Exp", group_nodes_by_type(g))
+
+        values, _ = tf_utils.compute_const_folding_for_graph_def(graph_def, None, ["output:0"])
+        self.assertEqual(list(values.keys()), ["Exp:0"])
+        # nothing to fold, tensorflow isn't needed
+        for node in graph_def.node:
+            if node.op == "Exp":
+                node.op = "Identity"
+        self.assertEqual(tf_utils.compute_const_folding_for_graph_def(graph_def, None, ["output:0"]), ({}, {}))
+
+    def test_graph_def_shape_override(self):
+        def make_graph(shape):
+            x = tf_placeholder(tf.float32, shape, name="input")
+            tf.identity(tf.reduce_sum(tf.nn.relu(x), axis=1), name="output")
+
+        # the shapes after the input follow the override
+        graph_def = self._make_graph_def(lambda: make_graph([None, 4]))
+        g = process_tf_graph(graph_def, opset=self.config.opset, input_names=["input:0"],
+                             output_names=["output:0"], shape_override={"input:0": [3, 4]})
+        self.assertEqual(g.get_shape("output:0"), [3])
+        # an override which contradicts the graph is rejected
+        graph_def = self._make_graph_def(lambda: make_graph([1, 4]))
+        with self.assertRaises(ValueError):
+            process_tf_graph(graph_def, opset=self.config.opset, input_names=["input:0"],
+                             output_names=["output:0"], shape_override={"input:0": [3, 4]})
+
+    def test_merge_duplicated_nodes(self):
+        w = np.random.uniform(-1, 1, [3, 2]).astype(np.float32)
+
+        def make_graph():
+            x = tf_placeholder(tf.float32, [None, 3], name="input")
+            left = tf.nn.relu(tf.matmul(tf.identity(x), tf.constant(w)))
+            right = tf.nn.relu(tf.matmul(tf.identity(tf.identity(x)), tf.constant(w)))
+            tf.identity(left, name="left")
+            tf.identity(right, name="right")
+            tf.identity(tf.matmul(x, tf.constant(w + 1)), name="other")
+
+        graph_def = self._make_graph_def(make_graph)
+        merged = merge_duplicated_nodes(graph_def, keep_names=["input", "left", "right", "other"])
+        self.assertEqual(sorted(n.op for n in merged.node),
+                         ["Const", "Const", "Identity", "Identity", "Identity", "MatMul", "MatMul", "Placeholder",
+                          "Relu"])
+        nodes = {n.name: n for n in merged.node}
+        self.assertEqual(nodes["left"].input, nodes["right"].input)
+
+        feed_dict = {"input:0": np.random.uniform(-1, 1, [4, 3]).astype(np.float32)}
+        self.run_and_compare(merged, feed_dict, ["left:0", "right:0", "other:0"])
+
+    def test_from_graphdef_keeps_output_shapes(self):
+        def make_graph():
+            x = tf_placeholder(tf.float32, [None, 3], name="input")
+            w = tf.constant(np.random.uniform(-1, 1, [3, 2]).astype(np.float32))
+            tf.identity(tf.nn.relu(tf.matmul(x, w)), name="output")
+
+        graph_def = self._make_graph_def(make_graph)
+        os.makedirs(self.test_data_directory, exist_ok=True)
+        model_path = os.path.join(self.test_data_directory, "frozen.pb")
+        utils.save_protobuf(model_path, graph_def)
+        frozen_graph, _, _ = from_graphdef(model_path, ["input:0"], ["output:0"])
+        self.assertTrue(tf_utils.graph_def_has_output_shapes(frozen_graph))
+
+        feed_dict = {"input:0": np.random.uniform(-1, 1, [4, 3]).astype(np.float32)}
+        self.run_and_compare(frozen_graph, feed_dict, ["output:0"])
+
+
+if __name__ == "__main__":
+    unittest_main()
@@ -9,8 +9,18 @@ from __future__ import unicode_literals
 __all__ = ["utils", "graph_matcher", "graph", "graph_builder",
            "tfonnx", "shape_inference", "schemas", "tf_utils", "tf_loader"]
 
+import importlib
+
 import onnx
 from .version import version as __version__
 from . import verbose_logging as logging
-from tf2onnx import tfonnx, utils, graph, graph_builder, graph_matcher, shape_inference, schemas  # pylint: disable=wrong-import-order
-#from tf2onnx import tf_utils, tf_loader
+from tf2onnx import utils, graph, graph_builder, graph_matcher, schemas  # pylint: disable=wrong-import-order
+
+# these import tensorflow, they are only loaded when used, so tools working on onnx models start fast
+_TF_MODULES = ["tfonnx", "shape_inference", "tf_utils", "tf_loader"]
+
+
+def __getattr__(name):
+    if name in _TF_MODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -24,11 +24,15 @@ TENSORFLOW_OPSET = helper.make_opsetid("ai.onnx.converters.tensorflow", 1)
 # Target for the generated onnx graph. It possible targets:
 # onnx-1.1 = onnx at v1.1 (winml in rs4 is based on this)
 # caffe2 = include some workarounds for caffe2 and winml
+# nhwc_conv = onnxruntime with NHWC conv kernels, conv is converted to com.microsoft NhwcConv
+# fused_activation = onnxruntime, activations after conv and gemm are fused into com.microsoft FusedConv/FusedGemm
 TARGET_RS4 = "rs4"
 TARGET_RS5 = "rs5"
 TARGET_RS6 = "rs6"
 TARGET_CAFFE2 = "caffe2"
-POSSIBLE_TARGETS = [TARGET_RS4, TARGET_RS5, TARGET_RS6, TARGET_CAFFE2]
+TARGET_NHWC_CONV = "nhwc_conv"
+TARGET_FUSED_ACTIVATION = "fused_activation"
+POSSIBLE_TARGETS = [TARGET_RS4, TARGET_RS5, TARGET_RS6, TARGET_CAFFE2, TARGET_NHWC_CONV, TARGET_FUSED_ACTIVATION]
 DEFAULT_TARGET = []
 
 NCHW_TO_NHWC = [0, 2, 3, 1]
@@ -36,11 +40,14 @@ NHWC_TO_NCHW = [0, 3, 1, 2]
 HWCN_TO_NCHW = [3, 2, 0, 1]
 NCHW_TO_HWCN = [2, 3, 1, 0]
 
+# Offsets of tensors in external data files are multiples of the page size, so they can be memory mapped
+EXTERNAL_DATA_ALIGNMENT = 4096
+
 # Environment variables
 ENV_TF2ONNX_DEBUG_MODE = "TF2ONNX_DEBUG_MODE"
 
 # Mapping opset to IR version.
 # Note: opset 7 and opset 8 came out with IR3 but we need IR4 because of PlaceholderWithDefault
 OPSET_TO_IR_VERSION = {
-    1: 3, 2: 3, 3: 3, 4: 3, 5: 3, 6: 3, 7: 4, 8: 4, 9: 4, 10: 5, 11: 6, 12: 7, 13: 7
+    1: 3, 2: 3, 3: 3, 4: 3, 5: 3, 6: 3, 7: 4, 8: 4, 9: 4, 10: 5, 11: 6, 12: 7, 13: 7, 14: 7, 15: 8, 16: 8, 17: 8
 }
@@ -0,0 +1,154 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.conversion_cache - on-disk cache of converted models, keyed by the content of the tensorflow
+model files and the conversion options, with least recently used eviction
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tf2onnx")
+
+# in MB
+DEFAULT_CACHE_SIZE = 2048
+
+# files of an entry, mapped to the suffix they get after the output path
+_ENTRY_FILES = {"model": "", "model.data": ".data"}
+
+_CHUNK_SIZE = 1 << 20
+
+
+def get_cache_dir():
+    return os.environ.get("TF2ONNX_CACHE_DIR", DEFAULT_CACHE_DIR)
+
+
+def _hash_file(sha, path):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            sha.update(chunk)
+
+
+def _hash_path(sha, path):
+    """Hash the content of a file, or of all files under a directory together with their relative paths."""
+    if not os.path.isdir(path):
+        _hash_file(sha, path)
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            sha.update(os.path.relpath(file_path, path).replace(os.sep, "/").encode("utf-8"))
+            _hash_file(sha, file_path)
+
+
+_source_digest = None
+
+
+def get_source_digest():
+    """Return the sha256 of the python sources of tf2onnx. The version of a development checkout doesn't
+       change with its sources, the models it converts do.
+    """
+    global _source_digest
+    if _source_digest is None:
+        sha = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for root, dirs, files in os.walk(package_dir):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith(".py"):
+                    file_path = os.path.join(root, name)
+                    sha.update(os.path.relpath(file_path, package_dir).replace(os.sep, "/").encode("utf-8"))
+                    _hash_file(sha, file_path)
+        _source_digest = sha.hexdigest()
+    return _source_digest
+
+
+def make_key(model_paths, options):
+    """Return the cache key of converting the files or directories in model_paths with options,
+       a dict of everything else that changes the result, such as the opset and the library versions.
+    """
+    sha = hashlib.sha256()
+    for path in model_paths:
+        _hash_path(sha, path)
+    sha.update(json.dumps(options, sort_keys=True, default=str).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def _get_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+class ConversionCache(object):
+    """A directory of converted models, one sub directory per key.
+       The modification time of an entry is its last use, the oldest entries are evicted first once
+       the total size exceeds max_size bytes.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, output_path):
+        """Copy the entry of key to output_path, return False if there is none."""
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return False
+        for name, suffix in _ENTRY_FILES.items():
+            src = os.path.join(entry_dir, name)
+            if os.path.exists(src):
+                shutil.copyfile(src, output_path + suffix)
+        os.utime(entry_dir, None)
+        return True
+
+    def put(self, key, output_path, external_data=False):
+        """Add the converted model at output_path as key, with the external data file next to it if the
+           conversion wrote one, a file left there by another conversion isn't part of the model.
+        """
+        files = {"model": output_path}
+        if external_data:
+            files["model.data"] = output_path + _ENTRY_FILES["model.data"]
+        size = sum(os.path.getsize(path) for path in files.values())
+        if size > self.max_size:
+            logger.info("Not caching the model, its %d bytes exceed the cache size", size)
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # entries are written aside and moved in place, concurrent conversions never see a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp")
+        try:
+            for name, path in files.items():
+                shutil.copyfile(path, os.path.join(tmp_dir, name))
+            os.rename(tmp_dir, self._entry_dir(key))
+        except OSError:
+            # another conversion stored the same key first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in max_size."""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not name.startswith(".") and os.path.isdir(path):
+                entries.append((os.path.getmtime(path), _get_size(path), path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            logger.debug("Evicting %s from the conversion cache", path)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
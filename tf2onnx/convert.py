@@ -12,18 +12,19 @@ from __future__ import unicode_literals
 # pylint: disable=unused-argument,unused-import,ungrouped-imports,wrong-import-position
 
 import argparse
+import collections
 import os
 import sys
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
-import tensorflow as tf
+import onnx
 
-from tf2onnx.tfonnx import process_tf_graph
-from tf2onnx import constants, logging, utils, optimizer
-from tf2onnx import tf_loader
+# tensorflow is only imported once the conversion cache is missed
+from tf2onnx import constants, conversion_cache, float16, logging, provenance, quantization, utils, optimizer
+from tf2onnx import version
 from tf2onnx.graph import ExternalTensorStorage
-from tf2onnx.tf_utils import compress_graph_def
+from tf2onnx.weight_store import WeightStore
 
 # pylint: disable=unused-argument
 
@@ -50,12 +51,20 @@ def get_args():
     parser.add_argument("--graphdef", help="input from graphdef")
     parser.add_argument("--saved-model", help="input from saved model")
     parser.add_argument("--tag", help="tag to use for saved_model")
-    parser.add_argument("--signature_def", help="signature_def from saved_model to use")
+    parser.add_argument("--signature_def", help="signature_def from saved_model to use, several comma separated "
+                                                "signatures are converted into one model sharing their weights")
     parser.add_argument("--concrete_function", type=int, default=None,
                         help="For TF2.x saved_model, index of func signature in __call__ (--signature_def is ignored)")
     parser.add_argument("--checkpoint", help="input from checkpoint")
     parser.add_argument("--keras", help="input from keras model")
     parser.add_argument("--large_model", help="use the large model format (for models > 2GB)", action="store_true")
+    parser.add_argument("--stream_variables", help="read the variables of a saved_model from its checkpoint "
+                                                   "while converting, instead of loading and freezing the model "
+                                                   "in tensorflow", action="store_true")
+    parser.add_argument("--external_data", help="save large tensors to a single <output>.data file in the onnx "
+                                                "external data format instead of a zip", action="store_true")
+    parser.add_argument("--weight_store", help="save large tensors to the weight store in this directory, tensors "
+                                               "already in it, from models converted before, are not written again")
     parser.add_argument("--output", help="output model file")
     parser.add_argument("--inputs", help="model input_names")
     parser.add_argument("--outputs", help="model output_names")
@@ -69,6 +78,34 @@ def get_args():
     parser.add_argument("--verbose", "-v", help="verbose output, option is additive", action="count")
     parser.add_argument("--debug", help="debug mode", action="store_true")
     parser.add_argument("--output_frozen_graph", help="output frozen tf graph to file")
+    parser.add_argument("--optimizer_report", help="write per optimizer timing and node changes as json to file")
+    parser.add_argument("--optimizer_workers", type=int, default=1,
+                        help="number of processes used to optimize Loop/If body graphs")
+    parser.add_argument("--max_unroll_nodes", type=int, default=optimizer.DEFAULT_MAX_UNROLL_NODES,
+                        help="unroll Loops with constant trip count if they expand to at most this many nodes")
+    parser.add_argument("--float16", help="convert float tensors and weights to float16, inputs and outputs "
+                                          "of the model stay float", action="store_true")
+    parser.add_argument("--float16_op_block_list", default=",".join(float16.DEFAULT_OP_BLOCK_LIST),
+                        help="comma separated ops kept in float by --float16")
+    parser.add_argument("--quantize", help="quantize weights to int8 and, with --calibration_data, activations "
+                                           "to uint8 in the QDQ format", action="store_true")
+    parser.add_argument("--calibration_data", help="comma separated .npz files with model inputs to calibrate "
+                                                   "the ranges of the activations quantized by --quantize")
+    parser.add_argument("--per_tensor", help="quantize weights per tensor instead of per channel",
+                        action="store_true")
+    parser.add_argument("--provenance", help="write <output>.provenance.json, which maps the initializers to the "
+                                             "tensorflow consts they are computed from, for --refresh-weights",
+                        action="store_true")
+    parser.add_argument("--refresh-weights", help="onnx model converted with --provenance from a model of the "
+                                                  "same architecture, save it with its initializers recomputed "
+                                                  "from the consts of the given model instead of converting it")
+    parser.add_argument("--no-cache", help="always convert, don't use the cache of converted models",
+                        action="store_true")
+    parser.add_argument("--cache_dir", default=None,
+                        help="directory of the cache of converted models, by default $TF2ONNX_CACHE_DIR "
+                             "or ~/.cache/tf2onnx")
+    parser.add_argument("--cache_size", type=int, default=conversion_cache.DEFAULT_CACHE_SIZE,
+                        help="size of the cache of converted models in MB, least recently used models are evicted")
     parser.add_argument("--fold_const", help="Deprecated. Constant folding is always enabled.",
                         action="store_true")
     # experimental
@@ -79,6 +116,14 @@ def get_args():
     if args.input:
         # for backward compativility
         args.graphdef = args.input
+    if args.stream_variables and not args.saved_model:
+        parser.error("--stream_variables requires --saved-model")
+    if (args.provenance or args.refresh_weights) and not args.output:
+        parser.error("--provenance and --refresh-weights require --output")
+    if args.provenance and args.large_model and not args.external_data and not args.weight_store:
+        parser.error("--provenance requires --external_data or --weight_store with --large_model")
+    if args.weight_store and (args.external_data or not args.output):
+        parser.error("--weight_store requires --output and can't be used with --external_data")
     if args.graphdef or args.checkpoint:
         if not args.input and not args.outputs:
             parser.error("graphdef and checkpoint models need to provide inputs and outputs")
@@ -91,10 +136,17 @@ def get_args():
         args.outputs = args.outputs.split(",")
     if args.inputs_as_nchw:
         args.inputs_as_nchw = args.inputs_as_nchw.split(",")
+    args.float16_op_block_list = [op for op in args.float16_op_block_list.split(",") if op]
+    if args.calibration_data:
+        args.calibration_data = args.calibration_data.split(",")
+        if not args.quantize:
+            parser.error("--calibration_data requires --quantize")
+    if args.quantize and args.float16:
+        parser.error("--quantize and --float16 can't be used together")
     if args.target:
         args.target = args.target.split(",")
     if args.signature_def:
-        args.signature_def = [args.signature_def]
+        args.signature_def = args.signature_def.split(",")
     if args.extra_opset:
         tokens = args.extra_opset.split(':')
         if len(tokens) != 2:
@@ -109,6 +161,93 @@ def default_custom_op_handler(ctx, node, name, args):
     return node
 
 
+# args which don't change the converted model, or whose files are hashed into the cache key
+_UNCACHED_ARGS = ["input", "graphdef", "checkpoint", "saved_model", "keras", "calibration_data", "output",
+                  "verbose", "debug", "optimizer_workers", "no_cache", "cache_dir", "cache_size"]
+
+
+def get_model_paths(args):
+    """Return the files and directories the model is loaded from."""
+    if args.graphdef:
+        paths = [args.graphdef]
+    elif args.checkpoint:
+        # checkpoint/checkpoint.meta is restored from checkpoint/checkpoint.index and .data-* shards
+        prefix = args.checkpoint[:-5]
+        dir_name = os.path.dirname(prefix) or "."
+        paths = sorted(os.path.join(dir_name, f) for f in os.listdir(dir_name)
+                       if os.path.join(dir_name, f).startswith(prefix + "."))
+    else:
+        paths = [args.saved_model or args.keras]
+    return paths + (args.calibration_data or [])
+
+
+# distributions tensorflow is installed from
+_TF_DISTRIBUTIONS = ["tensorflow", "tensorflow-cpu", "tensorflow-gpu", "tensorflow-macos", "intel-tensorflow",
+                     "tf-nightly"]
+
+
+def get_tf_version():
+    """Return the version of tensorflow from the metadata of its distribution, without importing it."""
+    try:
+        from importlib import metadata  # pylint: disable=import-outside-toplevel
+        for name in _TF_DISTRIBUTIONS:
+            try:
+                return metadata.version(name)
+            except metadata.PackageNotFoundError:
+                pass
+    except ImportError:
+        # python < 3.8
+        pass
+    import tensorflow as tf  # pylint: disable=import-outside-toplevel
+    return tf.__version__
+
+
+def get_cache_key(args):
+    options = {k: v for k, v in vars(args).items() if k not in _UNCACHED_ARGS}
+    options["model_type"] = [k for k in ["graphdef", "checkpoint", "saved_model", "keras"] if getattr(args, k)]
+    if args.external_data:
+        # the model refers to its data file by name
+        options["output_name"] = os.path.basename(args.output)
+    options["versions"] = [version.version, version.git_version, conversion_cache.get_source_digest(),
+                           onnx.__version__, get_tf_version()]
+    return conversion_cache.make_key(get_model_paths(args), options)
+
+
+def refresh_weights(args, graph_def, const_node_values):
+    """Save the model args.refresh_weights to args.output with its initializers recomputed from graph_def."""
+    from tf2onnx.tf_utils import GraphDefConstValues  # pylint: disable=import-outside-toplevel
+    model_proto = onnx.load(args.refresh_weights, load_external_data=False)
+    external = set(tensor.name for tensor in model_proto.graph.initializer
+                   if tensor.data_location == onnx.TensorProto.EXTERNAL)
+    if external:
+        onnx.load_external_data_for_model(model_proto, os.path.dirname(args.refresh_weights))
+    model_provenance = provenance.load_provenance(args.refresh_weights + provenance.PROVENANCE_SUFFIX)
+    model_provenance = provenance.refresh_initializers(model_proto, model_provenance,
+                                                       GraphDefConstValues(graph_def, const_node_values))
+    if args.weight_store:
+        # the unchanged tensors are in the store already
+        tensor_storage = WeightStore(args.weight_store)
+        for tensor in model_proto.graph.initializer:
+            if tensor.name in external:
+                tensor_storage.name_to_tensor_data[tensor.name] = tensor.raw_data
+                utils.set_external_data(tensor, tensor.name, 0, len(tensor.raw_data))
+        tensor_storage.save_model(args.output, model_proto)
+    elif external:
+        # keep the tensors in an external data file as they were
+        tensor_storage = ExternalTensorStorage()
+        for tensor in model_proto.graph.initializer:
+            if tensor.name in external:
+                tensor_storage.name_to_tensor_data[tensor.name] = tensor.raw_data
+                tensor.data_location = onnx.TensorProto.EXTERNAL
+                entry = tensor.external_data.add()
+                entry.key = "location"
+                entry.value = tensor.name
+        utils.save_onnx_external_data(args.output, model_proto, tensor_storage)
+    else:
+        utils.save_protobuf(args.output, model_proto)
+    provenance.save_provenance(args.output + provenance.PROVENANCE_SUFFIX, model_provenance)
+
+
 def main():
     args = get_args()
     logging.basicConfig(level=logging.get_verbosity_level(args.verbose))
@@ -120,11 +259,30 @@ def main():
     extra_opset = args.extra_opset or []
     custom_ops = {}
     initialized_tables = None
+    const_node_values = None
     if args.custom_ops:
         # default custom ops for tensorflow-onnx are in the "tf" namespace
         custom_ops = {op: (default_custom_op_handler, []) for op in args.custom_ops.split(",")}
         extra_opset.append(constants.TENSORFLOW_OPSET)
 
+    # the frozen graph, the optimizer report, the provenance and the weight store are only written by a conversion
+    cache = None
+    if args.output and not args.no_cache and not args.output_frozen_graph and not args.optimizer_report \
+            and not args.provenance and not args.refresh_weights and not args.weight_store:
+        cache = conversion_cache.ConversionCache(args.cache_dir or conversion_cache.get_cache_dir(),
+                                                 args.cache_size * 1024 * 1024)
+        cache_key = get_cache_key(args)
+        if cache.get(cache_key, args.output):
+            logger.info("ONNX model is saved at %s from the conversion cache", args.output)
+            return
+
+    # pylint: disable=import-outside-toplevel
+    import tensorflow as tf
+    from tf2onnx import tf_loader
+    from tf2onnx.tfonnx import process_tf_graph
+    from tf2onnx.tf_utils import compress_graph_def, graph_def_has_output_shapes, GraphDefConstValues
+    logging.set_tf_verbosity(logging.getLogger().getEffectiveLevel())
+
     # get the frozen tensorflow model from graphdef, checkpoint or saved_model.
     if args.graphdef:
         graph_def, inputs, outputs = tf_loader.from_graphdef(args.graphdef, args.inputs, args.outputs)
@@ -132,7 +290,11 @@ def main():
     if args.checkpoint:
         graph_def, inputs, outputs = tf_loader.from_checkpoint(args.checkpoint, args.inputs, args.outputs)
         model_path = args.checkpoint
-    if args.saved_model:
+    if args.saved_model and args.stream_variables:
+        graph_def, inputs, outputs, const_node_values = tf_loader.from_saved_model_checkpoint(
+            args.saved_model, args.inputs, args.outputs, args.tag, args.signature_def)
+        model_path = args.saved_model
+    elif args.saved_model:
         graph_def, inputs, outputs, initialized_tables = tf_loader.from_saved_model(
             args.saved_model, args.inputs, args.outputs, args.tag,
             args.signature_def, args.concrete_function, args.large_model, return_initialized_tables=True)
@@ -146,42 +308,90 @@ def main():
         logger.info("inputs: %s", inputs)
         logger.info("outputs: %s", outputs)
 
-    with tf.Graph().as_default() as tf_graph:
-        const_node_values = None
-        if args.large_model:
-            const_node_values = compress_graph_def(graph_def)
-        if args.output_frozen_graph:
-            utils.save_protobuf(args.output_frozen_graph, graph_def)
-        tf.import_graph_def(graph_def, name='')
-    with tf_loader.tf_session(graph=tf_graph):
-        g = process_tf_graph(tf_graph,
-                             continue_on_error=args.continue_on_error,
-                             target=args.target,
-                             opset=args.opset,
-                             custom_op_handlers=custom_ops,
-                             extra_opset=extra_opset,
-                             shape_override=args.shape_override,
-                             input_names=inputs,
-                             output_names=outputs,
-                             inputs_as_nchw=args.inputs_as_nchw,
-                             const_node_values=const_node_values,
-                             initialized_tables=initialized_tables)
-
-    onnx_graph = optimizer.optimize_graph(g)
-
-    tensor_storage = ExternalTensorStorage() if args.large_model else None
-    model_proto = onnx_graph.make_model("converted from {}".format(model_path), external_tensor_storage=tensor_storage)
+    if args.large_model:
+        compressed_values = compress_graph_def(graph_def)
+        const_node_values = collections.ChainMap(compressed_values, const_node_values) \
+            if const_node_values else compressed_values
+    if args.output_frozen_graph:
+        utils.save_protobuf(args.output_frozen_graph, graph_def)
+    if args.refresh_weights:
+        refresh_weights(args, graph_def, const_node_values)
+        logger.info("ONNX model is saved at %s with the weights of %s", args.output, model_path)
+        return
+    process_args = dict(continue_on_error=args.continue_on_error,
+                        target=args.target,
+                        opset=args.opset,
+                        custom_op_handlers=custom_ops,
+                        extra_opset=extra_opset,
+                        shape_override=args.shape_override,
+                        input_names=inputs,
+                        output_names=outputs,
+                        inputs_as_nchw=args.inputs_as_nchw,
+                        const_node_values=const_node_values,
+                        initialized_tables=initialized_tables,
+                        record_provenance=args.provenance)
+    if graph_def_has_output_shapes(graph_def) and not args.shape_override and not args.inputs_as_nchw:
+        # frozen graphs which carry their shapes are converted without importing them into tensorflow,
+        # unless the shapes of the inputs change
+        logger.info("Converting the GraphDef directly using its _output_shapes")
+        g = process_tf_graph(graph_def, **process_args)
+    else:
+        with tf.Graph().as_default() as tf_graph:
+            tf.import_graph_def(graph_def, name='')
+        with tf_loader.tf_session(graph=tf_graph):
+            g = process_tf_graph(tf_graph, **process_args)
+
+    if args.float16:
+        # casts inserted at the boundaries of float16 ops are cleaned up by the optimizers
+        g = float16.convert_float_to_float16(g, args.float16_op_block_list)
+
+    report = optimizer.OptimizationReport() if args.optimizer_report else None
+    onnx_graph = optimizer.optimize_graph(g, report=report, num_workers=args.optimizer_workers,
+                                          max_unroll_nodes=args.max_unroll_nodes)
+    if report is not None:
+        report.save(args.optimizer_report)
+        logger.info("Optimizer report is saved at %s", args.optimizer_report)
+
+    if args.quantize:
+        # after the optimizers, they could move ops in between the QDQ pairs
+        feeds = quantization.load_calibration_data(args.calibration_data) if args.calibration_data else None
+        onnx_graph = quantization.quantize_graph(onnx_graph, feeds, per_channel=not args.per_tensor)
+
+    doc = "converted from {}".format(model_path)
+    if args.weight_store:
+        tensor_storage = WeightStore(args.weight_store)
+    elif args.large_model or args.external_data:
+        tensor_storage = ExternalTensorStorage()
+    else:
+        tensor_storage = None
+    if tensor_storage is not None or not args.output:
+        model_proto = onnx_graph.make_model(doc, external_tensor_storage=tensor_storage)
 
     # write onnx graph
     logger.info("")
     logger.info("Successfully converted TensorFlow model %s to ONNX", model_path)
     if args.output:
-        if args.large_model:
+        if args.weight_store:
+            added = tensor_storage.save_model(args.output, model_proto)
+            logger.info("ONNX model is saved at %s with tensors in the weight store %s, %d bytes were added to it",
+                        args.output, args.weight_store, added)
+        elif args.external_data:
+            utils.save_onnx_external_data(args.output, model_proto, tensor_storage)
+            logger.info("ONNX model is saved at %s with tensors in %s.data", args.output, args.output)
+        elif args.large_model:
             utils.save_onnx_zip(args.output, model_proto, tensor_storage)
             logger.info("Zipped ONNX model is saved at %s. Unzip before opening in onnxruntime.", args.output)
         else:
-            utils.save_protobuf(args.output, model_proto)
+            # initializers are serialized one at a time, never the whole model
+            onnx_graph.save_model(args.output, doc)
             logger.info("ONNX model is saved at %s", args.output)
+        if args.provenance:
+            model_provenance = provenance.make_provenance(onnx_graph, GraphDefConstValues(graph_def, const_node_values))
+            provenance.save_provenance(args.output + provenance.PROVENANCE_SUFFIX, model_provenance)
+            logger.info("Provenance of %d initializers is saved at %s%s", len(model_provenance["initializers"]),
+                        args.output, provenance.PROVENANCE_SUFFIX)
+        if cache is not None:
+            cache.put(cache_key, args.output, external_data=args.external_data)
     else:
         logger.info("To export ONNX model to file, please run with `--output` option")
 
@@ -0,0 +1,209 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.float16 - convert the float tensors of a graph to float16
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+
+import numpy as np
+from onnx import defs, helper, numpy_helper, TensorProto
+
+from tf2onnx import utils
+
+logger = logging.getLogger(__name__)
+
+# ops kept in float because float16 loses too much precision for them
+DEFAULT_OP_BLOCK_LIST = [
+    "Softmax", "LogSoftmax", "Exp", "Log", "Pow", "Erf",
+    "ReduceSum", "ReduceMean", "ReduceProd", "ReduceSumSquare", "ReduceLogSum", "ReduceLogSumExp",
+    "ReduceL1", "ReduceL2", "CumSum",
+    "LSTM", "GRU", "RNN",
+    "Range", "RandomNormal", "RandomUniform", "RandomNormalLike", "RandomUniformLike", "Multinomial",
+]
+
+_FLOAT16_TYPE_STR = "tensor(float16)"
+
+
+def convert_float_to_float16(g, op_block_list=None):
+    """Convert the float tensors and constants of graph g and of its subgraphs to float16.
+       Inputs and outputs of the graphs and ops in op_block_list stay in float, Casts are inserted
+       where float and float16 tensors meet, redundant ones are removed by the optimizers later.
+    """
+    if op_block_list is None:
+        op_block_list = DEFAULT_OP_BLOCK_LIST
+    op_block_list = set(op_block_list)
+    for node in g.get_nodes():
+        body_graphs = node.get_body_graphs()
+        if body_graphs:
+            for b_g in body_graphs.values():
+                convert_float_to_float16(b_g, op_block_list)
+
+    # the body graphs expect the float tensors of the outer graph they consume
+    outer_scope_inputs = set()
+    for node in g.get_nodes():
+        if node.get_body_graphs():
+            outer_scope_inputs |= set(node.get_implicit_inputs())
+
+    # dtypes the converted nodes expect for their inputs
+    input_dtypes = {}
+    # tensors converted from float to float16
+    converted = set()
+    for node in g.get_nodes():
+        if node.is_const() or node.type in op_block_list or node.get_body_graphs() \
+                or any(out in outer_scope_inputs for out in node.output):
+            continue
+        dtypes = _get_float16_dtypes(g, node)
+        if dtypes is not None:
+            input_dtypes[node.name] = dtypes[0]
+            converted |= _convert_node(g, node, dtypes[1])
+
+    converted |= _convert_consts(g, input_dtypes, outer_scope_inputs)
+    _insert_casts(g, input_dtypes, converted)
+    logger.debug("converted %d tensors of graph %s to float16", len(converted), g.graph_name)
+    return g
+
+
+def _get_schema(g, node):
+    domain = node.domain or ""
+    if not utils.is_onnx_domain(domain):
+        return None
+    try:
+        return defs.get_schema(node.type, g.opset, domain)
+    except defs.SchemaError:
+        return None
+
+
+def _get_type_strs(params, count):
+    """Map inputs or outputs of a node to the type strings of the formal parameters of its schema."""
+    type_strs = []
+    for i in range(count):
+        if i < len(params):
+            type_strs.append(params[i].type_str)
+        elif params and params[-1].option == defs.OpSchema.FormalParameterOption.Variadic:
+            type_strs.append(params[-1].type_str)
+        else:
+            return None
+    return type_strs
+
+
+def _get_float16_dtypes(g, node):
+    """Return the input and output dtypes of node if its float tensors are converted to float16,
+       None if there is no float tensor or the op doesn't support float16.
+    """
+    schema = _get_schema(g, node)
+    if schema is None:
+        return None
+    input_type_strs = _get_type_strs(schema.inputs, len(node.input))
+    output_type_strs = _get_type_strs(schema.outputs, len(node.output))
+    if input_type_strs is None or output_type_strs is None:
+        return None
+
+    input_dtypes = [g.get_dtype(inp) if inp else None for inp in node.input]
+    output_dtypes = node.output_dtypes
+    # type params bound to float by the current tensors of the node
+    float_type_strs = set(type_str for type_str, dtype in zip(input_type_strs + output_type_strs,
+                                                              input_dtypes + output_dtypes)
+                          if dtype == TensorProto.FLOAT)
+    if node.type == "Cast" and node.get_attr_value("to") == TensorProto.FLOAT:
+        float_type_strs.add(output_type_strs[0])
+    if not float_type_strs:
+        return None
+    allowed_types = {c.type_param_str: c.allowed_type_strs for c in schema.type_constraints}
+    if any(_FLOAT16_TYPE_STR not in allowed_types.get(type_str, []) for type_str in float_type_strs):
+        # either the op has no float16 kernel or the type of the tensor is fixed
+        return None
+
+    def convert(type_strs, dtypes):
+        return [TensorProto.FLOAT16 if type_str in float_type_strs and dtype == TensorProto.FLOAT else dtype
+                for type_str, dtype in zip(type_strs, dtypes)]
+
+    return convert(input_type_strs, input_dtypes), convert(output_type_strs, output_dtypes)
+
+
+def _to_float16(val):
+    # clip instead of overflowing to inf
+    fp16_max = np.finfo(np.float16).max
+    return val.clip(-fp16_max, fp16_max).astype(np.float16)
+
+
+def _convert_node(g, node, output_dtypes):
+    converted = set(out for out, dtype in zip(node.output, output_dtypes) if dtype != g.get_dtype(out))
+    for out, dtype in zip(node.output, output_dtypes):
+        g.set_dtype(out, dtype)
+    if node.type == "Cast":
+        node.set_attr("to", output_dtypes[0])
+    elif node.get_attr_value("dtype") == TensorProto.FLOAT:
+        node.set_attr("dtype", TensorProto.FLOAT16)
+    elif node.type == "ConstantOfShape" and node.get_attr("value") is not None:
+        val = numpy_helper.to_array(helper.get_attribute_value(node.get_attr("value")))
+        if val.dtype == np.float32:
+            node.set_attr("value", numpy_helper.from_array(_to_float16(val)))
+    return converted
+
+
+def _convert_consts(g, input_dtypes, outer_scope_inputs):
+    """Convert the float consts consumed in float16, copying the ones consumed in float16 and float."""
+    converted = set()
+    for node in list(g.get_nodes()):
+        if not node.is_const() or node.output_dtypes[0] != TensorProto.FLOAT:
+            continue
+        const_name = node.output[0]
+        consumers = g.find_output_consumers(const_name)
+        fp16_consumers = [c for c in consumers if c.graph is g and c.name in input_dtypes and
+                          input_dtypes[c.name][list(c.input).index(const_name)] == TensorProto.FLOAT16]
+        if not fp16_consumers:
+            continue
+        val = _to_float16(node.get_tensor_value_with_provenance())
+        if len(fp16_consumers) == len(consumers) and const_name not in g.outputs \
+                and const_name not in outer_scope_inputs:
+            node.set_tensor_value(val)
+            g.set_dtype(const_name, TensorProto.FLOAT16)
+            converted.add(const_name)
+            continue
+        fp16_const = g.make_const(utils.make_name(node.name + "_fp16"), val)
+        for consumer in fp16_consumers:
+            for i, inp in enumerate(consumer.input):
+                if inp == const_name and input_dtypes[consumer.name][i] == TensorProto.FLOAT16:
+                    g.replace_input(consumer, inp, fp16_const.output[0], i)
+    return converted
+
+
+def _insert_casts(g, input_dtypes, converted):
+    casts = {}
+
+    def get_cast(name, to):
+        if (name, to) not in casts:
+            cast = g.make_node("Cast", [name], attr={"to": to}, op_name_scope=name,
+                               shapes=[g.get_shape(name)], dtypes=[to])
+            casts[(name, to)] = cast.output[0]
+        return casts[(name, to)]
+
+    for node in list(g.get_nodes()):
+        if node.name in input_dtypes:
+            for i, (inp, dtype) in enumerate(zip(node.input, input_dtypes[node.name])):
+                if dtype == TensorProto.FLOAT16 and g.get_dtype(inp) == TensorProto.FLOAT:
+                    g.replace_input(node, inp, get_cast(inp, TensorProto.FLOAT16), i)
+        else:
+            # nodes kept as they are expect float instead of the converted float16 tensors
+            for i, inp in enumerate(node.input):
+                if inp in converted:
+                    g.replace_input(node, inp, get_cast(inp, TensorProto.FLOAT), i)
+
+    # outputs of the graph stay in float
+    for out in g.outputs:
+        if out in converted:
+            node = g.get_node_by_output(out)
+            shape = g.get_shape(out)
+            fp16_output = utils.make_name(node.name) + "_fp16"
+            g.replace_all_inputs(out, fp16_output)
+            node.output = [fp16_output if o == out else o for o in node.output]
+            g.set_shape(fp16_output, shape)
+            g.set_dtype(fp16_output, TensorProto.FLOAT16)
+            g.make_node("Cast", [fp16_output], attr={"to": TensorProto.FLOAT}, outputs=[out],
+                        shapes=[shape], dtypes=[TensorProto.FLOAT])
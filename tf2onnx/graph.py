@@ -19,6 +19,7 @@ from onnx import helper, numpy_helper, shape_inference, OperatorSetIdProto, Attr
 from tf2onnx import utils, __version__
 from tf2onnx.utils import make_name, port_name, find_opset
 from tf2onnx import optimizer
+from tf2onnx import provenance
 from tf2onnx.schemas import get_schema, infer_onnx_shape_dtype
 from tf2onnx import constants
 
@@ -56,6 +57,8 @@ class Node(object):
         for a in node.attribute:
             self._attr[a.name] = a
         self._skip_conversion = skip_conversion
+        # recipe of the value of a const from the tensorflow consts, see tf2onnx.provenance
+        self.provenance = None
 
     @property
     def input(self):
@@ -319,11 +322,20 @@ class Node(object):
 
         t = self.get_attr("value")
         if t:
+            # the value is used in a way which can't be replayed on new weights
+            provenance.taint(self.graph, self.provenance)
             t = numpy_helper.to_array(helper.get_attribute_value(t))
             if as_list is True:
                 t = t.tolist()  # t might be scalar after tolist()
         return t
 
+    def get_tensor_value_with_provenance(self):
+        """Get the value of a const as provenance.Tensor, computing new consts from it records their recipes."""
+        if not self.is_const():
+            raise ValueError("get tensor value: '{}' must be Const".format(self.name))
+        return provenance.Tensor(numpy_helper.to_array(helper.get_attribute_value(self.get_attr("value"))),
+                                 self.provenance)
+
     def scalar_to_dim1(self):
         """Get value for onnx tensor."""
         if not self.is_const():
@@ -339,13 +351,17 @@ class Node(object):
     def set_tensor_value(self, new_val):
         """Set new value for existing onnx tensor.
         Args:
-            new_val: value of type numpy ndarray
+            new_val: value of type numpy ndarray, or provenance.Tensor to keep track of its recipe
         """
         if not self.is_const():
             raise ValueError("set tensor value: {} must be Const".format(self.name))
         t = self.get_attr("value")
         if not t:
             raise ValueError("set tensor value: {} is None".format(self.name))
+        self.provenance = None
+        if isinstance(new_val, provenance.Tensor):
+            self.provenance = new_val.recipe
+            new_val = new_val.value
         t = helper.get_attribute_value(t)
         onnx_tensor = numpy_helper.from_array(new_val, t.name)
         del t
@@ -466,6 +482,8 @@ class Graph(object):
         self._is_subgraph = is_subgraph
         self.ta_reads = []
         self.func_inputs = []
+        # set by the keras rnn rewriter if the graph is the body of a keras LSTM/GRU loop
+        self.rnn_cell_context = None
 
         self._target = set(target)
         self._dtypes = dtypes
@@ -482,6 +500,8 @@ class Graph(object):
 
         self.parent_graph = None
         self.contained_graphs = {}  # {node_name: {node_attribute_name: Graph}}
+        # tensorflow consts whose values were used in ways which weren't recorded, see tf2onnx.provenance
+        self.tainted_sources = set()
 
         ops = [Node(node, self) for node in nodes]
         self.reset_nodes(ops)
@@ -507,9 +527,10 @@ class Graph(object):
                         body_graph.parent_graph = self
                         branches[attr_name] = body_graph
 
-                _ = self.make_node(n.type, n.input, outputs=new_outputs, attr=n.attr, name=n.name,
-                                   skip_conversion=n._skip_conversion, dtypes=n_dtypes, shapes=n_shapes,
-                                   domain=n.domain, branches=branches)
+                new_node = self.make_node(n.type, n.input, outputs=new_outputs, attr=n.attr, name=n.name,
+                                          skip_conversion=n._skip_conversion, dtypes=n_dtypes, shapes=n_shapes,
+                                          domain=n.domain, branches=branches)
+                new_node.provenance = n.provenance
 
                 self.replace_all_inputs(o, new_output_name, ops=self.get_nodes())
                 self.make_node("Identity", [new_output_name], outputs=[o], op_name_scope=n.name + "_" + "graph_outputs")
@@ -554,10 +575,14 @@ class Graph(object):
         """Make a new constant in the graph.
         Args:
             name: const node name, must be unique.
-            np_val: value of type numpy ndarray.
+            np_val: value of type numpy ndarray, or provenance.Tensor to keep track of its recipe.
             skip_conversion: bool, indicate whether this created node would be mapped during conversion.
             raw: whether to store data at field of raw_data or the specific field according to its dtype
         """
+        recipe = None
+        if isinstance(np_val, provenance.Tensor):
+            recipe = np_val.recipe
+            np_val = np_val.value
         if raw:
             onnx_tensor = numpy_helper.from_array(np_val, name)
         else:
@@ -568,6 +593,7 @@ class Graph(object):
                               skip_conversion=skip_conversion, dtypes=[dtype], infer_shape_dtype=False)
         self.set_shape(name, np_val.shape)
         self.set_dtype(name, utils.map_numpy_to_onnx_dtype(np_val.dtype))
+        node.provenance = recipe
         return node
 
     def copy_const(self, node, name=None):
@@ -575,7 +601,7 @@ class Graph(object):
         # TODO: support attr copy starting at opset 12
         if name is None:
             name = utils.make_name(node.name)
-        return self.make_const(name, node.get_tensor_value(as_list=False))
+        return self.make_const(name, node.get_tensor_value_with_provenance())
 
     def make_node(self, op_type, inputs, attr=None, output_count=1, outputs=None, skip_conversion=True,
                   op_name_scope=None, name=None, shapes=None, dtypes=None, domain=constants.ONNX_DOMAIN,
@@ -863,6 +889,7 @@ class Graph(object):
         self.remove_node(node.name)
         new_node = self.make_node(node.type, node.input, output_count=len(node.output),
                                   attr=node.attr, dtypes=dtypes, shapes=shapes, name=new_name)
+        new_node.provenance = node.provenance
         for i, old_output in enumerate(node.output):
             new_output = port_name(new_name, i)
             for j, k in enumerate(self.outputs):
@@ -1030,24 +1057,9 @@ class Graph(object):
         ret = [x for _, x in sorted(zip(label, ops))]
         self.reset_nodes(ret)
 
-    def make_graph(self, doc, graph_name=None, external_tensor_storage=None):
-        """
-        Create GraphProto for onnx from internal graph.
-        Args:
-            optimize: optimize graph via onnx
-            doc: text for doc string of the graph
-        """
-        graph_name = graph_name or self.graph_name
-        self.delete_unused_nodes(self.outputs)
-        self.topological_sort(self.get_nodes())
-        self.update_proto(external_tensor_storage)
-
-        # TODO: we'd want to do something like this so that transpose optimizer is active
-        # for  all (unit) tests
-        # if optimize:
-        #    from tf2onnx.optimizer.transpose_optimizer import TransposeOptimizer
-        #    optimizer = TransposeOptimizer(self, False)
-        #    optimizer.optimize()
+    def _get_graph_ops(self):
+        """Split the nodes of the graph into ops, placeholders and consts, consts only used as
+           default value of a PlaceholderWithDefault are left out."""
         ops = []
         order_non_sensitive_placeholders = []
         order_sensitive_placeholders = self._order_sensitive_inputs
@@ -1063,22 +1075,27 @@ class Graph(object):
             ops.append(op)
         placeholder_ops = order_sensitive_placeholders + order_non_sensitive_placeholders
 
-        # create initializers for placeholder with default nodes
-        initializers = []
         placeholder_default_const_ops = []
         for op in placeholder_ops:
             if op.type == "PlaceholderWithDefault":
                 utils.make_sure(op.inputs[0] is not None, "Cannot find node with output {}".format(op.input[0]))
                 utils.make_sure(op.inputs[0].is_const(),
                                 "non-const default value for PlaceholderWithDefault is not supported.")
+                placeholder_default_const_ops.append(op.inputs[0])
+        const_ops = [op for op in const_ops if op not in placeholder_default_const_ops]
+        return ops, placeholder_ops, const_ops
+
+    @staticmethod
+    def _make_initializers(placeholder_ops, const_ops, external_tensor_storage=None):
+        """Yield the initializers of the graph one at a time."""
+        # create initializers for placeholder with default nodes
+        for op in placeholder_ops:
+            if op.type == "PlaceholderWithDefault":
                 # copy the tensor value, set its name to current node's output, add as initializer
                 value = op.inputs[0].get_tensor_value(as_list=False)
-                tensor = numpy_helper.from_array(value, op.output[0])
-                initializers.append(tensor)
-                placeholder_default_const_ops.append(op.inputs[0])
+                yield numpy_helper.from_array(value, op.output[0])
 
         # create initializers for constant nodes
-        const_ops = [op for op in const_ops if op not in placeholder_default_const_ops]
         for op in const_ops:
             # not to use numpy_helper.from_array to create a new tensor
             # because sometimes onnx will have a bug that only check the tensor data in specific field
@@ -1086,7 +1103,31 @@ class Graph(object):
             t = op.get_value_attr(external_tensor_storage)
             tensor = helper.get_attribute_value(t)
             tensor.name = op.output[0]
-            initializers.append(tensor)
+            yield tensor
+
+    def make_graph(self, doc, graph_name=None, external_tensor_storage=None, include_initializers=True):
+        """
+        Create GraphProto for onnx from internal graph.
+        Args:
+            optimize: optimize graph via onnx
+            doc: text for doc string of the graph
+            include_initializers: if False, the GraphProto has no initializers, see save_model
+        """
+        graph_name = graph_name or self.graph_name
+        self.delete_unused_nodes(self.outputs)
+        self.topological_sort(self.get_nodes())
+        self.update_proto(external_tensor_storage)
+
+        # TODO: we'd want to do something like this so that transpose optimizer is active
+        # for  all (unit) tests
+        # if optimize:
+        #    from tf2onnx.optimizer.transpose_optimizer import TransposeOptimizer
+        #    optimizer = TransposeOptimizer(self, False)
+        #    optimizer.optimize()
+        ops, placeholder_ops, const_ops = self._get_graph_ops()
+        initializers = []
+        if include_initializers:
+            initializers = list(self._make_initializers(placeholder_ops, const_ops, external_tensor_storage))
 
         # create input_tensor_values
         input_ids = [op.output[0] for op in placeholder_ops]
@@ -1112,14 +1153,16 @@ class Graph(object):
 
         return graph
 
-    def make_model(self, graph_doc, optimize=False, graph_name="tf2onnx", external_tensor_storage=None, **kwargs):
+    def make_model(self, graph_doc, optimize=False, graph_name="tf2onnx", external_tensor_storage=None,
+                   include_initializers=True, **kwargs):
         """
         Create final ModelProto for onnx from internal graph.
         Args:
             optimize: optimize graph via onnx
             doc: text for doc string of the model
+            include_initializers: if False, the graph of the model has no initializers, see save_model
         """
-        graph = self.make_graph(graph_doc, graph_name, external_tensor_storage)
+        graph = self.make_graph(graph_doc, graph_name, external_tensor_storage, include_initializers)
 
         if "producer_name" not in kwargs:
             kwargs = {"producer_name": "tf2onnx",
@@ -1150,6 +1193,16 @@ class Graph(object):
             model_proto = optimizer.optimize(model_proto)
         return model_proto
 
+    def save_model(self, path, graph_doc, graph_name="tf2onnx", **kwargs):
+        """
+        Save the ModelProto for onnx from internal graph to path, like make_model followed by save_protobuf.
+        The model is written without initializers first, then the initializers are serialized one at a time,
+        so neither the whole ModelProto nor its serialization is ever held in memory.
+        """
+        model_proto = self.make_model(graph_doc, graph_name=graph_name, include_initializers=False, **kwargs)
+        _, placeholder_ops, const_ops = self._get_graph_ops()
+        utils.save_onnx_model_streaming(path, model_proto, self._make_initializers(placeholder_ops, const_ops))
+
     def make_onnx_graph_io(self, ids):
         """Create tensor_value_info for passed input/output ids."""
         tensor_value_infos = []
@@ -1551,11 +1604,12 @@ class GraphUtil(object):
     """Utilities for Graph manipulation."""
 
     @staticmethod
-    def optimize_graph(graph):
-        return optimizer.optimize_graph(graph)
+    def optimize_graph(graph, report=None, num_workers=1, max_unroll_nodes=optimizer.DEFAULT_MAX_UNROLL_NODES):
+        return optimizer.optimize_graph(graph, report=report, num_workers=num_workers,
+                                        max_unroll_nodes=max_unroll_nodes)
 
     @staticmethod
-    def optimize_model_proto(onnx_model_proto):
+    def optimize_model_proto(onnx_model_proto, target=None):
         """Optimize the model proto, for example: eliminating all useless Transpose pairs.
 
         Returns:
@@ -1564,7 +1618,7 @@ class GraphUtil(object):
         """
         try:
             kwargs = GraphUtil.get_onnx_model_properties(onnx_model_proto)
-            graph = GraphUtil.create_graph_from_onnx_model(onnx_model_proto)
+            graph = GraphUtil.create_graph_from_onnx_model(onnx_model_proto, target)
             graph = GraphUtil.optimize_graph(graph)
             model_proto = graph.make_model(onnx_model_proto.graph.doc_string,
                                            graph_name=onnx_model_proto.graph.name, **kwargs)
@@ -1600,7 +1654,7 @@ class GraphUtil(object):
         return kwargs
 
     @staticmethod
-    def create_graph_from_onnx_model(onnx_model_proto):
+    def create_graph_from_onnx_model(onnx_model_proto, target=None):
         """Create Graph loading onnx model proto."""
         # apply shape inference on the model
         inferred_model = shape_inference.infer_shapes(onnx_model_proto)
@@ -1616,11 +1670,11 @@ class GraphUtil(object):
                 extra_opset.append(opset)
 
         utils.make_sure(opset_version is not None, "opset version is not specified for onnx domain")
-        main_graph = GraphUtil.create_graph_from_onnx_graph(graph_proto, opset_version, extra_opset)
+        main_graph = GraphUtil.create_graph_from_onnx_graph(graph_proto, opset_version, extra_opset, target)
         return main_graph
 
     @staticmethod
-    def create_graph_from_onnx_graph(graph_proto, opset_version=None, extra_opset=None):
+    def create_graph_from_onnx_graph(graph_proto, opset_version=None, extra_opset=None, target=None):
         """Create Graph loading onnx graph proto."""
         output_shapes = {}
         output_dtypes = {}
@@ -1647,7 +1701,7 @@ class GraphUtil(object):
         for n in graph_proto.output:
             output_names.append(n.name)
 
-        g = Graph(nodes_to_append, output_shapes, output_dtypes, None, opset_version, extra_opset, output_names)
+        g = Graph(nodes_to_append, output_shapes, output_dtypes, target, opset_version, extra_opset, output_names)
         const_nodes = GraphUtil._parse_graph_initializer(g, graph_proto)
         GraphUtil._parse_graph_input(g, graph_proto, [n.name for n in const_nodes])
 
@@ -1655,7 +1709,7 @@ class GraphUtil(object):
             for attr_name, attr_val in n.attr.items():
                 if attr_val.HasField('g'):
                     # it was assumed that the a.g has inferred shapes/dtypes.
-                    sub_g = GraphUtil.create_graph_from_onnx_graph(attr_val.g, opset_version, extra_opset)
+                    sub_g = GraphUtil.create_graph_from_onnx_graph(attr_val.g, opset_version, extra_opset, target)
                     n.set_body_graph_as_attr(attr_name, sub_g)
         return g
 
@@ -17,6 +17,7 @@ import numpy as np
 from onnx import onnx_pb
 from onnx.onnx_pb import TensorProto
 from tf2onnx import utils
+from tf2onnx.graph_builder import GraphBuilder
 from tf2onnx.handler import tf_op
 from tf2onnx.tf_loader import find_function
 
@@ -418,8 +419,16 @@ class While:
             del body.outputs[idx]
 
         scan_output_names = []
+        # tensor lists that keep only the element written in the last iteration
+        last_element_outputs = []
         # remove tensor array that are passed in to the loop
         for idx, n in reversed(to_remove):
+            write_pattern = get_tensor_list_write_pattern(body, idx, n)
+            if write_pattern == "last":
+                last_element_outputs.append(output_names[idx])
+            elif write_pattern is None:
+                logger.warning("TensorList %s of %s might not be written at the iteration index, "
+                               "it is still converted to a scan output of the loop", n.name, node.name)
             ctx.remove_node(n.name)
             # make the node output bad
             ctx.replace_all_inputs(n.output[0], "@@ALLOC")  # ops=ctx.get_nodes()
@@ -453,6 +462,15 @@ class While:
                                   branches=branches)
 
         output_map = dict(zip(output_names, loop_node.output))
+        for name in last_element_outputs:
+            # the scan output has the elements of all iterations, the list has the one of the last iteration
+            output_map[name] = GraphBuilder(ctx).make_slice(
+                {"data": output_map[name], "starts": [-1], "ends": [np.iinfo(np.int64).max], "axes": [0]},
+                dtypes=[ctx.get_dtype(output_map[name])])
+            for stack in ctx.find_output_consumers(name):
+                if stack.type == "TensorListStack":
+                    stack.type = "Identity"
+                    ctx.replace_inputs(stack, [output_map[name]])
 
         # shift output consumers
         for k, v in output_map.items():
@@ -468,6 +486,46 @@ class While:
                 body.set_dtype(n.output[0], ctx.get_dtype(loop_node.input[i]))
 
 
+def get_tensor_list_write_pattern(body, idx, reserve):
+    """Return how the body of a while loop writes the tensor list passed in as loop var idx.
+       "scan" if the list gets one element per iteration at the iteration index, "last" if the list has
+       a single element which is overwritten in every iteration, and None if the pattern is unknown.
+    """
+    def resolve(name):
+        node = body.get_node_by_output(name)
+        while node is not None and node.type == "Identity":
+            name = node.input[0]
+            node = body.get_node_by_output(name)
+        return name, node
+
+    _, set_item = resolve(body.outputs[idx])
+    if set_item is None or set_item.type != "TensorListSetItem":
+        return None
+    if resolve(set_item.input[0])[0] != body.func_inputs[idx]:
+        return None
+    index, index_node = resolve(set_item.input[1])
+    if index_node is not None and index_node.is_const():
+        num_elements = reserve.inputs[1] if len(reserve.input) > 1 else None
+        if index_node.get_tensor_value() == 0 and num_elements is not None and num_elements.is_const() \
+                and num_elements.get_tensor_value() == 1:
+            return "last"
+        return None
+    if index == body.func_inputs[0]:
+        # the loop counter of tensorflow
+        return "scan"
+    if index not in body.func_inputs:
+        return None
+    # a loop var which the body increments by one
+    _, next_index = resolve(body.outputs[body.func_inputs.index(index)])
+    if next_index is None or next_index.type not in ["Add", "AddV2"]:
+        return None
+    inputs = [resolve(inp) for inp in next_index.input]
+    for (a, _), (_, b_node) in [(inputs[0], inputs[1]), (inputs[1], inputs[0])]:
+        if a == index and b_node is not None and b_node.is_const() and b_node.get_tensor_value() == 1:
+            return "scan"
+    return None
+
+
 def wire_while_body(parent_g, g, loop_node_inputs, body_input_to_state_var, cond_input_to_state_var, output_shapes,
                     output_dtypes, scope, parent, cond_graph, tf_while_inputs, scan_output_names):
     """Wire subgraph graph into main."""
@@ -649,6 +707,7 @@ def prefix_graph(g, scope):
         new_node = g.make_node(node.type, node.input, name=node.name, output_count=len(node.output),
                                shapes=output_shapes, dtypes=output_dtypes, attr=attr,
                                op_name_scope=scope, skip_conversion=True, branches=branches)
+        new_node.provenance = node.provenance
         for old_output, new_output in zip(node.output, new_node.output):
             for i, oname in enumerate(g.outputs):
                 if old_output == oname:
@@ -97,8 +97,8 @@ def conv_convert_inputs(ctx, node, with_kernel=False, new_kernel_shape=None,
 
             if input_node.is_const() and len(ctx.find_output_consumers(input_name)) == 1:
                 # Transpose constant to make it channels first.
-                val = input_node.get_tensor_value(as_list=False)
-                val = np.transpose(val, permutation)
+                val = input_node.get_tensor_value_with_provenance()
+                val = val.transpose(permutation)
 
                 input_node.set_tensor_value(val)
             else:
@@ -119,8 +119,8 @@ def conv_convert_inputs(ctx, node, with_kernel=False, new_kernel_shape=None,
         if new_kernel_shape:
             if node.inputs[1].is_const():
                 input_node = node.inputs[1]
-                val = input_node.get_tensor_value(as_list=False)
-                val = np.reshape(val, new_kernel_shape)
+                val = input_node.get_tensor_value_with_provenance()
+                val = val.reshape(new_kernel_shape)
                 input_node.set_tensor_value(val)
             else:
                 kernel_name = node.input[1]
@@ -150,8 +150,8 @@ def conv_convert_inputs(ctx, node, with_kernel=False, new_kernel_shape=None,
         # If kernel is a constant, transpose that one if we are the only consumer.
         need_transpose = True
         if kernel_node.is_const() and len(ctx.find_output_consumers(kernel_name)) == 1:
-            val = kernel_node.get_tensor_value(as_list=False)
-            val = np.transpose(val, permutation)
+            val = kernel_node.get_tensor_value_with_provenance()
+            val = val.transpose(permutation)
 
             kernel_node.set_tensor_value(val)
             need_transpose = False
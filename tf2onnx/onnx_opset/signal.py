@@ -24,26 +24,165 @@ logger = logging.getLogger(__name__)
 # pylint: disable=unused-argument,missing-docstring
 
 def make_dft_constant(length, dtype, fft_length):
+    """Real and imaginary parts of the first fft_length // 2 + 1 rows of the DFT matrix of size fft_length,
+    applied to a signal of the given length, which is cropped or padded with zeros to fft_length."""
     n = np.arange(length)
-    k = n.reshape((length, 1)).astype(np.float64)
-    mat = np.exp(-2j * np.pi * k * n / length)
-    mat = mat[:fft_length // 2 + 1]
+    k = np.arange(fft_length // 2 + 1).reshape((-1, 1)).astype(np.float64)
+    mat = np.exp(-2j * np.pi * k * n / fft_length)
+    mat[:, n >= fft_length] = 0
     both = np.empty((2,) + mat.shape, dtype=dtype)
     both[0, :, :] = np.real(mat)
     both[1, :, :] = np.imag(mat)
     return both
 
 
+def _is_power_of_2(n):
+    return n > 0 and n & (n - 1) == 0
+
+
 @tf_op("RFFT")
 class RFFTOp:
     # support more dtype
 
+    @classmethod
+    def _get_params(cls, ctx, node):
+        """Check the node can be converted, return the shape of its input, the numpy dtype of the result and
+        fft_length."""
+        supported_dtypes = [
+            onnx_pb.TensorProto.FLOAT,
+            onnx_pb.TensorProto.FLOAT16,
+            onnx_pb.TensorProto.DOUBLE,
+            onnx_pb.TensorProto.COMPLEX64,
+            onnx_pb.TensorProto.COMPLEX128,
+        ]
+        consumers = ctx.find_output_consumers(node.output[0])
+        consumer_types = set(op.type for op in consumers)
+        utils.make_sure(
+            consumer_types == {'ComplexAbs'},
+            "Current implementation of RFFT only allows ComplexAbs as consumer not %r",
+            consumer_types)
+
+        onnx_dtype = ctx.get_dtype(node.input[0])
+        utils.make_sure(onnx_dtype in supported_dtypes, "Unsupported input type.")
+        shape = ctx.get_shape(node.input[0])
+        np_dtype = utils.map_onnx_to_numpy_type(onnx_dtype)
+        utils.make_sure(len(node.input) == 2, "Two inputs expected not %r", len(node.input))
+
+        # This input should be a constant.
+        fft_length_name = node.input[1]
+        node_fft_length = ctx.get_node_by_output(fft_length_name, search_in_parent_graphs=True)
+        utils.make_sure(node_fft_length.type == 'Const',
+                        "fft_length should be a constant, the other case is not implemented yet.")
+        value = node_fft_length.get_attr("value")
+        value_array = to_array(value.t)
+        utils.make_sure(value_array.shape == (1,), "Unexpected shape for fft_length (%r)", value_array.shape)
+        fft_length = int(value_array[0])
+
+        # TODO: handle this parameter when onnx.helper.make_node is fixed.
+        # Tcomplex = node.get_attr("Tcomplex")
+
+        if np_dtype == np.float16:
+            np_dtype = np.float16
+        elif np_dtype in (np.float32, np.complex64):
+            np_dtype = np.float32
+        else:
+            np_dtype = np.float64
+        return shape, np_dtype, fft_length
+
+    @classmethod
+    def _replace_output(cls, ctx, node, real, imag, shape, np_dtype, fft_length):
+        """Stack real and imaginary parts on a new first axis, the format ComplexAbs expects."""
+        new_shape = [2] + list(shape[:-1]) + [fft_length // 2 + 1]
+        gb = GraphBuilder(ctx)
+        parts = [gb.make_unsqueeze({'data': part, 'axes': [0]}) for part in [real, imag]]
+        ctx.remove_node(node.name)
+        last_node = ctx.make_node(
+            "Concat", inputs=parts, attr=dict(axis=0),
+            name=utils.make_name('CPLX_' + node.name + 'rfft'),
+            shapes=[new_shape], dtypes=[utils.map_numpy_to_onnx_dtype(np_dtype)])
+        ctx.replace_all_inputs(node.output[0], last_node.output[0])  # ops=ctx.get_nodes()
+
+    @classmethod
+    def _make_fft(cls, ctx, node, shape, np_dtype, fft_length):
+        """
+        Radix-2 Cooley-Tukey FFT along the last axis, fft_length must be a power of 2.
+        The input is put in bit reversed order, then every stage combines the transforms of
+        consecutive blocks of size half into transforms of blocks of size 2 * half:
+
+        ::
+
+            X[k] = E[k] + w^k O[k], X[k + half] = E[k] - w^k O[k], w = exp(-2j * pi / (2 * half))
+
+        with E and O the transforms of the even and odd blocks. Blocks are laid out as
+        [..., blocks, 2, half] by a Reshape, so the twiddle constants only have half elements.
+        """
+        rank = len(shape)
+        axis = rank - 1
+        data = node.input[0]
+        gb = GraphBuilder(ctx)
+        if fft_length < shape[-1]:
+            data = gb.make_slice({'data': data, 'starts': [0], 'ends': [fft_length], 'axes': [axis]})
+
+        bits = fft_length.bit_length() - 1
+        reversed_indices = np.array([int(format(i, '0%db' % bits)[::-1], 2) for i in range(fft_length)],
+                                    dtype=np.int64)
+        indices = ctx.make_const(utils.make_name('fft_bit_reverse'), reversed_indices)
+        real = ctx.make_node("Gather", [data, indices.output[0]], attr=dict(axis=axis)).output[0]
+        imag = None
+
+        def binary(op_type, a, b):
+            return ctx.make_node(op_type, [a, b]).output[0]
+
+        def split(x):
+            return ctx.make_node("Split", [x], attr=dict(axis=axis + 1), output_count=2).output
+
+        def concat(a, b):
+            return ctx.make_node("Concat", [a, b], attr=dict(axis=axis + 1)).output[0]
+
+        half = 1
+        while half < fft_length:
+            size = 2 * half
+            block_shape = ctx.make_const(utils.make_name('fft_block_shape'),
+                                         np.array([0] * axis + [fft_length // size, 2, half], dtype=np.int64))
+            re_even, re_odd = split(ctx.make_node("Reshape", [real, block_shape.output[0]]).output[0])
+            if imag is None and half == 1:
+                # all twiddles of the first stage are 1 and the input is real
+                real = concat(binary("Add", re_even, re_odd), binary("Sub", re_even, re_odd))
+                half = size
+                continue
+            twiddle = np.exp(-2j * np.pi * np.arange(half) / size)
+            w_re = ctx.make_const(utils.make_name('fft_twiddle_re'), np.real(twiddle).astype(np_dtype)).output[0]
+            w_im = ctx.make_const(utils.make_name('fft_twiddle_im'), np.imag(twiddle).astype(np_dtype)).output[0]
+            if imag is None:
+                # the output of the first stage is real
+                t_re = binary("Mul", re_odd, w_re)
+                t_im = binary("Mul", re_odd, w_im)
+                imag = concat(t_im, ctx.make_node("Neg", [t_im]).output[0])
+            else:
+                im_even, im_odd = split(ctx.make_node("Reshape", [imag, block_shape.output[0]]).output[0])
+                t_re = binary("Sub", binary("Mul", re_odd, w_re), binary("Mul", im_odd, w_im))
+                t_im = binary("Add", binary("Mul", im_odd, w_re), binary("Mul", re_odd, w_im))
+                imag = concat(binary("Add", im_even, t_im), binary("Sub", im_even, t_im))
+            real = concat(binary("Add", re_even, t_re), binary("Sub", re_even, t_re))
+            half = size
+
+        out_shape = ctx.make_const(utils.make_name('fft_out_shape'),
+                                   np.array([0] * axis + [fft_length], dtype=np.int64)).output[0]
+        parts = []
+        for part in [real, imag]:
+            part = ctx.make_node("Reshape", [part, out_shape]).output[0]
+            parts.append(gb.make_slice({'data': part, 'starts': [0], 'ends': [fft_length // 2 + 1], 'axes': [axis]}))
+        cls._replace_output(ctx, node, parts[0], parts[1], shape, np_dtype, fft_length)
+
     @classmethod
     def version_1(cls, ctx, node, **kwargs):
         """
         Inspired from `Python implementation of RFFT
         <https://jakevdp.github.io/blog/2013/08/28/understanding-the-fft/>`_.
 
+        If fft_length is a power of 2, the FFT is computed in log2(fft_length) stages, see _make_fft.
+        Otherwise the signal is multiplied by the DFT matrix.
+
         Complex version:
 
         ::
@@ -93,49 +232,11 @@ class RFFTOp:
                 res = np.dot(cst, x)
                 return np.transpose(res, (0, 2, 1))
         """
-        supported_dtypes = [
-            onnx_pb.TensorProto.FLOAT,
-            onnx_pb.TensorProto.FLOAT16,
-            onnx_pb.TensorProto.DOUBLE,
-            onnx_pb.TensorProto.COMPLEX64,
-            onnx_pb.TensorProto.COMPLEX128,
-        ]
-        consumers = ctx.find_output_consumers(node.output[0])
-        consumer_types = set(op.type for op in consumers)
-        utils.make_sure(
-            consumer_types == {'ComplexAbs'},
-            "Current implementation of RFFT only allows ComplexAbs as consumer not %r",
-            consumer_types)
-
-        onnx_dtype = ctx.get_dtype(node.input[0])
-        utils.make_sure(onnx_dtype in supported_dtypes, "Unsupported input type.")
-        shape = ctx.get_shape(node.input[0])
-        np_dtype = utils.map_onnx_to_numpy_type(onnx_dtype)
+        shape, np_dtype, fft_length = cls._get_params(ctx, node)
         shape_n = shape[-1]
-        utils.make_sure(len(node.input) == 2, "Two inputs expected not %r", len(node.input))
-
-        # This input should be a constant.
-        fft_length_name = node.input[1]
-        node_fft_length = ctx.get_node_by_output(fft_length_name, search_in_parent_graphs=True)
-        utils.make_sure(node_fft_length.type == 'Const',
-                        "fft_length should be a constant, the other case is not implemented yet.")
-        value = node_fft_length.get_attr("value")
-        value_array = to_array(value.t)
-        utils.make_sure(value_array.shape == (1,), "Unexpected shape for fft_length (%r)", value_array.shape)
-        fft_length = value_array[0]
-
-        # TODO: handle this parameter when onnx.helper.make_node is fixed.
-        # Tcomplex = node.get_attr("Tcomplex")
-
-        if np_dtype == np.float16:
-            res_onnx_dtype = utils.map_numpy_to_onnx_dtype(np.float16)
-            np_dtype = np.float16
-        elif np_dtype in (np.float32, np.complex64):
-            res_onnx_dtype = utils.map_numpy_to_onnx_dtype(np.float32)
-            np_dtype = np.float32
-        else:
-            res_onnx_dtype = utils.map_numpy_to_onnx_dtype(np.float64)
-            np_dtype = np.float64
+        if _is_power_of_2(fft_length) and fft_length >= 4 and fft_length <= shape_n:
+            cls._make_fft(ctx, node, shape, np_dtype, fft_length)
+            return
 
         real_imag_part = make_dft_constant(shape_n, np_dtype, fft_length)
         onx_real_imag_part = ctx.make_const(
@@ -152,14 +253,47 @@ class RFFTOp:
             "MatMul", inputs=[onx_real_imag_part.name, trx.output[0]],
             name=utils.make_name('CPLX_' + node.name + 'rfft'))
 
-        new_shape = [2] + list(shape)
+        new_shape = [2] + list(shape[:-1]) + [fft_length // 2 + 1]
         shapei = list(np.arange(len(new_shape)))
         perm = shapei[:-2] + [shapei[-1], shapei[-2]]
         last_node = ctx.make_node(
             "Transpose", inputs=[mult.output[0]], attr=dict(perm=perm),
             name=utils.make_name('CPLX_' + node.name + 'rfft'),
-            shapes=[new_shape], dtypes=[res_onnx_dtype])
+            shapes=[new_shape], dtypes=[utils.map_numpy_to_onnx_dtype(np_dtype)])
+
+        ctx.replace_all_inputs(node.output[0], last_node.output[0])  # ops=ctx.get_nodes()
 
+    @classmethod
+    def version_17(cls, ctx, node, **kwargs):
+        shape, np_dtype, fft_length = cls._get_params(ctx, node)
+        if np_dtype == np.float16:
+            # DFT has no float16 kernel in onnxruntime
+            cls.version_1(ctx, node, **kwargs)
+            return
+
+        # DFT expects [batch, signal..., 1] for a real signal
+        rank = len(shape)
+        gb = GraphBuilder(ctx)
+        axes = [0, 2] if rank == 1 else [rank]
+        data = gb.make_unsqueeze({'data': node.input[0], 'axes': axes})
+        inputs = [data]
+        if fft_length != shape[-1]:
+            dft_length = ctx.make_const(utils.make_name('dft_length'), np.array(fft_length, dtype=np.int64))
+            inputs.append(dft_length.output[0])
+        axis = max(rank - 1, 1)
+        dft = ctx.make_node("DFT", inputs, attr=dict(onesided=1, axis=axis),
+                            name=utils.make_name(node.name + 'dft'))
+
+        # [batch..., fft_length // 2 + 1, 2] -> [2, batch..., fft_length // 2 + 1]
+        dft_rank = max(rank, 2) + 1
+        transposed = ctx.make_node("Transpose", [dft.output[0]],
+                                   attr=dict(perm=[dft_rank - 1] + list(range(dft_rank - 1)))).output[0]
+        if rank == 1:
+            transposed = gb.make_squeeze({'data': transposed, 'axes': [1]})
+        new_shape = [2] + list(shape[:-1]) + [fft_length // 2 + 1]
+        ctx.remove_node(node.name)
+        last_node = ctx.make_node("Identity", [transposed], name=utils.make_name('CPLX_' + node.name + 'rfft'),
+                                  shapes=[new_shape], dtypes=[utils.map_numpy_to_onnx_dtype(np_dtype)])
         ctx.replace_all_inputs(node.output[0], last_node.output[0])  # ops=ctx.get_nodes()
 
 
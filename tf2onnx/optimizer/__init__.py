@@ -14,21 +14,36 @@ from .identity_optimizer import IdentityOptimizer
 from .merge_duplicated_nodes_optimizer import MergeDuplicatedNodesOptimizer
 from .transpose_optimizer import TransposeOptimizer
 from .loop_optimizer import LoopOptimizer
+from .control_flow_optimizer import ControlFlowOptimizer, DEFAULT_MAX_UNROLL_NODES
 from .back_to_back_optimizer import BackToBackOptimizer
+from .affine_fold_optimizer import AffineFoldOptimizer
+from .fused_activation_optimizer import FusedActivationOptimizer
+from .nhwc_conv_optimizer import NhwcConvOptimizer
+from .reshape_optimizer import ReshapeOptimizer
 from .upsample_optimizer import UpsampleOptimizer
+from .report import OptimizationReport
 from .. import logging
 
 # optimizer sequence need to be considered carefully
 _optimizers = OrderedDict([
+    # NhwcConv needs the transposes around the conv, before optimize_transpose moves them
+    ("convert_nhwc_conv", NhwcConvOptimizer),
     ("optimize_transpose", TransposeOptimizer),
     ("remove_redundant_upsample", UpsampleOptimizer),
     ("fold_constants", ConstFoldOptimizer),
+    # batchnorms and scales need their parameters folded to constants first
+    ("fold_affine", AffineFoldOptimizer),
+    # inlining taken branches and unrolling loops needs the constants folded
+    ("simplify_control_flow", ControlFlowOptimizer),
     ("loop_optimizer", LoopOptimizer),
+    ("collapse_reshape_chains", ReshapeOptimizer),
     # merge_duplication should be used after optimize_transpose
     # for optimize_transpose may have some trans nodes that can be merge
     ("merge_duplication", MergeDuplicatedNodesOptimizer),
     ("remove_identity", IdentityOptimizer),
     ("remove_back_to_back", BackToBackOptimizer),
+    # fused ops are opaque to the other optimizers, so fuse as late as possible
+    ("fuse_activations", FusedActivationOptimizer),
 ])
 
 
@@ -36,31 +51,49 @@ def _get_optimizers():
     return _optimizers
 
 
-def optimize_graph(graph, catch_errors=True):
-    """ Optimize graph, return optimized graph. No throw if catch_errors is true"""
+def optimize_graph(graph, catch_errors=True, report=None, num_workers=1, max_unroll_nodes=DEFAULT_MAX_UNROLL_NODES):
+    """ Optimize graph, return optimized graph. No throw if catch_errors is true.
+        If report is an OptimizationReport, statistics of every optimizer run are added to it.
+        If num_workers > 1, the body graphs of the nodes in the main graph are optimized in that many processes.
+        Loops with constant trip count are unrolled if they expand to at most max_unroll_nodes nodes.
+    """
     logger = logging.getLogger(__name__)
     logger.info("Optimizing ONNX model")
 
     before = graph.dump_node_statistics()
     opts = _get_optimizers()
+    if report is not None:
+        report.start()
+    iteration = 0
     continue_flag = True
     while continue_flag:
         continue_flag = False
         for name, factory in opts.items():
             logger.verbose("Apply %s", name)
+            if report is not None:
+                report.begin_pass(iteration, name, graph)
+            opt = factory()
+            opt.num_workers = num_workers
+            if isinstance(opt, ControlFlowOptimizer):
+                opt.max_unroll_nodes = max_unroll_nodes
+            failed = False
             if catch_errors:
                 try:
                     current = copy.deepcopy(graph)
-                    opt = factory()
                     graph = opt.optimize(current) or graph
                     continue_flag = continue_flag or opt.graph_been_opt
                 except Exception:  # pylint: disable=broad-except
                     # if current optimizer fails, continue with other optimizers
                     logger.warning("Failed to apply %s", name, exc_info=1)
+                    failed = True
             else:
-                opt = factory()
                 graph = opt.optimize(graph)
                 continue_flag = continue_flag or opt.graph_been_opt
+            if report is not None:
+                report.end_pass(graph, opt.graph_been_opt and not failed, failed)
+        iteration += 1
+    if report is not None:
+        report.stop()
 
     try:
         graph.topological_sort(graph.get_nodes())
@@ -0,0 +1,214 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Affine Fold Optimizer.
+   Fold a per channel scale and shift following Conv (of any rank), Gemm or MatMul into its weights,
+   the scale and shift may come from BatchNormalization or from Mul/Div/Add/Sub with a constant.
+   The values are computed as provenance.Tensor, the fused weights keep the recipes of their sources.
+"""
+
+from __future__ import unicode_literals
+
+import numpy as np
+from onnx import onnx_pb
+
+from tf2onnx import utils
+from tf2onnx.provenance import Tensor
+from .optimizer_base import GraphOptimizerBase
+
+# pylint: disable=logging-not-lazy,unused-argument,missing-docstring,unused-variable,arguments-differ
+
+_LINEAR_OPS = ["Conv", "Gemm", "MatMul"]
+_AFFINE_OPS = ["BatchNormalization", "Mul", "Div", "Add", "Sub"]
+_FLOAT_TYPES = [onnx_pb.TensorProto.FLOAT16, onnx_pb.TensorProto.FLOAT, onnx_pb.TensorProto.DOUBLE]
+
+
+class AffineFoldOptimizer(GraphOptimizerBase):
+    """Affine Fold Optimizer."""
+
+    def __init__(self):  # pylint: disable=useless-super-delegation
+        super(AffineFoldOptimizer, self).__init__()
+
+    def _optimize(self, graph):
+        return self._apply_optimization(graph, self._optimize_at_current_graph_level)
+
+    def _optimize_at_current_graph_level(self, g):
+        has_update = True
+        while has_update:
+            has_update = False
+            for node in g.get_nodes():
+                if node.type in _LINEAR_OPS and utils.is_onnx_domain(node.domain) and self._try_fold(g, node):
+                    has_update = True
+                    self.graph_been_opt = True
+                    break
+        return g
+
+    @staticmethod
+    def _get_weights(node):
+        """Return the weights, bias and the axis of the output channels in the weights, None if not const."""
+        if len(node.input) < 2 or not node.inputs[1].is_const():
+            return None
+        weights = node.inputs[1].get_tensor_value_with_provenance()
+        bias = None
+        if len(node.input) > 2 and node.input[2]:
+            if not node.inputs[2].is_const():
+                return None
+            bias = node.inputs[2].get_tensor_value_with_provenance()
+        if node.type == "Conv":
+            return weights, bias, 0
+        if node.type == "Gemm":
+            return weights, bias, 0 if node.get_attr_value("transB", 0) else 1
+        # MatMul with 1-D weights has no output channels
+        if weights.ndim < 2:
+            return None
+        return weights, bias, weights.ndim - 1
+
+    @staticmethod
+    def _get_channel_axis(g, node, weights):
+        """Return the channel axis and the rank of the output of node, rank is None if unknown."""
+        if node.type == "Conv":
+            return 1, weights.ndim
+        if node.type == "Gemm":
+            return 1, 2
+        shape = g.get_shape(node.output[0])
+        if shape is None:
+            return -1, None
+        return len(shape) - 1, len(shape)
+
+    @staticmethod
+    def _get_per_channel(val, channel_axis, rank, num_channels):
+        """Return val as a 1-D array over the channels if it broadcasts to the channel axis of an
+           output of the given rank without changing its shape, None otherwise.
+        """
+        if rank is None:
+            # only scalars and vectors, they broadcast to the last axis of any rank
+            if val.ndim > 1:
+                return None
+            rank = max(val.ndim, 1)
+            channel_axis = rank - 1
+        if val.ndim > rank:
+            return None
+        shape = [1] * (rank - val.ndim) + list(val.shape)
+        if any(d != 1 for i, d in enumerate(shape) if i != channel_axis):
+            return None
+        if val.size == 1:
+            return val.reshape([1]).broadcast_to([num_channels])
+        if val.size != num_channels:
+            return None
+        return val.flatten()
+
+    def _get_scale_and_shift(self, g, node, affine, weights, num_channels):
+        """Return the per channel scale and shift of affine applied to the output of node."""
+        channel_axis, rank = self._get_channel_axis(g, node, weights)
+        if affine.type == "BatchNormalization":
+            if affine.get_attr_value("training_mode", 0) or len(affine.input) != 5 or \
+                    not all(inp.is_const() for inp in affine.inputs[1:]):
+                return None
+            # batchnorm works on axis 1, which is only the channel axis of MatMul for 2-D outputs
+            if node.type == "MatMul" and rank != 2:
+                return None
+            if any(g.find_output_consumers(out) for out in affine.output[1:]):
+                return None
+            scale, offset, mean, var = [inp.get_tensor_value_with_provenance() for inp in affine.inputs[1:]]
+            if any(v.shape != (num_channels,) for v in [scale, offset, mean, var]):
+                return None
+            scale = scale / (var + affine.get_attr_value("epsilon", 1e-5)).sqrt()
+            return scale, offset - mean * scale
+
+        const_idx = 1 if affine.input[0] == node.output[0] else 0
+        if affine.input[1 - const_idx] != node.output[0] or not affine.inputs[const_idx].is_const():
+            return None
+        if affine.type == "Div" and const_idx == 0:
+            return None
+        val = affine.inputs[const_idx].get_tensor_value_with_provenance()
+        val = self._get_per_channel(val, channel_axis, rank, num_channels)
+        if val is None:
+            return None
+        ones = Tensor(np.ones(val.shape, dtype=val.dtype))
+        zeros = Tensor(np.zeros(val.shape, dtype=val.dtype))
+        if affine.type == "Mul":
+            return val, zeros
+        if affine.type == "Div":
+            if np.any(val.value == 0):
+                return None
+            return 1 / val, zeros
+        if affine.type == "Add":
+            return ones, val
+        # Sub
+        if const_idx == 1:
+            return ones, -val
+        return -ones, val
+
+    def _try_fold(self, g, node):
+        if len(node.output) != 1 or node.output[0] in g.outputs:
+            return False
+        consumers = g.find_output_consumers(node.output[0])
+        if len(consumers) != 1:
+            return False
+        affine = consumers[0]
+        if affine.type not in _AFFINE_OPS or not utils.is_onnx_domain(affine.domain) or affine.graph is not g:
+            return False
+        if g.get_dtype(node.output[0]) not in _FLOAT_TYPES:
+            return False
+        weights_and_bias = self._get_weights(node)
+        if weights_and_bias is None:
+            return False
+        weights, bias, weight_axis = weights_and_bias
+        num_channels = weights.shape[weight_axis]
+        if bias is not None and node.type == "Conv" and bias.shape != (num_channels,):
+            return False
+        scale_and_shift = self._get_scale_and_shift(g, node, affine, weights, num_channels)
+        if scale_and_shift is None:
+            return False
+        scale, shift = scale_and_shift
+        if node.type == "MatMul" and affine.type in ["Add", "Sub"] and np.all(scale.value == 1):
+            # MatMul has no bias to fold the shift into
+            return False
+
+        self.logger.debug("fold %s %s into %s %s", affine.type, affine.name, node.type, node.name)
+        scale_shape = [1] * weights.ndim
+        scale_shape[weight_axis] = num_channels
+        new_weights = (weights * scale.reshape(scale_shape)).astype(weights.dtype)
+        weights_const = g.make_const(utils.make_name(node.name + "_weights_fused"), new_weights)
+        g.replace_input(node, node.input[1], weights_const.output[0], 1)
+
+        add_shift = None
+        if node.type == "Conv":
+            bias = Tensor(np.zeros([num_channels], dtype=weights.dtype)) if bias is None else bias
+            new_bias = (bias * scale + shift).astype(weights.dtype)
+        elif node.type == "Gemm":
+            beta = node.get_attr_value("beta", 1.0)
+            # Gemm bias may broadcast to [M, N], the per channel scale only touches N
+            if bias is None or beta == 0:
+                new_bias = shift.astype(weights.dtype) if np.any(shift.value != 0) else None
+            else:
+                new_bias = (bias * beta * scale + shift).astype(weights.dtype)
+            if new_bias is not None:
+                node.set_attr("beta", 1.0)
+        else:
+            new_bias = None
+            if np.any(shift.value != 0):
+                add_shift = shift.astype(weights.dtype)
+
+        if new_bias is not None:
+            bias_const = g.make_const(utils.make_name(node.name + "_bias_fused"), new_bias)
+            if len(node.input) > 2:
+                g.replace_input(node, node.input[2], bias_const.output[0], 2)
+            else:
+                g.replace_inputs(node, list(node.input) + [bias_const.output[0]])
+
+        # the linear op takes over the output of the affine op
+        affine_output = affine.output[:1]
+        shape = g.get_shape(affine_output[0])
+        dtype = g.get_dtype(affine_output[0])
+        g.remove_node(affine.name)
+        if add_shift is None:
+            # the setter makes a copy
+            node.output = affine_output
+        else:
+            shift_const = g.make_const(utils.make_name(node.name + "_shift_fused"), add_shift)
+            g.make_node("Add", [node.output[0], shift_const.output[0]], outputs=affine_output,
+                        shapes=[shape], dtypes=[dtype])
+        g.set_shape(affine_output[0], shape)
+        g.set_dtype(affine_output[0], dtype)
+        return True
@@ -4,6 +4,7 @@
 """const fold Optimizer.
    if op's inputs are all const then do op computation when building the graph to improve performance
    for example, input of transpose node is const then we can do transpose statically instead of at runtime
+   the data inputs are folded as provenance.Tensor, so that the folded consts keep their recipes
 """
 
 from .. import utils
@@ -96,7 +97,7 @@ class ConstFoldOptimizer(GraphOptimizerBase):
     @staticmethod
     @_register_func("Cast")
     def _fold_cast(node, graph):
-        const_val = node.inputs[0].get_tensor_value(as_list=False)
+        const_val = node.inputs[0].get_tensor_value_with_provenance()
         np_dtype = utils.ONNX_TO_NUMPY_DTYPE[node.get_attr("to").i]
         const_val_after_cast = const_val.astype(np_dtype)
         return [const_val_after_cast]
@@ -104,7 +105,7 @@ class ConstFoldOptimizer(GraphOptimizerBase):
     @staticmethod
     @_register_func("Transpose")
     def _fold_transpose(node, graph) -> list:
-        const_val = node.inputs[0].get_tensor_value(as_list=False)
+        const_val = node.inputs[0].get_tensor_value_with_provenance()
         perm_attr = node.get_attr("perm")
         perm = perm_attr.ints if perm_attr else None
         const_val_after_trans = const_val.transpose(perm)
@@ -113,7 +114,7 @@ class ConstFoldOptimizer(GraphOptimizerBase):
     @staticmethod
     @_register_func("Reshape")
     def _fold_reshape(node, graph):
-        const_val_data = node.inputs[0].get_tensor_value(as_list=False)
+        const_val_data = node.inputs[0].get_tensor_value_with_provenance()
         const_val_shape = node.inputs[1].get_tensor_value(as_list=True)
         data_shape = const_val_data.shape
         for i, dim in enumerate(const_val_shape):
@@ -129,7 +130,7 @@ class ConstFoldOptimizer(GraphOptimizerBase):
         """
         numpy expand_dims only supports to unsqueeze one dim one time, so reshape is used to simplify the logic
         """
-        const_val = node.inputs[0].get_tensor_value(as_list=False)
+        const_val = node.inputs[0].get_tensor_value_with_provenance()
         if graph.opset >= 13:
             axes = node.inputs[1].get_tensor_value(as_list=True)
         else:
@@ -0,0 +1,198 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Control Flow Optimizer.
+   Simplify control flow that can be resolved when building the graph:
+   If with a constant predicate is replaced by the taken branch and
+   Loop with constant trip count and condition is unrolled if it is small enough.
+"""
+
+from __future__ import unicode_literals
+
+import copy
+
+import numpy as np
+
+from tf2onnx import utils
+from tf2onnx.graph_builder import GraphBuilder
+from .optimizer_base import GraphOptimizerBase
+
+# pylint: disable=logging-not-lazy,unused-argument,missing-docstring,unused-variable,arguments-differ
+
+# max number of nodes a Loop is allowed to expand to when it is unrolled
+DEFAULT_MAX_UNROLL_NODES = 128
+
+
+class ControlFlowOptimizer(GraphOptimizerBase):
+    """Control Flow Optimizer."""
+
+    def __init__(self, max_unroll_nodes=DEFAULT_MAX_UNROLL_NODES):
+        super(ControlFlowOptimizer, self).__init__()
+        self._max_unroll_nodes = max_unroll_nodes
+
+    @property
+    def max_unroll_nodes(self):
+        """Max number of nodes a Loop is allowed to expand to when it is unrolled."""
+        return self._max_unroll_nodes
+
+    @max_unroll_nodes.setter
+    def max_unroll_nodes(self, value):
+        self._max_unroll_nodes = value
+
+    def _get_init_args(self):
+        return {"max_unroll_nodes": self._max_unroll_nodes}
+
+    def _optimize(self, graph):
+        return self._apply_optimization(graph, self._optimize_at_current_graph_level)
+
+    def _optimize_at_current_graph_level(self, g):
+        has_update = True
+        while has_update:
+            has_update = False
+            for n in g.get_nodes():
+                if n.type == "If":
+                    has_update = self._try_fold_if(g, n)
+                elif n.type == "Loop":
+                    has_update = self._try_unroll_loop(g, n)
+                if has_update:
+                    self.graph_been_opt = True
+                    break
+        return g
+
+    @staticmethod
+    def _get_const_scalar(g, name):
+        node = g.get_node_by_output(name)
+        if node is None or not node.is_const():
+            return None
+        val = node.get_tensor_value(as_list=False)
+        if val.size != 1:
+            return None
+        return val.flatten()[0]
+
+    def _try_fold_if(self, g, if_node):
+        cond = self._get_const_scalar(g, if_node.input[0])
+        if cond is None:
+            return False
+
+        branch = if_node.get_body_graphs()["then_branch" if cond else "else_branch"]
+        self.logger.debug("replace %s with its %s branch", if_node.name, "then" if cond else "else")
+        outputs = list(if_node.output)
+        shapes = if_node.output_shapes
+        dtypes = if_node.output_dtypes
+        g.remove_node(if_node.name)
+
+        for node in branch.get_nodes():
+            self._move_node(g, node)
+        for out, branch_out, shape, dtype in zip(outputs, branch.outputs, shapes, dtypes):
+            g.make_node("Identity", [branch_out], outputs=[out], shapes=[shape], dtypes=[dtype])
+        return True
+
+    @staticmethod
+    def _move_node(g, node):
+        name = node.name
+        if g.get_node_by_name(name) is not None:
+            name = utils.make_name(name)
+        body_graphs = node.get_body_graphs() or {}
+        new_node = g.make_node(node.type, node.input, attr=node.attr, outputs=node.output, name=name,
+                               shapes=node.output_shapes, dtypes=node.output_dtypes, domain=node.domain,
+                               infer_shape_dtype=False, branches=body_graphs)
+        new_node.provenance = node.provenance
+        # re-register inputs of nested graphs with their new parent graph
+        for b_g in body_graphs.values():
+            b_g.reset_nodes(b_g.get_nodes())
+        return new_node
+
+    def _try_unroll_loop(self, g, loop_node):
+        trip_count = self._get_const_scalar(g, loop_node.input[0]) if loop_node.input[0] else None
+        if trip_count is None or trip_count < 1:
+            return False
+        if loop_node.input[1] and not self._get_const_scalar(g, loop_node.input[1]):
+            return False
+
+        body = loop_node.get_body_graphs()["body"]
+        body_inputs = [n.output[0] for n in body.inputs]
+        body_nodes = [n for n in body.get_nodes() if not n.is_graph_input()]
+        if any(n.get_body_graphs() for n in body_nodes):
+            return False
+        if not self._is_condition_unchanged(body, body_inputs[1]):
+            return False
+        if trip_count * len(body_nodes) > self._max_unroll_nodes:
+            self.logger.debug("%s is too large to be unrolled", loop_node.name)
+            return False
+
+        self.logger.debug("unroll %s for %d iterations", loop_node.name, trip_count)
+        input_shapes = [body.get_shape(inp) for inp in body_inputs[:2]]
+        body.topological_sort(body.get_nodes())
+        body_nodes = [n for n in body.get_nodes() if not n.is_graph_input()]
+        loop_carried = len(loop_node.input) - 2
+        carried_values = list(loop_node.input[2:])
+        scan_values = [[] for _ in body.outputs[loop_carried + 1:]]
+        # consts are the same in every iteration so they are only created once
+        const_mapping = {}
+        for node in body_nodes:
+            if node.is_const():
+                new_const = g.copy_const(node, utils.make_name(node.name))
+                const_mapping[node.output[0]] = new_const.output[0]
+
+        for i in range(trip_count):
+            mapping = dict(const_mapping)
+            mapping[body_inputs[0]] = self._make_like_input(g, input_shapes[0], i, np.int64)
+            mapping[body_inputs[1]] = self._make_like_input(g, input_shapes[1], True, np.bool_)
+            mapping.update(zip(body_inputs[2:], carried_values))
+            for node in body_nodes:
+                if node.is_const():
+                    continue
+                name = utils.make_name(node.name)
+                outputs = [utils.port_name(name, j) for j in range(len(node.output))]
+                g.make_node(node.type, [mapping.get(inp, inp) for inp in node.input],
+                            attr=copy.deepcopy(node.attr), outputs=outputs, name=name,
+                            shapes=node.output_shapes, dtypes=node.output_dtypes, domain=node.domain,
+                            infer_shape_dtype=False)
+                mapping.update(zip(node.output, outputs))
+            body_outputs = [mapping.get(out, out) for out in body.outputs]
+            carried_values = body_outputs[1:loop_carried + 1]
+            for values, out in zip(scan_values, body_outputs[loop_carried + 1:]):
+                values.append(out)
+
+        outputs = list(loop_node.output)
+        shapes = loop_node.output_shapes
+        dtypes = loop_node.output_dtypes
+        g.remove_node(loop_node.name)
+        for out, value, shape, dtype in zip(outputs, carried_values, shapes, dtypes):
+            g.make_node("Identity", [value], outputs=[out], shapes=[shape], dtypes=[dtype])
+
+        # scan outputs are the per-iteration values stacked on a new first axis
+        for out, values, shape, dtype in zip(outputs[loop_carried:], scan_values, shapes[loop_carried:],
+                                             dtypes[loop_carried:]):
+            unsqueezed = []
+            for value in values:
+                value_shape = g.get_shape(value)
+                unsq_shape = [1] + value_shape if value_shape is not None else None
+                unsqueezed.append(GraphBuilder(g).make_unsqueeze({"data": value, "axes": [0]},
+                                                                 shapes=[unsq_shape], dtypes=[dtype]))
+            g.make_node("Concat", unsqueezed, attr={"axis": 0}, outputs=[out], shapes=[shape], dtypes=[dtype])
+        return True
+
+    @staticmethod
+    def _is_condition_unchanged(body, cond_input):
+        """Check if the condition computed by body graph is always the condition it gets, which is True."""
+        cond_output = body.outputs[0]
+        if cond_output == cond_input:
+            return True
+        node = body.get_node_by_output(cond_output)
+        if node is None:
+            return False
+        if node.type == "Identity":
+            return node.input[0] == cond_input
+        if node.is_const():
+            val = node.get_tensor_value(as_list=False)
+            return val.size == 1 and bool(val.flatten()[0])
+        return False
+
+    @staticmethod
+    def _make_like_input(g, input_shape, value, np_type):
+        """Make a const feeding value to a body graph input, the input is either a scalar or has shape [1]."""
+        val = np.array(value, dtype=np_type)
+        if input_shape is not None and len(input_shape) == 1:
+            val = val.reshape([1])
+        return g.make_const(utils.make_name("unrolled_loop_input"), val).output[0]
@@ -0,0 +1,107 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Fused Activation Optimizer.
+   Fuse the activation following Conv or Gemm into com.microsoft FusedConv or FusedGemm,
+   only done for the fused_activation target if the graph may use the com.microsoft domain.
+"""
+
+from __future__ import unicode_literals
+
+from onnx import onnx_pb
+
+from tf2onnx import constants, utils
+from .optimizer_base import GraphOptimizerBase
+
+# pylint: disable=logging-not-lazy,unused-argument,missing-docstring,unused-variable,arguments-differ
+
+# activations onnxruntime can fuse, and the op types they can be fused into
+_FUSABLE_ACTIVATIONS = {
+    "Relu": ["Conv", "Gemm"],
+    "LeakyRelu": ["Conv", "Gemm"],
+    "Sigmoid": ["Conv", "Gemm"],
+    "HardSigmoid": ["Conv", "Gemm"],
+    "Tanh": ["Conv", "Gemm"],
+    "Clip": ["Conv"],
+}
+
+# bounds of Clip when min or max isn't given
+_FLT_MAX = 3.4028234663852886e+38
+
+
+class FusedActivationOptimizer(GraphOptimizerBase):
+    """Fused Activation Optimizer."""
+
+    def __init__(self):  # pylint: disable=useless-super-delegation
+        super(FusedActivationOptimizer, self).__init__()
+
+    def _optimize(self, graph):
+        return self._apply_optimization(graph, self._optimize_at_current_graph_level)
+
+    def _optimize_at_current_graph_level(self, g):
+        if not g.is_target(constants.TARGET_FUSED_ACTIVATION) or \
+                not utils.has_opset_domain(g.extra_opset, constants.MICROSOFT_DOMAIN):
+            return g
+        for node in list(g.get_nodes()):
+            if node.type in _FUSABLE_ACTIVATIONS and utils.is_onnx_domain(node.domain):
+                if self._try_fuse(g, node):
+                    self.graph_been_opt = True
+        return g
+
+    @staticmethod
+    def _get_activation_params(g, act):
+        """Return activation_params of FusedConv, None if they can't be determined."""
+        if act.type == "LeakyRelu":
+            return [act.get_attr_value("alpha", 0.01)]
+        if act.type == "HardSigmoid":
+            return [act.get_attr_value("alpha", 0.2), act.get_attr_value("beta", 0.5)]
+        if act.type == "Clip":
+            if g.opset < 11:
+                return [act.get_attr_value("min", -_FLT_MAX), act.get_attr_value("max", _FLT_MAX)]
+            params = []
+            for i, default in [(1, -_FLT_MAX), (2, _FLT_MAX)]:
+                if i >= len(act.input) or not act.input[i]:
+                    params.append(default)
+                    continue
+                inp = act.inputs[i]
+                if inp is None or not inp.is_const():
+                    return None
+                params.append(float(inp.get_tensor_value()))
+            return params
+        return []
+
+    def _try_fuse(self, g, act):
+        node = act.inputs[0]
+        if node is None or node.type not in _FUSABLE_ACTIVATIONS[act.type] or not utils.is_onnx_domain(node.domain):
+            return False
+        if node.output[0] in g.outputs or len(g.find_output_consumers(node.output[0])) != 1:
+            return False
+        # onnxruntime only has float kernels for the fused ops
+        if g.get_dtype(node.output[0]) != onnx_pb.TensorProto.FLOAT:
+            return False
+        params = self._get_activation_params(g, act)
+        if params is None:
+            return False
+
+        attr = {k: v for k, v in node.attr.items()}
+        attr["activation"] = act.type
+        if node.type == "Conv":
+            if params:
+                attr["activation_params"] = params
+        else:
+            # FusedGemm takes the params as activation_alpha and activation_beta
+            for name, val in zip(["activation_alpha", "activation_beta"], params):
+                attr[name] = val
+
+        self.logger.debug("fuse %s into %s", act.name, node.name)
+        op_type = "Fused" + node.type
+        inputs = node.input
+        name = node.name
+        outputs = act.output
+        shapes = act.output_shapes
+        dtypes = act.output_dtypes
+        g.remove_node(act.name)
+        g.remove_node(name)
+        g.make_node(op_type, inputs, attr=attr, outputs=outputs, name=name, shapes=shapes, dtypes=dtypes,
+                    domain=constants.MICROSOFT_DOMAIN)
+        return True
@@ -5,12 +5,24 @@
    some op in loop's body graph can be moved out to the loop
 """
 
+from tf2onnx import utils
 from tf2onnx.utils import make_name, make_sure
 from .optimizer_base import GraphOptimizerBase
 
 
 # pylint: disable=logging-not-lazy,unused-argument,missing-docstring,unused-variable,arguments-differ
 
+# ops that are not pure functions of their inputs, they must be evaluated on every iteration
+_NON_HOISTABLE_OPS = [
+    "Bernoulli",
+    "Dropout",
+    "Multinomial",
+    "RandomNormal",
+    "RandomNormalLike",
+    "RandomUniform",
+    "RandomUniformLike",
+]
+
 
 class LoopOptimizer(GraphOptimizerBase):
     """Loop Optimizer."""
@@ -29,7 +41,8 @@ class LoopOptimizer(GraphOptimizerBase):
             has_update = False
             nodes = [n for n in g.get_nodes() if n.type == "Loop"]
             for n in nodes:
-                has_update_tmp = self._try_move_transpose_out_of_body_graph(n)
+                has_update_tmp = self._try_hoist_loop_invariants(n)
+                has_update_tmp = self._try_move_transpose_out_of_body_graph(n) or has_update_tmp
                 if has_update_tmp:
                     has_update = True
                     self.graph_been_opt = True
@@ -41,6 +54,71 @@ class LoopOptimizer(GraphOptimizerBase):
         res = len(graph.find_output_consumers(node.output[0]))
         return res
 
+    def _try_hoist_loop_invariants(self, loop_node):
+        """Move nodes of the body graph that only depend on outer scope tensors or constants into the parent
+           graph, the body graph then consumes their results as implicit inputs of the loop.
+           return True if some nodes are moved
+        """
+        body_graph = loop_node.get_body_graphs()["body"]
+        parent_graph = loop_node.graph
+        invariant_nodes = self._find_loop_invariant_nodes(body_graph)
+        # hoisting nothing but constants doesn't save any runtime work
+        if all(n.is_const() for n in invariant_nodes):
+            return False
+
+        for node in invariant_nodes:
+            name = node.name
+            if parent_graph.get_node_by_name(name) is not None:
+                name = make_name(name)
+            shapes = node.output_shapes
+            dtypes = node.output_dtypes
+            body_graph.remove_node(node.name)
+            new_node = parent_graph.make_node(node.type, node.input, attr=node.attr, outputs=node.output, name=name,
+                                              shapes=shapes, dtypes=dtypes, domain=node.domain,
+                                              infer_shape_dtype=False)
+            new_node.provenance = node.provenance
+            self.logger.debug("move %s of type %s out of the body graph of %s", node.name, node.type, loop_node.name)
+
+        # remaining consumers in body graph now read the hoisted tensors from outer scope
+        body_graph.reset_nodes(body_graph.get_nodes())
+        return True
+
+    @staticmethod
+    def _find_loop_invariant_nodes(body_graph):
+        """Return loop invariant nodes of body graph in the order they can be created in the parent graph."""
+        body_outputs = set(body_graph.outputs)
+
+        def _is_candidate(node):
+            if node.is_graph_input() or node.type in _NON_HOISTABLE_OPS:
+                return False
+            if not utils.is_onnx_domain(node.domain) or node.get_body_graphs():
+                return False
+            # tensor defined in body graph can't be used as body graph's output when it is moved out
+            return not set(node.output) & body_outputs
+
+        candidates = [n for n in body_graph.get_nodes() if _is_candidate(n)]
+        invariant_nodes = []
+        invariant_outputs = set()
+        has_update = True
+        while has_update:
+            has_update = False
+            for node in candidates:
+                if node in invariant_nodes:
+                    continue
+                defined_in_body = [inp for inp in node.input
+                                   if body_graph.get_node_by_output(inp, search_in_parent_graphs=False)]
+                if all(inp in invariant_outputs for inp in defined_in_body):
+                    invariant_nodes.append(node)
+                    invariant_outputs |= set(node.output)
+                    has_update = True
+
+        # const nodes are only worth moving if they are needed by other moved nodes
+        needed = set()
+        for node in invariant_nodes:
+            if not node.is_const():
+                needed |= set(node.input)
+        return [n for n in invariant_nodes if not n.is_const() or set(n.output) & needed]
+
     def _try_move_transpose_out_of_body_graph(self, loop_node):
         # output node of body graph can be loop-carried-dependent, if so it can't be move out of the body graph
         # return True if moving some nodes successfully
@@ -0,0 +1,63 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""NHWC Conv Optimizer.
+   Replace 2D Conv between the transposes from and to NHWC by com.microsoft NhwcConv
+   working on the NHWC tensors, only done for the nhwc_conv target.
+"""
+
+from __future__ import unicode_literals
+
+from tf2onnx import constants, utils
+from .optimizer_base import GraphOptimizerBase
+
+# pylint: disable=logging-not-lazy,unused-argument,missing-docstring,unused-variable,arguments-differ
+
+
+class NhwcConvOptimizer(GraphOptimizerBase):
+    """NHWC Conv Optimizer."""
+
+    def __init__(self):  # pylint: disable=useless-super-delegation
+        super(NhwcConvOptimizer, self).__init__()
+
+    def _optimize(self, graph):
+        return self._apply_optimization(graph, self._optimize_at_current_graph_level)
+
+    def _optimize_at_current_graph_level(self, g):
+        if not g.is_target(constants.TARGET_NHWC_CONV) or \
+                not utils.has_opset_domain(g.extra_opset, constants.MICROSOFT_DOMAIN):
+            return g
+        for node in list(g.get_nodes()):
+            if node.type == "Conv" and utils.is_onnx_domain(node.domain) and self._try_convert(g, node):
+                self.graph_been_opt = True
+        return g
+
+    @staticmethod
+    def _is_transpose(node, perm):
+        return node is not None and node.type == "Transpose" and node.get_attr_value("perm") == perm
+
+    def _try_convert(self, g, conv):
+        trans_in = conv.inputs[0]
+        if not self._is_transpose(trans_in, constants.NHWC_TO_NCHW):
+            return False
+        if conv.output[0] in g.outputs:
+            return False
+        consumers = g.find_output_consumers(conv.output[0])
+        if len(consumers) != 1 or not self._is_transpose(consumers[0], constants.NCHW_TO_NHWC):
+            return False
+        trans_out = consumers[0]
+
+        self.logger.debug("convert %s to NhwcConv", conv.name)
+        inputs = [trans_in.input[0]] + conv.input[1:]
+        attr = {k: v for k, v in conv.attr.items()}
+        name = conv.name
+        outputs = trans_out.output
+        shapes = trans_out.output_shapes
+        dtypes = trans_out.output_dtypes
+        g.remove_node(trans_out.name)
+        g.remove_node(name)
+        if not g.find_output_consumers(trans_in.output[0]) and trans_in.output[0] not in g.outputs:
+            g.remove_node(trans_in.name)
+        g.make_node("NhwcConv", inputs, attr=attr, outputs=outputs, name=name, shapes=shapes, dtypes=dtypes,
+                    domain=constants.MICROSOFT_DOMAIN)
+        return True
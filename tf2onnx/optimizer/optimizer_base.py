@@ -6,9 +6,27 @@
 from __future__ import unicode_literals
 
 import copy
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 
 from .. import logging, utils
 
+# names made while optimizing a body graph in a worker process are numbered from the start of a block
+# reserved for that body, so names don't depend on scheduling and don't collide between body graphs.
+# They are reproducible, but not the names of a serial run, which numbers the names of all bodies in one sequence.
+_NAME_BLOCK_SIZE = 1000000
+
+
+def _optimize_body_graph_in_worker(payload):
+    """Run in worker process: optimize a pickled body graph with a new optimizer, return the pickled result."""
+    optimizer_class, init_args, func_name, body_graph, name_base = pickle.loads(payload)
+    optimizer = optimizer_class(**init_args)
+    optimize_func = getattr(optimizer, func_name)
+    utils.INTERNAL_NAME = name_base
+    body_graph = optimizer._apply_optimization(body_graph, optimize_func)  # pylint: disable=protected-access
+    utils.make_sure(utils.INTERNAL_NAME < name_base + _NAME_BLOCK_SIZE, "too many names made for body graph")
+    return pickle.dumps((body_graph, optimizer.graph_been_opt, utils.INTERNAL_NAME))
+
 
 class GraphOptimizerBase(object):
     """optimizer graph to improve performance
@@ -17,6 +35,7 @@ class GraphOptimizerBase(object):
     def __init__(self):
         self._logger = logging.getLogger('.'.join(__name__.split('.')[:-1] + [self.__class__.__name__]))
         self._graph_been_opt = False
+        self._num_workers = 1
 
     @property
     def logger(self):
@@ -34,6 +53,15 @@ class GraphOptimizerBase(object):
     def graph_been_opt(self, value):
         self._graph_been_opt = value
 
+    @property
+    def num_workers(self):
+        """Number of processes used to optimize independent body graphs of Loop/If/Scan nodes."""
+        return self._num_workers
+
+    @num_workers.setter
+    def num_workers(self, value):
+        self._num_workers = value
+
     def optimize(self, graph):
         """ Optimize graph, return optimized graph. """
         before = graph.dump_node_statistics()
@@ -50,8 +78,13 @@ class GraphOptimizerBase(object):
         """ Derived class should override this function. """
         raise NotImplementedError
 
-    @staticmethod
-    def _apply_optimization(graph, optimize_func):
+    def _get_init_args(self):
+        """Args to make an optimizer with the same options in a worker process, derived classes with options
+           override it.
+        """
+        return {}
+
+    def _apply_optimization(self, graph, optimize_func):
         """
         optimize graph
         will also optimize graph of nodes'
@@ -60,14 +93,70 @@ class GraphOptimizerBase(object):
             optimize_func: function to optimize graph
         """
         graph = optimize_func(graph)
+        body_graphs = []
         for node in graph.get_nodes():
-            body_graphs = node.get_body_graphs()
-            if body_graphs:
-                for attr, b_g in body_graphs.items():
-                    b_g = GraphOptimizerBase._apply_optimization(b_g, optimize_func)
-                    node.set_body_graph_as_attr(attr, b_g)
+            for attr, b_g in sorted((node.get_body_graphs() or {}).items()):
+                body_graphs.append((node, attr, b_g))
+
+        if self.num_workers > 1 and len(body_graphs) > 1:
+            try:
+                self._apply_optimization_in_parallel(graph, body_graphs, optimize_func)
+                return graph
+            except Exception:  # pylint: disable=broad-except
+                self.logger.warning("Failed to optimize body graphs in parallel, optimize them serially", exc_info=1)
+
+        for node, attr, b_g in body_graphs:
+            b_g = self._apply_optimization(b_g, optimize_func)
+            node.set_body_graph_as_attr(attr, b_g)
         return graph
 
+    def _apply_optimization_in_parallel(self, graph, body_graphs, optimize_func):
+        """Optimize body graphs in a process pool and attach the optimized graphs to their nodes."""
+        payloads = self._make_worker_payloads(graph, body_graphs, optimize_func)
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            results = list(executor.map(_optimize_body_graph_in_worker, payloads))
+
+        for (node, attr, _), result in zip(body_graphs, results):
+            b_g, graph_been_opt, last_name = pickle.loads(result)
+            # continue after the last name made, not after the reserved blocks
+            utils.INTERNAL_NAME = max(utils.INTERNAL_NAME, last_name)
+            node.set_body_graph_as_attr(attr, b_g)
+            # register inputs read from outer scopes with the real parent graph
+            b_g.reset_nodes(b_g.get_nodes())
+            self.graph_been_opt = self.graph_been_opt or graph_been_opt
+
+    def _make_worker_payloads(self, graph, body_graphs, optimize_func):
+        """Pickle the body graphs for the worker processes."""
+        payloads = []
+        name_base = utils.INTERNAL_NAME
+        for i, (node, _, b_g) in enumerate(body_graphs):
+            # body graph is sent without its parent, tensors of outer scopes are copied to a stand-in graph.
+            # The optimizer isn't sent, its state can hold the parent graph, the worker makes a new one.
+            parent_graph = b_g.parent_graph
+            b_g.parent_graph = self._make_outer_scope_graph(graph, node)
+            try:
+                payloads.append(pickle.dumps((type(self), self._get_init_args(), optimize_func.__name__, b_g,
+                                              name_base + i * _NAME_BLOCK_SIZE)))
+            finally:
+                b_g.parent_graph = parent_graph
+        return payloads
+
+    @staticmethod
+    def _make_outer_scope_graph(graph, node):
+        """Make a graph with the outer scope tensors used by the body graphs of node."""
+        outer_graph = graph.create_new_graph_with_same_config()
+        for name in sorted(node.get_implicit_inputs()):
+            # tensors can come from any scope up to the main graph
+            producer = graph.get_node_by_output(name, search_in_parent_graphs=True)
+            if producer is None:
+                continue
+            if producer.is_const():
+                outer_graph.copy_const(producer, name)
+            else:
+                outer_graph.make_node("Placeholder", [], outputs=[name], shapes=[producer.graph.get_shape(name)],
+                                      dtypes=[producer.graph.get_dtype(name)])
+        return outer_graph
+
     def _print_stat_diff(self, before, after):
         diff = copy.deepcopy(after)
         diff.subtract(before)
@@ -0,0 +1,118 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Optimization Report.
+   Collect wall time, memory and node changes of every optimizer run by optimize_graph.
+"""
+
+from __future__ import unicode_literals
+
+import collections
+import json
+import time
+import tracemalloc
+
+from tf2onnx import __version__
+
+# pylint: disable=missing-docstring
+
+MAIN_GRAPH = "main"
+
+
+def collect_node_statistics(graph, path=MAIN_GRAPH, result=None):
+    """Return dict mapping path of graph and each of its subgraphs to op type counter.
+       A subgraph's path is its parent's path, the name of the node owning it and the attribute name.
+    """
+    if result is None:
+        result = collections.OrderedDict()
+    op_cnt = collections.Counter()
+    result[path] = op_cnt
+    for n in graph.get_nodes():
+        op_cnt[n.type] += 1
+        body_graphs = n.get_body_graphs()
+        if body_graphs:
+            for attr, b_g in sorted(body_graphs.items()):
+                collect_node_statistics(b_g, "/".join([path, n.name, attr]), result)
+    return result
+
+
+def _counter_diff(before, after):
+    diff = collections.Counter(after)
+    diff.subtract(before)
+    return {k: v for k, v in sorted(diff.items()) if v != 0}
+
+
+class OptimizationReport(object):
+    """Statistics of the optimizers applied by optimize_graph, one entry per optimizer and iteration.
+       Each entry has the wall time, the peak memory allocated on top of the memory in use when the
+       optimizer started, the change of node count per op type and which graphs were changed.
+    """
+
+    def __init__(self):
+        self.passes = []
+        self.iterations = 0
+        self._current = None
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def begin_pass(self, iteration, name, graph):
+        self.iterations = max(self.iterations, iteration + 1)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        memory, _ = tracemalloc.get_traced_memory()
+        self._current = {
+            "iteration": iteration,
+            "optimizer": name,
+            "stats": collect_node_statistics(graph),
+            "memory": memory,
+            "start": time.perf_counter(),
+        }
+
+    def end_pass(self, graph, changed, failed=False):
+        elapsed = time.perf_counter() - self._current["start"]
+        _, peak = tracemalloc.get_traced_memory()
+        before = self._current["stats"]
+        after = collect_node_statistics(graph)
+        subgraphs = collections.OrderedDict()
+        for path in list(before.keys()) + [p for p in after.keys() if p not in before]:
+            diff = _counter_diff(before.get(path, {}), after.get(path, {}))
+            if diff:
+                subgraphs[path] = diff
+        node_delta = _counter_diff(sum(before.values(), collections.Counter()),
+                                   sum(after.values(), collections.Counter()))
+        self.passes.append(collections.OrderedDict([
+            ("iteration", self._current["iteration"]),
+            ("optimizer", self._current["optimizer"]),
+            ("wall_time", elapsed),
+            ("peak_memory_delta", max(peak - self._current["memory"], 0)),
+            ("changed", bool(changed or subgraphs)),
+            ("failed", bool(failed)),
+            ("node_delta", node_delta),
+            ("subgraphs", subgraphs),
+        ]))
+        self._current = None
+
+    def to_dict(self):
+        total_time = collections.defaultdict(float)
+        for p in self.passes:
+            total_time[p["optimizer"]] += p["wall_time"]
+        return collections.OrderedDict([
+            ("tf2onnx_version", __version__),
+            ("iterations", self.iterations),
+            ("total_wall_time", sum(total_time.values())),
+            ("wall_time_per_optimizer", dict(total_time)),
+            ("passes", self.passes),
+        ])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
@@ -0,0 +1,172 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Reshape Optimizer.
+   Collapse chains of shape manipulation ops (Reshape, Squeeze, Unsqueeze, Flatten, Identity)
+   into a single Reshape, or remove the chain if its output has the same shape as its input.
+"""
+
+from __future__ import unicode_literals
+
+import numpy as np
+
+from tf2onnx import utils
+from .optimizer_base import GraphOptimizerBase
+
+# pylint: disable=logging-not-lazy,unused-argument,missing-docstring,unused-variable,arguments-differ
+
+# ops that only change the shape of their first input
+_SHAPE_OPS = ["Reshape", "Squeeze", "Unsqueeze", "Flatten", "Identity"]
+
+
+class ReshapeOptimizer(GraphOptimizerBase):
+    """Reshape Optimizer."""
+
+    def __init__(self):  # pylint: disable=useless-super-delegation
+        super(ReshapeOptimizer, self).__init__()
+
+    def _optimize(self, graph):
+        return self._apply_optimization(graph, self._optimize_at_current_graph_level)
+
+    def _optimize_at_current_graph_level(self, g):
+        has_update = True
+        while has_update:
+            has_update = False
+            for n in g.get_nodes():
+                if self._is_shape_op(n) and self._try_collapse_chain(g, n):
+                    has_update = True
+                    self.graph_been_opt = True
+                    break
+        return g
+
+    @staticmethod
+    def _is_shape_op(node):
+        if node.type not in _SHAPE_OPS or not utils.is_onnx_domain(node.domain):
+            return False
+        # shape related inputs, such as shape of Reshape and axes of Squeeze in opset 13, must be static
+        return all(inp is not None and inp.is_const() for inp in node.inputs[1:])
+
+    @staticmethod
+    def _get_static_shape(g, name):
+        """Return the shape if at most one dim is unknown, which is then represented by -1."""
+        shape = g.get_shape(name)
+        if shape is None:
+            return None
+        shape = [-1 if utils.is_unknown_dimension(d) else d for d in shape]
+        if shape.count(-1) > 1:
+            return None
+        return shape
+
+    @staticmethod
+    def _get_axes(g, node):
+        if g.opset >= 13 and node.type in ["Squeeze", "Unsqueeze"]:
+            if len(node.input) < 2:
+                return None
+            return node.inputs[1].get_tensor_value(as_list=True)
+        return node.get_attr_value("axes")
+
+    def _infer_shape(self, g, node, shape):
+        """Compute output shape of node from the shape of its first input, None if it's not static enough.
+           Shapes recorded in the graph are not used since they might not be precise.
+        """
+        if node.type == "Identity":
+            return shape
+        if node.type == "Reshape":
+            target = node.inputs[1].get_tensor_value(as_list=True)
+            if node.get_attr_value("allowzero", 0):
+                return None
+            new_shape = [shape[i] if d == 0 else d for i, d in enumerate(target)]
+            if new_shape.count(-1) > 1:
+                return None
+            if -1 not in shape:
+                size = int(np.prod(shape))
+                if -1 in new_shape:
+                    known = int(np.prod([d for d in new_shape if d != -1]))
+                    if known == 0 or size % known != 0:
+                        return None
+                    new_shape[new_shape.index(-1)] = size // known
+                if int(np.prod(new_shape)) != size:
+                    return None
+            return new_shape
+        if node.type == "Flatten":
+            axis = node.get_attr_value("axis", 1)
+            axis = axis + len(shape) if axis < 0 else axis
+            new_shape = [-1 if -1 in dims else int(np.prod(dims)) for dims in [shape[:axis], shape[axis:]]]
+            return new_shape if new_shape.count(-1) <= 1 else None
+        axes = self._get_axes(g, node)
+        if node.type == "Squeeze":
+            if axes is None:
+                if -1 in shape:
+                    return None
+                return [d for d in shape if d != 1]
+            axes = [a + len(shape) if a < 0 else a for a in axes]
+            if any(a >= len(shape) or shape[a] not in [1, -1] for a in axes):
+                return None
+            return [d for i, d in enumerate(shape) if i not in axes]
+        if node.type == "Unsqueeze" and axes is not None:
+            rank = len(shape) + len(axes)
+            axes = [a + rank if a < 0 else a for a in axes]
+            dims = iter(shape)
+            return [1 if i in axes else next(dims) for i in range(rank)]
+        return None
+
+    @staticmethod
+    def _is_compatible(shape, recorded_shape):
+        if shape is None:
+            return False
+        if recorded_shape is None:
+            return True
+        if len(shape) != len(recorded_shape):
+            return False
+        return all(d == r or d == -1 or utils.is_unknown_dimension(r) for d, r in zip(shape, recorded_shape))
+
+    def _try_collapse_chain(self, g, tail):
+        chain = [tail]
+        while True:
+            producer = chain[0].inputs[0]
+            if producer is None or producer.graph is not g or not self._is_shape_op(producer):
+                break
+            if producer.output[0] in g.outputs or len(g.find_output_consumers(producer.output[0])) != 1:
+                break
+            chain.insert(0, producer)
+
+        if all(n.type == "Identity" for n in chain):
+            # left to identity optimizer
+            return False
+
+        input_name = chain[0].input[0]
+        output_name = tail.output[0]
+        input_shape = self._get_static_shape(g, input_name)
+        output_shape = input_shape
+        for n in chain:
+            if output_shape is None:
+                return False
+            output_shape = self._infer_shape(g, n, output_shape)
+            if not self._is_compatible(output_shape, g.get_shape(n.output[0])):
+                # shapes in the graph contradict each other, don't touch the chain
+                return False
+        is_noop = input_shape == output_shape
+        if len(chain) == 1 and not is_noop:
+            return False
+        if 0 in output_shape and not is_noop:
+            # 0 in the shape of Reshape means copying the dim of the input
+            return False
+
+        self.logger.debug("collapse %s into one Reshape", [n.name for n in chain])
+        dtype = g.get_dtype(output_name)
+        tail_name = tail.name
+        for n in chain:
+            g.remove_node(n.name)
+
+        if is_noop:
+            if output_name in g.outputs:
+                g.make_node("Identity", [input_name], outputs=[output_name], name=tail_name,
+                            shapes=[output_shape], dtypes=[dtype])
+            else:
+                g.replace_all_inputs(output_name, input_name)
+            return True
+
+        shape_const = g.make_const(utils.make_name(tail_name + "_shape"), np.array(output_shape, dtype=np.int64))
+        g.make_node("Reshape", [input_name, shape_const.output[0]], outputs=[output_name], name=tail_name,
+                    shapes=[output_shape], dtypes=[dtype])
+        return True
@@ -58,13 +58,13 @@ class TransposeOptimizer(GraphOptimizerBase):
                                      and n.inputs[0].is_const()
                                      and n.inputs[1].is_const())]
         for reshape_op in constable_reshape_ops:
-            target_t = reshape_op.inputs[0].get_tensor_value(as_list=False)
+            target_t = reshape_op.inputs[0].get_tensor_value_with_provenance()
             target_shape = reshape_op.inputs[1].get_tensor_value(as_list=True)
             for i, dim in enumerate(target_shape):
                 if dim == 0:
                     # In ORT a dim of 0 means the shape stays the same.
                     target_shape[i] = target_t.shape[i]
-            new_data = np.reshape(target_t, target_shape)
+            new_data = target_t.reshape(target_shape)
             const_name = reshape_op.output[0]
             self._g.remove_node(reshape_op.name)
             self._g.make_const(const_name, new_data)
@@ -156,6 +156,10 @@ class TransposeOptimizer(GraphOptimizerBase):
                         # need break, because handler may change nodes set, making the n stale object
                         # referencing already deleted elements
                         break
+                    if self._g.get_node_by_name(n.name) is None:
+                        # n was moved into the branches of its consumers, handle the new transposes too
+                        no_action = False
+                        break
 
                 if is_useless_transpose(n):
                     no_action = False
@@ -394,7 +398,7 @@ class TransposeOptimizer(GraphOptimizerBase):
                     return False
 
                 target_node = node.inputs[1]
-                numpy_val = target_node.get_tensor_value(as_list=False)
+                numpy_val = target_node.get_tensor_value_with_provenance()
                 # Optional 1D bias to be added to the convolution, has size of M
                 if len(numpy_val.shape) - numpy_val.shape.count(1) > 1:
                     self.logger.debug("Bias is not 1D, can not merge Conv and Add")
@@ -423,13 +427,15 @@ class TransposeOptimizer(GraphOptimizerBase):
             for g in {self._g, node.graph}:
                 g.replace_all_inputs(node.output[0], trans.input[0])  # ops=g.get_nodes()
 
-            shape = node.graph.get_shape(node.output[0])
-            dtype = node.graph.get_dtype(node.output[0])
-            if node.output[0] in node.graph.outputs:
-                node.graph.make_node("Identity", [trans.input[0]],
-                                     outputs=node.output, shapes=[shape], dtypes=[dtype])
+            graph = node.graph
+            shape = graph.get_shape(node.output[0])
+            dtype = graph.get_dtype(node.output[0])
             self._g.remove_node(trans.name)
-            node.graph.remove_node(node.name)
+            # the identity takes over the output name, so node must be gone first
+            graph.remove_node(node.name)
+            if node.output[0] in graph.outputs:
+                graph.make_node("Identity", [trans.input[0]],
+                                outputs=node.output, shapes=[shape], dtypes=[dtype])
             return True
         return False
 
@@ -464,7 +470,7 @@ class TransposeOptimizer(GraphOptimizerBase):
         # handle const multipliers
         if not multiplier_input_node.is_const():
             return False
-        multiplier = multiplier_input_node.get_tensor_value(as_list=False)
+        multiplier = multiplier_input_node.get_tensor_value_with_provenance()
 
         # todo: apply this block if we have model case multiplier_input_id==0, and verify that.
         if multiplier_input_id == node.input[1]:
@@ -472,11 +478,11 @@ class TransposeOptimizer(GraphOptimizerBase):
             # make sure conv don't have bias set
             if t_p.type == "Conv" and t_p.inputs[1].is_const() and len(t_p.input) == 2:
                 conv = t_p
-                numpy_val = conv.inputs[1].get_tensor_value(as_list=False)
-                transposed_val = np.transpose(numpy_val, (2, 3, 1, 0))
+                numpy_val = conv.inputs[1].get_tensor_value_with_provenance()
+                transposed_val = numpy_val.transpose((2, 3, 1, 0))
                 mul_val = multiplier
-                result = np.multiply(transposed_val, mul_val)
-                conv.inputs[1].set_tensor_value(np.transpose(result, (3, 2, 0, 1)))
+                result = transposed_val * mul_val
+                conv.inputs[1].set_tensor_value(result.transpose((3, 2, 0, 1)))
 
                 self._g.replace_all_inputs(node.output[0], trans.output[0])  # ops=self._g.get_nodes()
                 self._g.remove_node(node.name)
@@ -538,8 +544,8 @@ class TransposeOptimizer(GraphOptimizerBase):
         # update constants, remove dangling transposes
         for n in inputs:
             if n.is_const():
-                val = n.get_tensor_value(as_list=False)
-                new_val = np.transpose(val, untrans_idx)
+                val = n.get_tensor_value_with_provenance()
+                new_val = val.transpose(untrans_idx)
                 n.set_tensor_value(new_val)
             elif n.name != trans.name:
                 self._g.remove_node(n.name)
@@ -0,0 +1,297 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.provenance - record how the initializers of a converted model are computed from the consts of the
+tensorflow graph, and replay it on the consts of a retrained model to refresh the weights without converting again.
+
+A recipe is a json compatible dict, one of
+    {"source": name}                               the value of the tensorflow Const node name
+    {"value": value, "dtype": dtype, "shape": shape}  a literal filled with the scalar value, for values which
+                                                   don't come from tensorflow, like the zeros of a missing bias
+    {"op": op, "inputs": [recipe, ...], "attrs": {...}}  op of _OPS applied to the values of its inputs
+    {"tainted": [name, ...]}                       computed from the sources in a way which can't be replayed
+Recipes are only recorded if the conversion asks for them, see process_tf_graph(record_provenance=True).
+Transformations of consts record their recipes by working on Tensor instead of np.ndarray, see
+Node.get_tensor_value_with_provenance. Reading a const with Node.get_tensor_value instead taints its sources,
+their values were used in a way which can't be replayed and changing them needs a full conversion.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+
+import numpy as np
+from onnx import numpy_helper
+
+from tf2onnx import utils
+
+logger = logging.getLogger(__name__)
+
+PROVENANCE_SUFFIX = ".provenance.json"
+
+# key is op, value is the numpy function computing it from the input values and attrs
+_OPS = {
+    "Add": np.add,
+    "Sub": np.subtract,
+    "Mul": np.multiply,
+    "Div": np.divide,
+    "Neg": np.negative,
+    "Sqrt": np.sqrt,
+    "Transpose": lambda x, perm: np.transpose(x, perm),
+    "Reshape": lambda x, shape: np.reshape(x, shape),
+    "BroadcastTo": lambda x, shape: np.broadcast_to(x, shape).copy(),
+    "Cast": lambda x, dtype: x.astype(dtype),
+    "Clip": lambda x, min_val, max_val: np.clip(x, min_val, max_val),
+}
+
+
+def _literal(value):
+    if isinstance(value, np.generic):
+        value = np.array(value)
+    if not isinstance(value, np.ndarray):
+        # python scalars keep their weak type in numpy arithmetic, don't turn them into arrays
+        return {"value": value}
+    return {"value": value.flat[0].item(), "dtype": value.dtype.name, "shape": list(value.shape)}
+
+
+def _is_literal(value):
+    """Whether value can be written to a recipe as a scalar, other arrays would make the recipes as large as
+       the weights.
+    """
+    if isinstance(value, np.generic) or not isinstance(value, np.ndarray):
+        return True
+    return value.size > 0 and np.all(value == value.flat[0])
+
+
+class Tensor(object):
+    """The value of a const together with its recipe, None if it doesn't depend on tensorflow consts.
+       The numpy style methods and operators compute new values and record their recipes.
+    """
+
+    def __init__(self, value, recipe=None):
+        self.value = value
+        self.recipe = recipe
+
+    @staticmethod
+    def apply(op, inputs, **attrs):
+        inputs = [inp if isinstance(inp, Tensor) else Tensor(inp) for inp in inputs]
+        value = _OPS[op](*[inp.value for inp in inputs], **attrs)
+        if all(inp.recipe is None for inp in inputs):
+            return Tensor(value)
+        if any("tainted" in inp.recipe if inp.recipe is not None else not _is_literal(inp.value)
+               for inp in inputs):
+            return Tensor(value, {"tainted": sorted(set().union(*[get_sources(inp.recipe) for inp in inputs]))})
+        recipe = {"op": op, "inputs": [_literal(inp.value) if inp.recipe is None else inp.recipe for inp in inputs],
+                  "attrs": attrs}
+        return Tensor(value, recipe)
+
+    @property
+    def dtype(self):
+        return self.value.dtype
+
+    @property
+    def shape(self):
+        return self.value.shape
+
+    @property
+    def ndim(self):
+        return self.value.ndim
+
+    @property
+    def size(self):
+        return self.value.size
+
+    def __add__(self, other):
+        return Tensor.apply("Add", [self, other])
+
+    def __radd__(self, other):
+        return Tensor.apply("Add", [other, self])
+
+    def __sub__(self, other):
+        return Tensor.apply("Sub", [self, other])
+
+    def __rsub__(self, other):
+        return Tensor.apply("Sub", [other, self])
+
+    def __mul__(self, other):
+        return Tensor.apply("Mul", [self, other])
+
+    def __rmul__(self, other):
+        return Tensor.apply("Mul", [other, self])
+
+    def __truediv__(self, other):
+        return Tensor.apply("Div", [self, other])
+
+    def __rtruediv__(self, other):
+        return Tensor.apply("Div", [other, self])
+
+    def __neg__(self):
+        return Tensor.apply("Neg", [self])
+
+    def sqrt(self):
+        return Tensor.apply("Sqrt", [self])
+
+    def transpose(self, perm=None):
+        if perm is None:
+            perm = reversed(range(self.ndim))
+        return Tensor.apply("Transpose", [self], perm=[int(p) for p in perm])
+
+    def reshape(self, shape):
+        if np.isscalar(shape):
+            shape = [shape]
+        return Tensor.apply("Reshape", [self], shape=[int(d) for d in shape])
+
+    def flatten(self):
+        return self.reshape([-1])
+
+    def broadcast_to(self, shape):
+        return Tensor.apply("BroadcastTo", [self], shape=[int(d) for d in shape])
+
+    def astype(self, dtype):
+        return Tensor.apply("Cast", [self], dtype=np.dtype(dtype).name)
+
+    def clip(self, min_val, max_val):
+        return Tensor.apply("Clip", [self], min_val=float(min_val), max_val=float(max_val))
+
+
+def source(name):
+    return {"source": name}
+
+
+def get_sources(recipe):
+    """Return the names of the tensorflow consts recipe is computed from."""
+    if recipe is None or "value" in recipe:
+        return set()
+    if "source" in recipe:
+        return {recipe["source"]}
+    if "tainted" in recipe:
+        return set(recipe["tainted"])
+    return set().union(*[get_sources(inp) for inp in recipe["inputs"]])
+
+
+def taint(graph, recipe):
+    """Mark the sources of recipe as used in a way which isn't recorded."""
+    if recipe is None:
+        return
+    while graph.parent_graph is not None:
+        graph = graph.parent_graph
+    graph.tainted_sources.update(get_sources(recipe))
+
+
+def evaluate(recipe, source_values):
+    """Compute the value of recipe, source_values maps the names of tensorflow consts to np.ndarray."""
+    if "source" in recipe:
+        return source_values[recipe["source"]]
+    if "value" in recipe:
+        if "dtype" not in recipe:
+            return recipe["value"]
+        return np.full(recipe["shape"], recipe["value"], dtype=recipe["dtype"])
+    inputs = [evaluate(inp, source_values) for inp in recipe["inputs"]]
+    return _OPS[recipe["op"]](*inputs, **recipe["attrs"])
+
+
+def hash_value(value):
+    sha = hashlib.sha256()
+    sha.update("{}{}".format(value.dtype.name, list(value.shape)).encode("utf-8"))
+    sha.update(np.ascontiguousarray(value).tobytes())
+    return sha.hexdigest()
+
+
+def _collect(g, recipes, tainted):
+    for node in g.get_nodes():
+        if node.is_const() and node.provenance is not None:
+            if g.parent_graph is None and "tainted" not in node.provenance:
+                recipes[node.output[0]] = node.provenance
+            else:
+                # consts of body graphs aren't initializers of the model, they aren't refreshed, neither are
+                # the consts with tainted recipes
+                tainted.update(get_sources(node.provenance))
+        for body_graph in (node.get_body_graphs() or {}).values():
+            _collect(body_graph, recipes, tainted)
+    tainted.update(g.tainted_sources)
+
+
+def make_provenance(g, source_values):
+    """Return the provenance of the initializers of the optimized graph g as a json compatible dict.
+       source_values maps the names of the consts of the tensorflow graph to their values. Each recipe is
+       replayed on them and only kept if it reproduces the initializer exactly.
+    """
+    recipes = {}
+    tainted = set()
+    _collect(g, recipes, tainted)
+    fixed = set()
+    for node in g.get_nodes():
+        if not node.is_const():
+            continue
+        value = node.get_tensor_value_with_provenance().value
+        recipe = recipes.get(node.output[0])
+        if recipe is None:
+            fixed.add(hash_value(value))
+            continue
+        replayed = None
+        if all(name in source_values for name in get_sources(recipe)):
+            replayed = evaluate(recipe, source_values)
+        if replayed is None or replayed.dtype != value.dtype or not np.array_equal(replayed, value):
+            logger.warning("The recipe of initializer %s doesn't reproduce it, its sources can't be refreshed",
+                           node.output[0])
+            del recipes[node.output[0]]
+            tainted.update(get_sources(recipe))
+            fixed.add(hash_value(value))
+
+    hashes = {name: hash_value(source_values[name]) for name in source_values}
+    # consts copied without their recipes, like the attrs of a copied node, aren't refreshed either
+    tainted.update(name for name, h in hashes.items() if h in fixed)
+    used = tainted.union(*[get_sources(recipe) for recipe in recipes.values()])
+    return {
+        "initializers": recipes,
+        "sources": {name: hashes[name] for name in sorted(used) if name in hashes},
+        "tainted": sorted(tainted),
+    }
+
+
+def save_provenance(path, provenance):
+    with open(path, "w") as f:
+        json.dump(provenance, f)
+
+
+def load_provenance(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def refresh_initializers(model_proto, provenance, source_values):
+    """Replace the initializers of model_proto recorded in provenance by their recipes replayed on source_values,
+       the consts of the retrained tensorflow model. Return the provenance of the refreshed model.
+    """
+    changed = []
+    hashes = {}
+    for name, old_hash in provenance["sources"].items():
+        utils.make_sure(name in source_values, "Const %s of the converted model is missing, load the model with "
+                        "the options of the conversion or convert it again", name)
+        hashes[name] = hash_value(source_values[name])
+        if hashes[name] != old_hash:
+            changed.append(name)
+    tainted = sorted(set(changed).intersection(provenance["tainted"]))
+    utils.make_sure(not tainted, "The conversion used the values of %s in ways which can't be replayed, "
+                    "convert the model again", tainted)
+    logger.info("%d of %d tensorflow consts changed", len(changed), len(hashes))
+
+    changed = set(changed)
+    initializers = {tensor.name: tensor for tensor in model_proto.graph.initializer}
+    for name, recipe in provenance["initializers"].items():
+        if not get_sources(recipe).intersection(changed):
+            continue
+        utils.make_sure(name in initializers, "Initializer %s is missing in the onnx model", name)
+        tensor = initializers[name]
+        value = evaluate(recipe, source_values)
+        new_tensor = numpy_helper.from_array(value, name)
+        utils.make_sure(new_tensor.data_type == tensor.data_type and new_tensor.dims == tensor.dims,
+                        "The new value of initializer %s has another type or shape, convert the model again", name)
+        tensor.CopyFrom(new_tensor)
+        logger.debug("refreshed initializer %s", name)
+    return dict(provenance, sources=hashes)
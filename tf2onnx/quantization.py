@@ -0,0 +1,209 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.quantization - quantize the weights and activations of a graph to 8 bits in the QDQ format
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+
+import numpy as np
+from onnx import helper, TensorProto
+
+from tf2onnx import utils
+
+logger = logging.getLogger(__name__)
+
+# ops whose float inputs are quantized, mapped to the index of the weight input
+QUANTIZABLE_OPS = {
+    "Conv": 1,
+    "MatMul": 1,
+    "Gemm": 1,
+}
+
+# weights with fewer elements are left in float, quantizing them saves nothing
+MIN_WEIGHT_SIZE = 32
+
+_INT8_MAX = 127
+_UINT8_MAX = 255
+
+
+def load_calibration_data(paths):
+    """Load the .npz files of paths into a list of feed dicts for the calibration runs.
+       Each file maps model input names to arrays. If an array has one more dim than the
+       input it feeds, its first axis indexes the samples, which are fed one by one.
+    """
+    feeds = []
+    for path in paths:
+        with np.load(path) as data:
+            arrays = {k: data[k] for k in data.files}
+        utils.make_sure(arrays, "calibration data %s is empty", path)
+        feeds.append(arrays)
+    return feeds
+
+
+def _split_samples(feed, input_ranks):
+    if any(name not in input_ranks for name in feed):
+        unknown = [name for name in feed if name not in input_ranks]
+        raise ValueError("calibration data has arrays {} which are not inputs of the model".format(unknown))
+    sample_counts = set(arr.shape[0] for name, arr in feed.items()
+                        if input_ranks[name] is not None and arr.ndim == input_ranks[name] + 1)
+    if not sample_counts:
+        return [feed]
+    utils.make_sure(len(sample_counts) == 1, "all calibration arrays must have the same number of samples")
+    return [{name: arr[i] if input_ranks[name] is not None and arr.ndim == input_ranks[name] + 1 else arr
+             for name, arr in feed.items()} for i in range(sample_counts.pop())]
+
+
+def calibrate(g, tensor_names, feeds):
+    """Run the float model of graph g in onnxruntime on feeds and return the (min, max) range
+       seen for each tensor of tensor_names.
+    """
+    import onnxruntime as ort  # pylint: disable=import-outside-toplevel
+
+    model_proto = g.make_model("calibration")
+    outputs = [out.name for out in model_proto.graph.output]
+    for name in tensor_names:
+        if name not in outputs:
+            model_proto.graph.output.extend([helper.make_tensor_value_info(name, TensorProto.FLOAT, None)])
+    input_ranks = {}
+    for inp in model_proto.graph.input:
+        dims = inp.type.tensor_type.shape.dim if inp.type.tensor_type.HasField("shape") else None
+        input_ranks[inp.name] = len(dims) if dims is not None else None
+
+    sess = ort.InferenceSession(model_proto.SerializeToString(), providers=["CPUExecutionProvider"])
+    ranges = {}
+    for feed in feeds:
+        for sample in _split_samples(feed, input_ranks):
+            results = sess.run(tensor_names, sample)
+            for name, val in zip(tensor_names, results):
+                low, high = float(np.min(val)), float(np.max(val))
+                if name in ranges:
+                    low, high = min(low, ranges[name][0]), max(high, ranges[name][1])
+                ranges[name] = (low, high)
+    return ranges
+
+
+def _get_weight_axis(node, rank, per_channel):
+    """Return the axis of the output channels of the weight of node, None for per tensor quantization."""
+    if not per_channel or rank < 2:
+        return None
+    if node.type == "Conv":
+        return 0
+    if node.type == "Gemm":
+        return 0 if node.get_attr_value("transB", 0) else 1
+    # MatMul, only the last dim of the weight is an output channel
+    return rank - 1
+
+
+def quantize_weight(w, axis=None):
+    """Quantize w symmetrically to int8, per channel along axis if it's given.
+       Return the quantized weight and its scale.
+    """
+    if axis is None:
+        max_abs = np.max(np.abs(w))
+    else:
+        reduce_axes = tuple(i for i in range(w.ndim) if i != axis)
+        max_abs = np.max(np.abs(w), axis=reduce_axes)
+    scale = (max_abs / _INT8_MAX).astype(np.float32)
+    scale = np.where(scale == 0, np.float32(1), scale).astype(np.float32)
+    shape = [1] * w.ndim
+    if axis is not None:
+        shape[axis] = -1
+    w_quant = np.clip(np.round(w / scale.reshape(shape)), -_INT8_MAX, _INT8_MAX).astype(np.int8)
+    return w_quant, scale
+
+
+def get_activation_params(low, high):
+    """Return the scale and zero point to quantize a tensor in [low, high] asymmetrically to uint8."""
+    # zero must be exactly representable, zero paddings and relus depend on it
+    low, high = min(low, 0.), max(high, 0.)
+    scale = np.float32((high - low) / _UINT8_MAX)
+    if scale == 0:
+        scale = np.float32(1)
+    zero_point = np.uint8(np.clip(np.round(-low / scale), 0, _UINT8_MAX))
+    return scale, zero_point
+
+
+def _is_dequantized(g, name):
+    # tensors already quantized, e.g. by the rewriter of tensorflow fake quant ops
+    node = g.get_node_by_output(name)
+    return node is not None and node.type == "DequantizeLinear"
+
+
+def _insert_qdq(g, name, consumers, scale, zero_point):
+    shape = g.get_shape(name)
+    scale_const = g.make_const(utils.make_name(name + "_scale"), np.array(scale, dtype=np.float32))
+    zp_const = g.make_const(utils.make_name(name + "_zero_point"), np.array(zero_point, dtype=np.uint8))
+    quant = g.make_node("QuantizeLinear", [name, scale_const.output[0], zp_const.output[0]],
+                        op_name_scope=name, shapes=[shape], dtypes=[TensorProto.UINT8])
+    dequant = g.make_node("DequantizeLinear", [quant.output[0], scale_const.output[0], zp_const.output[0]],
+                          op_name_scope=name, shapes=[shape], dtypes=[TensorProto.FLOAT])
+    for node, idx in consumers:
+        g.replace_input(node, name, dequant.output[0], idx)
+
+
+def _quantize_weight_input(g, node, idx, per_channel, dequantized):
+    name = node.input[idx]
+    w = node.inputs[idx].get_tensor_value(as_list=False)
+    axis = _get_weight_axis(node, w.ndim, per_channel)
+    # weights shared by several consumers are quantized once per axis
+    if (name, axis) not in dequantized:
+        w_quant, scale = quantize_weight(w, axis)
+        attr = {"axis": axis} if axis is not None else {}
+        w_const = g.make_const(utils.make_name(name + "_quantized"), w_quant)
+        scale_const = g.make_const(utils.make_name(name + "_scale"), scale)
+        zp_const = g.make_const(utils.make_name(name + "_zero_point"), np.zeros(scale.shape, dtype=np.int8))
+        dequant = g.make_node("DequantizeLinear", [w_const.output[0], scale_const.output[0], zp_const.output[0]],
+                              attr=attr, op_name_scope=name, shapes=[list(w.shape)], dtypes=[TensorProto.FLOAT])
+        dequantized[(name, axis)] = dequant.output[0]
+    g.replace_input(node, name, dequantized[(name, axis)], idx)
+
+
+def quantize_graph(g, feeds=None, per_channel=True):
+    """Quantize the inputs of the ops in QUANTIZABLE_OPS of graph g in the QDQ format.
+       Float weights are quantized to int8, per output channel if per_channel is set.
+       Activations are quantized to uint8 with ranges calibrated by running g on feeds in onnxruntime,
+       they stay in float if feeds is not given. Tensors which already come from a DequantizeLinear,
+       like the ones of tensorflow fake quant ops, are kept as they are. The body graphs of Loop, If and Scan
+       aren't quantized, their activations can't be calibrated as outputs of g.
+    """
+    utils.make_sure(g.opset >= 10, "Opset >= 10 is required for QuantizeLinear/DequantizeLinear")
+    if per_channel and g.opset < 13:
+        logger.warning("Opset >= 13 is required for per channel quantization, weights are quantized per tensor")
+        per_channel = False
+
+    weights = []
+    # activations mapped to their consumers
+    activations = {}
+    for node in g.get_nodes():
+        if node.type not in QUANTIZABLE_OPS or not utils.is_onnx_domain(node.domain):
+            continue
+        weight_idx = QUANTIZABLE_OPS[node.type]
+        for idx, inp in enumerate(node.input[:weight_idx + 1]):
+            if g.get_dtype(inp) != TensorProto.FLOAT or _is_dequantized(g, inp):
+                continue
+            producer = node.inputs[idx]
+            if producer is not None and producer.is_const():
+                if idx == weight_idx and producer.get_tensor_value(as_list=False).size >= MIN_WEIGHT_SIZE:
+                    weights.append((node, idx))
+            else:
+                activations.setdefault(inp, []).append((node, idx))
+
+    if feeds and activations:
+        names = list(activations.keys())
+        ranges = calibrate(g, names, feeds)
+        for name in names:
+            scale, zero_point = get_activation_params(*ranges[name])
+            _insert_qdq(g, name, activations[name], scale, zero_point)
+
+    dequantized = {}
+    for node, idx in weights:
+        _quantize_weight_input(g, node, idx, per_channel, dequantized)
+
+    logger.info("quantized %d weights and %d activations", len(weights), len(activations) if feeds else 0)
+    return g
@@ -12,6 +12,8 @@ from tf2onnx.rewriter.dropout_rewriter import rewrite_dropout
 from tf2onnx.rewriter.eye_rewriter import rewrite_eye
 from tf2onnx.rewriter.flatten_rewriter import rewrite_flatten
 from tf2onnx.rewriter.gemm_rewriter import rewrite_gemm
+from tf2onnx.rewriter.keras_rnn_rewriter import rewrite_keras_rnn
+from tf2onnx.rewriter.layer_norm_rewriter import rewrite_layer_norm
 from tf2onnx.rewriter.leakyrelu_rewriter import rewrite_leakyrelu
 from tf2onnx.rewriter.random_normal_rewriter import rewrite_random_normal
 from tf2onnx.rewriter.random_uniform import rewrite_random_uniform, rewrite_random_uniform_fold_const
@@ -22,6 +24,7 @@ from tf2onnx.rewriter.thresholded_relu_rewriter import rewrite_thresholded_relu
 from tf2onnx.rewriter.transpose_rewriter import rewrite_transpose
 from tf2onnx.rewriter.conv2d_with_add_rewriter import rewrite_biasadd_with_conv2d
 from tf2onnx.rewriter.quantization_ops_rewriter import rewrite_quantize_and_dequantize
+from tf2onnx.rewriter.transformer_rewriter import rewrite_transformer
 
 
 __all__ = [
@@ -31,6 +34,8 @@ __all__ = [
     "rewrite_eye",
     "rewrite_flatten",
     "rewrite_gemm",
+    "rewrite_keras_rnn",
+    "rewrite_layer_norm",
     "rewrite_leakyrelu",
     "rewrite_random_normal",
     "rewrite_random_uniform",
@@ -44,5 +49,6 @@ __all__ = [
     "rewrite_custom_rnn_cell",
     "rewrite_generic_loop",
     "rewrite_biasadd_with_conv2d",
-    "rewrite_quantize_and_dequantize"
+    "rewrite_quantize_and_dequantize",
+    "rewrite_transformer",
 ]
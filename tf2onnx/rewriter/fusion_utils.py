@@ -0,0 +1,54 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.rewriter.fusion_utils - helpers to match tensorflow subgraphs fused into a single op
+"""
+
+import numpy as np
+
+# pylint: disable=missing-docstring
+
+ADD_OPS = ["Add", "AddV2"]
+
+
+def is_alive(g, nodes):
+    """Check if nodes are still in the graph, they might have been removed by an earlier rewrite."""
+    return all(g.get_node_by_name(n.name) is n for n in nodes)
+
+
+def get_scalar_value(node):
+    """Return the value of a const node holding a single element, None otherwise."""
+    if node is None or not node.is_const():
+        return None
+    val = node.get_tensor_value(as_list=False)
+    if val.size != 1:
+        return None
+    return float(val.flatten()[0])
+
+
+def is_scalar_value(node, value, rtol=1e-4):
+    val = get_scalar_value(node)
+    return val is not None and np.isclose(val, value, rtol=rtol)
+
+
+def split_const_input(node):
+    """For a binary node with one const input, return (other input node, const node)."""
+    if node is None or len(node.inputs) != 2:
+        return None, None
+    first, second = node.inputs
+    if second is not None and second.is_const():
+        return first, second
+    if first is not None and first.is_const():
+        return second, first
+    return None, None
+
+
+def is_filled_with(node, value):
+    """Check if node is a const or a Fill with all elements equal to value."""
+    if node is None:
+        return False
+    if node.is_const():
+        val = node.get_tensor_value(as_list=False)
+        return val.size > 0 and np.all(val == value)
+    return node.type == "Fill" and is_scalar_value(node.inputs[1], value)
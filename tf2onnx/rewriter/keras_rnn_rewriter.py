@@ -0,0 +1,571 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.rewriter.keras_rnn_rewriter - rewrite the while loops of tf2 keras LSTM and GRU layers
+into onnx LSTM and GRU.
+
+In tf2 keras runs the cell in a StatelessWhile whose body is a function, reading the input from
+a TensorList and writing the outputs to another one. Functions are converted before the graphs
+using them, so the rewrite happens in two steps: in the body function the cell is matched and
+recorded in Graph.rnn_cell_context, in the graph with the While the loop is checked to run the
+cell exactly once per time step and is replaced by the rnn op.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+
+import numpy as np
+
+from tf2onnx import utils
+from tf2onnx.graph_builder import GraphBuilder
+from tf2onnx.rewriter import rnn_utils
+from tf2onnx.tf_loader import find_function
+
+logger = logging.getLogger(__name__)
+
+# pylint: disable=invalid-name,unused-argument,missing-docstring
+
+_ADD_OPS = ["Add", "AddV2"]
+_ACTIVATIONS = ["Sigmoid", "Tanh", "Relu"]
+# activations onnx uses if the attribute is not given
+_DEFAULT_ACTIVATIONS = {
+    "LSTM": ["Sigmoid", "Tanh", "Tanh"],
+    "GRU": ["Sigmoid", "Tanh"],
+}
+
+
+def rewrite_keras_rnn(g, ops):
+    rnn_nodes = []
+    for node in ops:
+        if node.type in ["While", "StatelessWhile"] and g.get_node_by_name(node.name) is not None:
+            rnn_node = _rewrite_while(g, node)
+            if rnn_node is not None:
+                rnn_nodes.append(rnn_node)
+    if rnn_nodes:
+        _merge_bidirectional(g, rnn_nodes)
+
+    # in case g is the body of a while loop, the loop is rewritten when its graph is converted
+    g.rnn_cell_context = _match_cell(g)
+    return g.get_nodes()
+
+
+######################################################
+####      Matching the cell in the loop body     #######
+######################################################
+
+def _resolve(g, name):
+    """Return the tensor name is an Identity of, or name itself."""
+    node = g.get_node_by_output(name)
+    while node is not None and node.type == "Identity":
+        name = node.input[0]
+        node = g.get_node_by_output(name)
+    return name
+
+
+def _get_node(g, name, op_types):
+    node = g.get_node_by_output(name)
+    if node is None or node.type not in op_types:
+        return None
+    return node
+
+
+def _binary_inputs(g, name, op_types):
+    """Return both orders of the inputs of the binary op computing name."""
+    node = _get_node(g, name, op_types)
+    if node is None or len(node.input) != 2:
+        return []
+    a, b = [_resolve(g, inp) for inp in node.input]
+    return [(a, b), (b, a)]
+
+
+def _activation(g, name):
+    """Return the type and the input of the activation computing name."""
+    node = _get_node(g, name, _ACTIVATIONS)
+    if node is None:
+        return None, None
+    return node.type, _resolve(g, node.input[0])
+
+
+def _is_graph_input(g, name):
+    node = g.get_node_by_output(name)
+    return node is not None and node.is_graph_input()
+
+
+def _is_const_value(g, name, value):
+    node = g.get_node_by_output(name)
+    if node is None or not node.is_const():
+        return False
+    val = node.get_tensor_value(as_list=False)
+    return val.size == 1 and val.flatten()[0] == value
+
+
+def _match_split(g, names):
+    """If names are all outputs of a Split on the last axis in order, return the input of the Split."""
+    split = _get_node(g, names[0], ["Split"])
+    if split is None or list(split.output) != names:
+        return None
+    axis = split.inputs[0]
+    if not axis.is_const() or axis.get_tensor_value() not in [1, -1]:
+        return None
+    return _resolve(g, split.input[1])
+
+
+def _match_matmul(g, name):
+    """Return the inputs of the MatMul computing name, if the weight is a graph input."""
+    node = _get_node(g, name, ["MatMul"])
+    if node is None or node.get_attr_value("transpose_a") or node.get_attr_value("transpose_b"):
+        return None
+    inputs = [_resolve(g, inp) for inp in node.input]
+    if not _is_graph_input(g, inputs[1]):
+        return None
+    return inputs
+
+
+def _match_bias_add(g, name):
+    """Return input and bias of the BiasAdd computing name, the bias is None if there is no BiasAdd."""
+    node = _get_node(g, name, ["BiasAdd"])
+    if node is None:
+        return name, None
+    bias = _resolve(g, node.input[1])
+    if not _is_graph_input(g, bias):
+        return None, None
+    return _resolve(g, node.input[0]), bias
+
+
+def _match_lstm_projection(g, z):
+    """z = x @ W + h @ R [+ b], return x, h, W, R, b."""
+    z, bias = _match_bias_add(g, z)
+    if z is None:
+        return None
+    for x_proj, h_proj in _binary_inputs(g, z, _ADD_OPS):
+        x_w, h_r = _match_matmul(g, x_proj), _match_matmul(g, h_proj)
+        if x_w and h_r:
+            return x_w + h_r + [bias]
+    return None
+
+
+def _match_lstm_cell(g, h_new):
+    # h = o * act_h(c), c = f * c_prev + i * act_g(z_c), i/f/o = act_f(z_i/z_f/z_o)
+    for o, act_c in _binary_inputs(g, h_new, ["Mul"]):
+        act_f, z_o = _activation(g, o)
+        act_h, c_new = _activation(g, act_c)
+        if act_f is None or act_h is None:
+            continue
+        for f_c, i_g in _binary_inputs(g, c_new, _ADD_OPS):
+            for f, c_prev in _binary_inputs(g, f_c, ["Mul"]):
+                for i, g_t in _binary_inputs(g, i_g, ["Mul"]):
+                    (act_f1, z_f), (act_f2, z_i), (act_g, z_c) = [_activation(g, n) for n in [f, i, g_t]]
+                    if act_g is None or act_f1 != act_f or act_f2 != act_f or not _is_graph_input(g, c_prev):
+                        continue
+                    z = _match_split(g, [z_i, z_f, z_c, z_o])
+                    projection = _match_lstm_projection(g, z) if z else None
+                    if projection is None:
+                        continue
+                    x_t, kernel, h_prev, recurrent_kernel, bias = projection
+                    return {
+                        "type": "LSTM",
+                        "x_t": x_t,
+                        "states": [h_prev, c_prev],
+                        "new_states": [h_new, c_new],
+                        "weights": [kernel, recurrent_kernel, bias],
+                        "activations": [act_f, act_g, act_h],
+                    }
+    return None
+
+
+def _match_gru_cell(g, h_new):
+    # h = z * h_prev + (1 - z) * hh, hh = act_g(x_h + r * (h @ R_h + b_rh)), z/r = act_f(x_z/x_r + h_z/h_r)
+    for z_h, z_hh in _binary_inputs(g, h_new, _ADD_OPS):
+        for z, h_prev in _binary_inputs(g, z_h, ["Mul"]):
+            for one_minus_z, hh in _binary_inputs(g, z_hh, ["Mul"]):
+                sub = _get_node(g, one_minus_z, ["Sub"])
+                if sub is None or not _is_const_value(g, sub.input[0], 1) or _resolve(g, sub.input[1]) != z:
+                    continue
+                act_f, z_sum = _activation(g, z)
+                act_g, h_sum = _activation(g, hh)
+                if act_f is None or act_g is None or not _is_graph_input(g, h_prev):
+                    continue
+                match = _match_gru_gates(g, z_sum, h_sum, act_f)
+                if match is None:
+                    continue
+                x_t, kernel, input_bias, h, recurrent_kernel, recurrent_bias = match
+                if h != h_prev:
+                    continue
+                return {
+                    "type": "GRU",
+                    "x_t": x_t,
+                    "states": [h_prev],
+                    "new_states": [h_new],
+                    "weights": [kernel, recurrent_kernel, input_bias, recurrent_bias],
+                    "activations": [act_f, act_g],
+                }
+    return None
+
+
+def _match_gru_gates(g, z_sum, h_sum, act_f):
+    """Match the gates of a GRU with reset_after, return x, W, b_x, h, R, b_h."""
+    for x_h, r_h in _binary_inputs(g, h_sum, _ADD_OPS):
+        for r, h_h in _binary_inputs(g, r_h, ["Mul"]):
+            act, r_sum = _activation(g, r)
+            if act != act_f:
+                continue
+            for x_z, h_z in _binary_inputs(g, z_sum, _ADD_OPS):
+                for x_r, h_r in _binary_inputs(g, r_sum, _ADD_OPS):
+                    x_proj, h_proj = _match_split(g, [x_z, x_r, x_h]), _match_split(g, [h_z, h_r, h_h])
+                    if x_proj is None or h_proj is None:
+                        continue
+                    x_proj, input_bias = _match_bias_add(g, x_proj)
+                    h_proj, recurrent_bias = _match_bias_add(g, h_proj)
+                    x_w = _match_matmul(g, x_proj) if x_proj else None
+                    h_r = _match_matmul(g, h_proj) if h_proj else None
+                    if x_w and h_r:
+                        return [x_w[0], x_w[1], input_bias, h_r[0], h_r[1], recurrent_bias]
+    return None
+
+
+def _match_cell(g):
+    """Match the body of a keras rnn loop, return the description of the cell or None."""
+    set_items = [n for n in g.get_nodes() if n.type == "TensorListSetItem"]
+    if len(set_items) != 1:
+        return None
+    set_item = set_items[0]
+    tensor_list, index, h_new = [_resolve(g, inp) for inp in set_item.input[:3]]
+    if not _is_graph_input(g, tensor_list):
+        return None
+    # without return_sequences keras overwrites the only element of the list in every step
+    last_output_only = _is_const_value(g, index, 0)
+    if not last_output_only and not _is_graph_input(g, index):
+        return None
+
+    context = _match_lstm_cell(g, h_new) or _match_gru_cell(g, h_new)
+    if context is None:
+        return None
+    get_item = _get_node(g, context["x_t"], ["TensorListGetItem"])
+    if get_item is None:
+        return None
+    time = _resolve(g, get_item.input[1])
+    if not _is_graph_input(g, time) or not last_output_only and time != index:
+        return None
+    x = _resolve(g, get_item.input[0])
+    if not _is_graph_input(g, x):
+        return None
+
+    # tensors computed as t + 1, to find the step of the time
+    increments = {}
+    for n in g.get_nodes():
+        for a, b in _binary_inputs(g, n.output[0], _ADD_OPS):
+            if _is_const_value(g, b, 1):
+                increments[n.output[0]] = a
+
+    context.update({
+        "x": x,
+        "time": time,
+        "tensor_list": tensor_list,
+        "set_item": set_item.output[0],
+        "last_output_only": last_output_only,
+        "increments": increments,
+        # loop body outputs are in the same order as its inputs, which is known after conversion
+        "outputs": [_resolve(g, out) for out in g.outputs],
+    })
+    logger.debug("found keras %s cell", context["type"])
+    return context
+
+
+######################################################
+####      Rewriting the while loop                #######
+######################################################
+
+def _resolve_cond(g):
+    """Return the names of the inputs of cond graph compared by its Less."""
+    name = g.outputs[0]
+    node = g.get_node_by_output(name)
+    while node is not None and node.type in ["Identity", "Cast"]:
+        node = node.inputs[0]
+    if node is None or node.type != "Less":
+        return None
+    inputs = []
+    for inp in node.input:
+        n = g.get_node_by_output(inp)
+        while n is not None and n.type in ["Identity", "Cast"]:
+            inp = n.input[0]
+            n = n.inputs[0]
+        inputs.append(inp)
+    return inputs
+
+
+def _get_const_value(g, name):
+    node = g.get_node_by_output(name)
+    if node is None or not node.is_const():
+        return None
+    return node.get_tensor_value(as_list=False)
+
+
+def _is_time_reverse(g, node, axis):
+    if node is None or node.type != "ReverseV2":
+        return False
+    val = _get_const_value(g, node.input[1])
+    return val is not None and val.flatten().tolist() in [[axis], [axis - 3]]
+
+
+def _find_reverse_of_output(g, name):
+    """Find the ReverseV2 on the time axis the stacked outputs end in, following Transpose and Identity."""
+    axis = 0
+    while True:
+        consumers = g.find_output_consumers(name)
+        if len(consumers) != 1:
+            return None
+        node = consumers[0]
+        if _is_time_reverse(g, node, axis):
+            return node
+        if node.type == "Transpose":
+            perm = _get_const_value(g, node.input[1])
+            if perm is None:
+                return None
+            axis = perm.tolist().index(axis)
+        elif node.type != "Identity":
+            return None
+        name = node.output[0]
+
+
+def _runs_once_per_step(g, while_node, limit, x):
+    """Check the loop with condition time < limit runs over all steps of x."""
+    x_shape = g.get_shape(x)
+    seq_len = x_shape[0] if x_shape else -1
+    limit_val = _get_const_value(g, limit)
+    if limit_val is not None:
+        if limit_val.size != 1 or limit_val.flatten()[0] != seq_len:
+            return False
+    else:
+        # tf.shape(x)[0]
+        node = _get_node(g, limit, ["StridedSlice"])
+        if node is None or node.get_attr_value("shrink_axis_mask") != 1:
+            return False
+        begin, end, strides = [_get_const_value(g, inp) for inp in node.input[1:]]
+        if any(v is None or v.flatten().tolist() != e for v, e in zip([begin, end, strides], [[0], [1], [1]])):
+            return False
+        shape = _get_node(g, node.input[0], ["Shape"])
+        if shape is None:
+            return False
+        shape_of = _resolve(g, shape.input[0])
+        x_node = g.get_node_by_output(x)
+        if shape_of != x and not (_is_time_reverse(g, x_node, 0) and _resolve(g, x_node.input[0]) == shape_of):
+            return False
+
+    max_iterations = _get_const_value(g, while_node.input[1])
+    if max_iterations is None:
+        return while_node.input[1] == limit
+    max_iterations = max_iterations.flatten()[0]
+    return max_iterations == -1 or limit_val is not None and max_iterations >= limit_val.flatten()[0]
+
+
+def _reorder_lstm_gates(val):
+    # keras orders the gates on the last axis as i, f, c, o, onnx as i, o, f, c
+    i, f, c, o = np.split(val, 4, axis=-1)
+    return np.concatenate([i, o, f, c], axis=-1)
+
+
+def _make_weights(context, kernel, recurrent_kernel, biases):
+    """Return W, R and B of the onnx rnn op."""
+    num_gates = 4 if context["type"] == "LSTM" else 3
+    hidden_size = recurrent_kernel.shape[0]
+    if kernel.shape[1] != num_gates * hidden_size or recurrent_kernel.shape[1] != num_gates * hidden_size:
+        return None
+    biases = [np.zeros([num_gates * hidden_size], dtype=kernel.dtype) if b is None else b for b in biases]
+    if any(b.shape != (num_gates * hidden_size,) for b in biases):
+        return None
+    if context["type"] == "LSTM":
+        kernel, recurrent_kernel = _reorder_lstm_gates(kernel), _reorder_lstm_gates(recurrent_kernel)
+        # keras has a single bias, onnx a bias for the input and one for the recurrence
+        biases = [_reorder_lstm_gates(biases[0]), np.zeros_like(biases[0])]
+    w = np.expand_dims(kernel.transpose(), 0)
+    r = np.expand_dims(recurrent_kernel.transpose(), 0)
+    b = np.expand_dims(np.concatenate(biases), 0)
+    return w, r, b
+
+
+def _make_initial_state(g, name):
+    # tf state is [batch, hidden], onnx state is [num_directions, batch, hidden]
+    val = _get_const_value(g, name)
+    if val is not None:
+        return g.make_const(utils.make_name("initial_state"), np.expand_dims(val, 0)).output[0]
+    return GraphBuilder(g).make_unsqueeze({"data": name, "axes": [0]})
+
+
+def _rewrite_while(g, while_node):
+    body = find_function(while_node.get_attr_str("body"))
+    cond = find_function(while_node.get_attr_str("cond"))
+    context = body.rnn_cell_context if body is not None else None
+    if context is None or cond is None:
+        return None
+    names = [context["x"], context["time"], context["tensor_list"]] + context["states"] + \
+            [w for w in context["weights"] if w]
+    if not all(n in body.func_inputs for n in names):
+        return None
+    index = {n: body.func_inputs.index(n) for n in names}
+    outputs = context["outputs"]
+
+    def is_loop_invariant(name):
+        return outputs[index[name]] == name
+
+    # the body computes the next states and time, and passes through input and weights
+    if any(outputs[index[s]] != new for s, new in zip(context["states"], context["new_states"])):
+        return None
+    if outputs[index[context["tensor_list"]]] != context["set_item"]:
+        return None
+    if context["increments"].get(outputs[index[context["time"]]]) != context["time"]:
+        return None
+    if not all(is_loop_invariant(n) for n in [context["x"]] + [w for w in context["weights"] if w]):
+        return None
+
+    # the cond is time < limit
+    cond_inputs = _resolve_cond(cond)
+    if cond_inputs is None or not all(n in cond.func_inputs for n in cond_inputs):
+        return None
+    time_idx, limit_idx = [cond.func_inputs.index(n) for n in cond_inputs]
+    if time_idx != index[context["time"]] or outputs[limit_idx] != body.func_inputs[limit_idx]:
+        return None
+    if not _is_const_value(g, while_node.input[time_idx], 0):
+        return None
+
+    from_tensor = _get_node(g, while_node.input[index[context["x"]]], ["TensorListFromTensor"])
+    reserve = _get_node(g, while_node.input[index[context["tensor_list"]]], ["TensorListReserve"])
+    if from_tensor is None or reserve is None:
+        return None
+    x = from_tensor.input[0]
+    if not _runs_once_per_step(g, while_node, while_node.input[limit_idx], x):
+        return None
+
+    # only the outputs and the states may be used after the loop
+    output_idx = index[context["tensor_list"]]
+    state_idx = [index[s] for s in context["states"]]
+    for i, out in enumerate(while_node.output):
+        consumers = g.find_output_consumers(out)
+        if i == output_idx:
+            if any(c.type != "TensorListStack" for c in consumers):
+                return None
+        elif i not in state_idx and consumers:
+            return None
+    stacks = g.find_output_consumers(while_node.output[output_idx])
+
+    weights = [_get_const_value(g, while_node.input[index[w]]) if w else None for w in context["weights"]]
+    if any(w is None for w, name in zip(weights, context["weights"]) if name):
+        return None
+    weights = _make_weights(context, weights[0], weights[1], weights[2:])
+    if weights is None:
+        return None
+
+    # keras runs backward layers on the reversed input and reverses the outputs afterwards,
+    # a reverse onnx rnn makes both reverses unnecessary
+    direction = "forward"
+    reverses = [] if context["last_output_only"] else [_find_reverse_of_output(g, s.output[0]) for s in stacks]
+    if _is_time_reverse(g, g.get_node_by_output(x), 0) and all(reverses):
+        direction = "reverse"
+        x = g.get_node_by_output(x).input[0]
+        for rev in reverses:
+            g.replace_all_inputs(rev.output[0], rev.input[0])
+
+    logger.debug("rewrite %s into %s %s", while_node.name, direction, context["type"])
+    rnn_type = context["type"]
+    w, r, b = weights
+    hidden_size = r.shape[2]
+    attr = {"direction": direction, "hidden_size": hidden_size}
+    if context["activations"] != _DEFAULT_ACTIVATIONS[rnn_type]:
+        attr["activations"] = context["activations"]
+    if rnn_type == "GRU":
+        attr["linear_before_reset"] = 1
+
+    w_const = g.make_const(utils.make_name("W"), w)
+    r_const = g.make_const(utils.make_name("R"), r)
+    b_const = g.make_const(utils.make_name("B"), b)
+    initial_states = [_make_initial_state(g, while_node.input[i]) for i in state_idx]
+    x_shape = g.get_shape(x)
+    seq_len, batch_size = x_shape[:2] if x_shape else (-1, -1)
+    dtype = g.get_dtype(x)
+    state_shape = [1, batch_size, hidden_size]
+    rnn_node = g.make_node(rnn_type, [x, w_const.output[0], r_const.output[0], b_const.output[0], ""] +
+                           initial_states, attr=attr, output_count=1 + len(state_idx),
+                           shapes=[[seq_len, 1, batch_size, hidden_size]] + [state_shape] * len(state_idx),
+                           dtypes=[dtype] * (1 + len(state_idx)), op_name_scope=while_node.name)
+
+    gb = GraphBuilder(g)
+    if stacks and context["last_output_only"]:
+        # the stacked list has the last output only, which is Y_h of shape [1, batch, hidden]
+        for stack in stacks:
+            g.replace_all_inputs(stack.output[0], rnn_node.output[1])
+    elif stacks:
+        y = gb.make_squeeze({"data": rnn_node.output[0], "axes": [1]},
+                            shapes=[[seq_len, batch_size, hidden_size]], dtypes=[dtype])
+        for stack in stacks:
+            g.replace_all_inputs(stack.output[0], y)
+    for i, state_output in zip(state_idx, rnn_node.output[1:]):
+        if g.find_output_consumers(while_node.output[i]):
+            state = gb.make_squeeze({"data": state_output, "axes": [0]},
+                                    shapes=[[batch_size, hidden_size]], dtypes=[dtype])
+            g.replace_all_inputs(while_node.output[i], state)
+
+    for stack in stacks:
+        g.remove_node(stack.name)
+    g.remove_node(while_node.name)
+    return rnn_node
+
+
+######################################################
+####      Merging into bidirectional rnn          #######
+######################################################
+
+def _input_key(g, name):
+    """Key of a tensor, equal for tensors computing the same value by Identity or Transpose."""
+    node = g.get_node_by_output(name)
+    while node is not None and node.type == "Identity":
+        name = node.input[0]
+        node = g.get_node_by_output(name)
+    if node is not None and node.type == "Transpose":
+        perm = _get_const_value(g, node.input[1])
+        if perm is not None:
+            return ("Transpose", tuple(perm.tolist()), _input_key(g, node.input[0]))
+    return name
+
+
+def _merge_bidirectional(g, rnn_nodes):
+    forward = [n for n in rnn_nodes if n.get_attr_value("direction") == b"forward"]
+    backward = [n for n in rnn_nodes if n.get_attr_value("direction") == b"reverse"]
+    for bw in backward:
+        for fw in forward:
+            if fw.type != bw.type or _input_key(g, fw.input[0]) != _input_key(g, bw.input[0]):
+                continue
+            if any(fw.get_attr_value(a) != bw.get_attr_value(a)
+                   for a in ["hidden_size", "activations", "linear_before_reset"]):
+                continue
+            forward.remove(fw)
+            _make_bidirectional(g, fw, bw)
+            break
+
+
+def _make_bidirectional(g, fw, bw):
+    logger.debug("merge %s and %s into bidirectional %s", fw.name, bw.name, fw.type)
+    weights = [np.concatenate([rnn_utils.get_np_val_for_const(g, fw, i), rnn_utils.get_np_val_for_const(g, bw, i)])
+               for i in [1, 2, 3]]
+    inputs = [fw.input[0]] + [g.make_const(utils.make_name(n), w).output[0] for n, w in zip("WRB", weights)] + [""]
+    for fw_state, bw_state in zip(fw.input[5:], bw.input[5:]):
+        inputs.append(rnn_utils.process_single_init_node(g, fw_state, bw_state, []).output[0])
+
+    attr = {"direction": "bidirectional", "hidden_size": fw.get_attr_value("hidden_size")}
+    activations = fw.get_attr_value("activations")
+    if activations:
+        attr["activations"] = [a.decode() for a in activations] * 2
+    if fw.type == "GRU":
+        attr["linear_before_reset"] = 1
+    shapes = [fw.output_shapes[0][:1] + [2] + fw.output_shapes[0][2:]] + \
+             [[2] + shape[1:] for shape in fw.output_shapes[1:]]
+    bi_node = g.make_node(fw.type, inputs, attr=attr, output_count=len(fw.output), shapes=shapes,
+                          dtypes=fw.output_dtypes, op_name_scope=fw.name)
+
+    to_remove = [fw.name, bw.name] + [n.input[i] for n in [fw, bw] for i in [1, 2, 3]]
+    for i in range(len(fw.output)):
+        rnn_utils.slice_birnn_for_original_rnn_consumers(g, fw, bw, bi_node, i, [], to_remove)
+    for name in to_remove:
+        g.remove_node(name)
@@ -0,0 +1,274 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.rewriter - rewrite tensorflow LayerNorm subgraphs to onnx LayerNormalization op,
+or to the minimal formulation with reduce ops for opsets without it
+"""
+
+import numpy as np
+from tf2onnx import logging, utils
+from tf2onnx.rewriter.fusion_utils import ADD_OPS, is_alive, get_scalar_value, split_const_input, is_filled_with
+
+logger = logging.getLogger(__name__)
+
+
+# pylint: disable=missing-docstring
+
+_CANDIDATE_OPS = ADD_OPS + ["Mul", "Reshape"]
+
+
+def rewrite_layer_norm(g, ops):
+    for node in list(ops):
+        if node.type not in _CANDIDATE_OPS or not is_alive(g, [node]):
+            continue
+        match = match_layer_norm(g, node)
+        if match is None:
+            continue
+        if not g.is_safe_to_remove_nodes(match["nodes"], outputs_to_ignore=[match["output"]]):
+            continue
+        shape = g.get_shape(match["input"])
+        norm_shape = shape[match["axis"]:]
+        if g.opset >= 17 and all(d > 0 for d in norm_shape):
+            output = _make_layer_norm(g, match, norm_shape)
+        else:
+            output = _make_decomposed_layer_norm(g, match, len(shape))
+        logger.debug("rewrite %s to LayerNormalization", g.get_node_by_output(match["output"]).name)
+        g.replace_all_inputs(match["output"], output)
+        g.safe_remove_nodes(match["nodes"])
+    return ops
+
+
+def get_layer_norm_param(node, norm_shape, default):
+    """Return the value of gamma or beta with the normalized shape."""
+    if node is None:
+        return np.full(norm_shape, default)
+    val = node.get_tensor_value(as_list=False)
+    if val.size == 1:
+        return np.full(norm_shape, val.flatten()[0])
+    return val.reshape(norm_shape)
+
+
+def _make_layer_norm(g, match, norm_shape):
+    output = match["output"]
+    dtype = g.get_dtype(output)
+    gamma = get_layer_norm_param(match["gamma"], norm_shape, 1)
+    beta = get_layer_norm_param(match["beta"], norm_shape, 0)
+    np_dtype = utils.map_onnx_to_numpy_type(dtype)
+    inputs = [match["input"], g.make_const(utils.make_name("gamma"), gamma.astype(np_dtype)).output[0]]
+    if match["beta"] is not None:
+        inputs.append(g.make_const(utils.make_name("beta"), beta.astype(np_dtype)).output[0])
+    node = g.make_node("LayerNormalization", inputs, attr={"axis": match["axis"], "epsilon": match["epsilon"]},
+                       op_name_scope=g.get_node_by_output(output).name,
+                       shapes=[g.get_shape(output)], dtypes=[dtype])
+    return node.output[0]
+
+
+def _make_decomposed_layer_norm(g, match, rank):
+    # d = x - mean(x), y = d / sqrt(mean(d * d) + epsilon) * gamma + beta
+    output = match["output"]
+    name = g.get_node_by_output(output).name
+    dtype = g.get_dtype(output)
+    shape = g.get_shape(match["input"])
+    np_dtype = utils.map_onnx_to_numpy_type(dtype)
+    axes = list(range(match["axis"], rank))
+    reduced_shape = shape[:match["axis"]] + [1] * len(axes)
+
+    def make(op_type, inputs, attr=None, out_shape=None):
+        return g.make_node(op_type, inputs, attr=attr, op_name_scope=name,
+                           shapes=[out_shape or shape], dtypes=[dtype]).output[0]
+
+    mean = make("ReduceMean", [match["input"]], {"axes": axes, "keepdims": 1}, reduced_shape)
+    diff = make("Sub", [match["input"], mean])
+    variance = make("ReduceMean", [make("Mul", [diff, diff])], {"axes": axes, "keepdims": 1}, reduced_shape)
+    epsilon = g.make_const(utils.make_name("epsilon"), np.array(match["epsilon"], dtype=np_dtype))
+    std = make("Sqrt", [make("Add", [variance, epsilon.output[0]], out_shape=reduced_shape)], out_shape=reduced_shape)
+    result = make("Div", [diff, std])
+    if match["gamma"] is not None:
+        result = make("Mul", [result, match["gamma"].output[0]])
+    if match["beta"] is not None:
+        result = make("Add", [result, match["beta"].output[0]])
+    return result
+
+
+def match_layer_norm(g, node):
+    """Match the subgraph computing layer normalization whose output is produced by node.
+       TF lowers LayerNorm in two ways: with moments and batch_normalization, and for keras when the
+       normalized axes are the last ones, with a FusedBatchNormV3 working on the input reshaped to NCHW.
+       Return a dict with input, axis, epsilon, gamma and beta (const nodes or None), the nodes of the
+       subgraph and its output, or None if the subgraph isn't LayerNorm.
+       If the output is only scaled and shifted by consts, those are part of the match.
+    """
+    match = _match_layer_norm(g, node)
+    while match is not None:
+        consumers = g.find_output_consumers(match["output"])
+        if len(consumers) != 1:
+            break
+        outer = _match_layer_norm(g, consumers[0])
+        if outer is None or outer["input"] != match["input"]:
+            break
+        match = outer
+    return match
+
+
+def _match_layer_norm(g, node):
+    match = _match_moments_layer_norm(g, node) or _match_fused_batch_norm_layer_norm(g, node)
+    if match is None:
+        return None
+    input_shape = g.get_shape(match["input"])
+    norm_shape = input_shape[match["axis"]:]
+    for param in [match["gamma"], match["beta"]]:
+        if param is not None and \
+                not _is_broadcast_to(param.get_tensor_value(as_list=False), norm_shape, len(input_shape)):
+            return None
+    return match
+
+
+def _is_broadcast_to(val, norm_shape, rank):
+    """Check if gamma or beta only broadcast along the normalized dims of an input of rank rank,
+       without changing the output shape.
+    """
+    if val.ndim > rank:
+        # leading 1s beyond the rank of the input add dims to the output
+        return False
+    if val.size == 1:
+        return val.ndim <= len(norm_shape)
+    shape = list(val.shape)
+    while shape and shape[0] == 1 and len(shape) > len(norm_shape):
+        shape = shape[1:]
+    return shape == norm_shape
+
+
+def _skip_stop_gradient(node):
+    while node is not None and node.type in ["StopGradient", "Identity"]:
+        node = node.inputs[0]
+    return node
+
+
+def _get_normalized_axis(g, input_name, axes):
+    """Return the first axis if axes are the last axes of the input, None otherwise."""
+    shape = g.get_shape(input_name)
+    if shape is None or not axes:
+        return None
+    rank = len(shape)
+    axes = sorted(a + rank if a < 0 else a for a in axes)
+    if axes != list(range(rank - len(axes), rank)):
+        return None
+    return axes[0]
+
+
+def _match_moments_layer_norm(g, node):
+    # x * m + (beta - mean * m) with m = rsqrt(variance + epsilon) * gamma
+    if node.type not in ADD_OPS or None in node.inputs:
+        return None
+    for mul_x, sub in [node.inputs, node.inputs[::-1]]:
+        if mul_x.type != "Mul" or sub.type not in ["Sub", "Neg"]:
+            continue
+        beta = None
+        if sub.type == "Sub":
+            beta = sub.inputs[0]
+            if beta is None or not beta.is_const():
+                continue
+        mul_mean = sub.inputs[-1]
+        if mul_mean is None or mul_mean.type != "Mul":
+            continue
+        common = [inp for inp in mul_x.input if inp in mul_mean.input]
+        if len(common) != 1:
+            continue
+        m_name = common[0]
+        x_name = [inp for inp in mul_x.input if inp != m_name]
+        mean = [n for n in mul_mean.inputs if n.output[0] != m_name]
+        if len(x_name) != 1 or len(mean) != 1:
+            continue
+        x_name, mean = x_name[0], mean[0]
+        if mean.type != "Mean" or mean.input[0] != x_name or not mean.inputs[1].is_const():
+            continue
+
+        m = g.get_node_by_output(m_name)
+        gamma = None
+        if m.type == "Mul":
+            rsqrt, gamma = split_const_input(m)
+            if rsqrt is None:
+                continue
+        else:
+            rsqrt = m
+        if rsqrt.type != "Rsqrt" or rsqrt.inputs[0].type not in ADD_OPS:
+            continue
+        add_eps = rsqrt.inputs[0]
+        variance, eps = split_const_input(add_eps)
+        epsilon = get_scalar_value(eps)
+        if variance is None or epsilon is None or variance.type != "Mean":
+            continue
+        sq_diff = variance.inputs[0]
+        if sq_diff.type != "SquaredDifference" or sq_diff.input[0] != x_name or \
+                _skip_stop_gradient(sq_diff.inputs[1]) is not mean:
+            continue
+        axes = mean.inputs[1].get_tensor_value(as_list=False).flatten().tolist()
+        if variance.inputs[1].get_tensor_value(as_list=False).flatten().tolist() != axes:
+            continue
+        if not mean.get_attr_value("keep_dims") or not variance.get_attr_value("keep_dims"):
+            continue
+        axis = _get_normalized_axis(g, x_name, axes)
+        if axis is None:
+            continue
+
+        nodes = [node, mul_x, sub, mul_mean, mean, rsqrt, add_eps, variance, sq_diff]
+        if m is not rsqrt:
+            nodes.append(m)
+        if sq_diff.inputs[1] is not mean:
+            nodes.append(sq_diff.inputs[1])
+        return {"input": x_name, "axis": axis, "epsilon": epsilon, "gamma": gamma, "beta": beta,
+                "nodes": nodes, "output": node.output[0]}
+    return None
+
+
+def _match_fused_batch_norm_layer_norm(g, node):
+    # [beta +] [gamma *] reshape(FusedBatchNormV3(reshape(x, [1, -1, size, 1]), ones, zeros), shape(x))
+    nodes = []
+    beta = gamma = None
+    cur = node
+    if cur.type in ADD_OPS:
+        cur, beta = split_const_input(cur)
+        if cur is None:
+            return None
+        nodes.append(node)
+    if cur.type == "Mul":
+        mul = cur
+        cur, gamma = split_const_input(mul)
+        if cur is None:
+            return None
+        nodes.append(mul)
+    if cur.type != "Reshape":
+        return None
+    reshape_back = cur
+    bn = reshape_back.inputs[0]
+    if bn is None or bn.type not in ["FusedBatchNorm", "FusedBatchNormV2", "FusedBatchNormV3"]:
+        return None
+    if not bn.get_attr_value("is_training") or bn.get_attr_value("data_format") != b"NCHW":
+        return None
+    if any(g.find_output_consumers(out) for out in bn.output[1:]):
+        return None
+    if not is_filled_with(bn.inputs[1], 1) or not is_filled_with(bn.inputs[2], 0):
+        return None
+    reshape = bn.inputs[0]
+    if reshape is None or reshape.type != "Reshape":
+        return None
+    x_name = reshape.input[0]
+    x_shape = g.get_shape(x_name)
+    reshaped = g.get_shape(reshape.output[0])
+    if x_shape is None or reshaped is None or len(reshaped) != 4 or reshaped[0] != 1 or reshaped[3] != 1:
+        return None
+    if g.get_shape(reshape_back.output[0]) != x_shape or None in bn.inputs[1:3]:
+        return None
+    # find the axes flattened into the channel-inner dim
+    size = reshaped[2]
+    axis = len(x_shape)
+    while axis > 0 and size > 1 and x_shape[axis - 1] > 0 and size % x_shape[axis - 1] == 0:
+        size //= x_shape[axis - 1]
+        axis -= 1
+    if size != 1 or axis == len(x_shape):
+        return None
+
+    nodes.extend([reshape_back, bn, reshape])
+    return {"input": x_name, "axis": axis, "epsilon": bn.get_attr_value("epsilon", 1e-4), "gamma": gamma,
+            "beta": beta, "nodes": nodes, "output": node.output[0]}
@@ -46,6 +46,10 @@ class LoopRewriter(LoopRewriterBase):
             cell_g_info = context.cell_graph
             cond_g_info = context.cond_graph
 
+            if self.g.opset >= 9 and self._is_scan_loop(context):
+                # opset 8 Scan has a batch axis, so it's left to Loop
+                return self._rewrite_to_scan(context)
+
             # create a dummy loop to calculate the init condition
             init_cond_output = self._create_subgraph_initial_cond(cond_g_info)
 
@@ -53,33 +57,14 @@ class LoopRewriter(LoopRewriterBase):
 
             body_nodes = set(cell_g_info.nodes + cond_g_info.nodes)
             body_outputs = cond_g_info.outputs + cell_g_info.outputs
-            for out_tensor_value_info in body_outputs:
-                shape = out_tensor_value_info.shape
-                utils.make_sure(
-                    shape is not None,
-                    "Conversion of Loop requries output shape [{}] exists".format(out_tensor_value_info.id)
-                )
-                out_tensor_value_info.shape = utils.create_vague_shape_like(shape)
+            self._make_vague_body_output_shapes(body_outputs)
 
             loop_body_g = LoopRewriterBase.construct_graph_from_nodes(self.g, body_nodes, body_outputs)
 
             # create loop body graph inputs
             loop_body_g.add_graph_input(utils.make_name("i"), TensorProto.INT64, ())
             loop_body_g.add_graph_input(utils.make_name("cond"), TensorProto.BOOL, ())
-            for i, tensor_value_info in enumerate(loop_props.state_inputs):
-                input_name = tensor_value_info.id
-                if input_name is None:
-                    # if the variable is not used in the body graph, then we created a fake one,
-                    # the same type and shape as its corresponding output.
-                    out_tensor_value_info = loop_props.state_outputs[i]
-                    dtype = out_tensor_value_info.dtype
-                    shape = out_tensor_value_info.shape
-                    input_name = utils.make_name("unused_state_input_")
-                else:
-                    dtype = tensor_value_info.dtype
-                    shape = tensor_value_info.shape
-
-                loop_body_g.add_graph_input(input_name, dtype, utils.create_vague_shape_like(shape))
+            self._add_state_inputs(loop_body_g, loop_props)
 
             for input_ta in loop_props.tensor_array_inputs:
                 # Loop does not have scan inputs, so we use Gather to get data for each iteration.
@@ -104,6 +89,152 @@ class LoopRewriter(LoopRewriterBase):
             logger.error("loop rewrite failed, due to exception: %s, details:%s", ex, tb)
             return REWRITER_RESULT.FAIL
 
+    @staticmethod
+    def _make_vague_body_output_shapes(body_outputs):
+        for out_tensor_value_info in body_outputs:
+            shape = out_tensor_value_info.shape
+            utils.make_sure(
+                shape is not None,
+                "Conversion of Loop requries output shape [{}] exists".format(out_tensor_value_info.id)
+            )
+            out_tensor_value_info.shape = utils.create_vague_shape_like(shape)
+
+    @staticmethod
+    def _add_state_inputs(body_g, loop_props):
+        for i, tensor_value_info in enumerate(loop_props.state_inputs):
+            input_name = tensor_value_info.id
+            if input_name is None:
+                # if the variable is not used in the body graph, then we created a fake one,
+                # the same type and shape as its corresponding output.
+                out_tensor_value_info = loop_props.state_outputs[i]
+                dtype = out_tensor_value_info.dtype
+                shape = out_tensor_value_info.shape
+                input_name = utils.make_name("unused_state_input_")
+            else:
+                dtype = tensor_value_info.dtype
+                shape = tensor_value_info.shape
+
+            body_g.add_graph_input(input_name, dtype, utils.create_vague_shape_like(shape))
+
+    def _is_scan_loop(self, context):
+        """Check if the loop reads its input tensor arrays and writes its output tensor arrays at a counter
+           starting from 0 and increased by 1, and stops right after reading the last element of the inputs.
+           Such a loop is a Scan over the inputs, so the condition doesn't need to be computed in the body.
+        """
+        loop_props = context.loop_properties
+        if not loop_props.tensor_array_inputs:
+            return False
+
+        counters = [v for v in loop_props.state_variables.values() if self._is_counter(v)]
+        index_ids = set([ta.index_input_id for ta in loop_props.tensor_array_inputs] +
+                        [v.ta_index_id for v in loop_props.scan_variables.values()])
+        if len(index_ids) != 1 or index_ids.pop() not in [v.switch_true_identity_output.id for v in counters]:
+            logger.debug("tensor arrays of the loop are not accessed at the same counter")
+            return False
+
+        # the cond gets the values of the next iteration, so counter + 1 < bound
+        # means the loop has as many iterations as the bound
+        cell_outputs = set(o for n in context.cell_graph.nodes + context.cond_graph.nodes for o in n.output)
+        counter_outputs = [v.next_iteration_input.id for v in counters]
+        bounds = self._get_cond_bounds(context.cond_graph.outputs[0].id, counter_outputs)
+        if not bounds or any(b in cell_outputs for b in bounds):
+            logger.debug("loop condition is not a bound of its counters")
+            return False
+
+        for ta in loop_props.tensor_array_inputs:
+            seq_lens = [self._compare_with_seq_len(b, ta.data_input_id) for b in bounds]
+            if 0 not in seq_lens or None in seq_lens or -1 in seq_lens:
+                logger.debug("number of iterations of the loop might differ from the length of %s", ta.data_input_id)
+                return False
+        return True
+
+    def _resolve_identity(self, name):
+        node = self.g.get_node_by_output(name)
+        while node is not None and node.type == "Identity":
+            name = node.input[0]
+            node = self.g.get_node_by_output(name)
+        return name, node
+
+    def _get_const_value(self, name):
+        _, node = self._resolve_identity(name)
+        if node is None or not node.is_const():
+            return None
+        return node.get_tensor_value(as_list=False)
+
+    def _is_counter(self, loop_var):
+        if not loop_var.switch_true_identity_output.id:
+            return False
+        init_val = self._get_const_value(loop_var.enter_input_id)
+        if init_val is None or init_val.size != 1 or init_val.flatten()[0] != 0:
+            return False
+        _, add = self._resolve_identity(loop_var.next_iteration_input.id)
+        if add is None or add.type not in ["Add", "AddV2"]:
+            return False
+        for a, b in [add.input, reversed(add.input)]:
+            step = self._get_const_value(b)
+            if self._resolve_identity(a)[0] == loop_var.switch_true_identity_output.id and step is not None \
+                    and step.size == 1 and step.flatten()[0] == 1:
+                return True
+        return False
+
+    def _get_cond_bounds(self, cond_output, counter_outputs):
+        """Return the bounds if cond is counter_1 < bound_1 && counter_2 < bound_2 ..., otherwise None."""
+        _, node = self._resolve_identity(cond_output)
+        if node is None:
+            return None
+        if node.type == "LogicalAnd":
+            bounds = [self._get_cond_bounds(inp, counter_outputs) for inp in node.input]
+            return None if None in bounds else bounds[0] + bounds[1]
+        if node.type == "Less" and self._resolve_identity(node.input[0])[0] in counter_outputs:
+            return [self._resolve_identity(node.input[1])[0]]
+        return None
+
+    def _compare_with_seq_len(self, bound, data):
+        """Return 0 if bound is the length of data, 1 if it's larger, -1 if smaller and None if unknown."""
+        shape = self.g.get_shape(data)
+        seq_len = shape[0] if shape and shape[0] >= 0 else None
+        bound_val = self._get_const_value(bound)
+        if bound_val is not None:
+            bound_val = bound_val.flatten()[0]
+            if bound_val >= np.iinfo(np.int32).max:
+                return 1
+            if seq_len is None:
+                return None
+            return int(np.sign(bound_val - seq_len))
+
+        # bound is tf.shape(data)[0]
+        _, node = self._resolve_identity(bound)
+        if node is None or node.type != "StridedSlice" or node.get_attr_value("shrink_axis_mask") != 1:
+            return None
+        begin, end = [self._get_const_value(inp) for inp in node.input[1:3]]
+        if begin is None or end is None or begin.tolist() != [0] or end.tolist() != [1]:
+            return None
+        _, shape_node = self._resolve_identity(node.input[0])
+        if shape_node is None or shape_node.type != "Shape":
+            return None
+        if self._resolve_identity(shape_node.input[0])[0] != self._resolve_identity(data)[0]:
+            return None
+        return 0
+
+    def _rewrite_to_scan(self, context):
+        logger.debug("rewrite the loop into Scan")
+        loop_props = context.loop_properties
+        cell_g_info = context.cell_graph
+        self._make_vague_body_output_shapes(cell_g_info.outputs)
+        scan_body_g = LoopRewriterBase.construct_graph_from_nodes(self.g, cell_g_info.nodes, cell_g_info.outputs)
+        self._add_state_inputs(scan_body_g, loop_props)
+        for input_tensor_info in loop_props.scan_inputs:
+            scan_body_g.add_graph_input(input_tensor_info.id, input_tensor_info.dtype, input_tensor_info.shape)
+
+        outputs, shapes, dtypes = self._create_loop_outputs(loop_props)
+        self.g.make_node("Scan", loop_props.state_inputs_initial_values + loop_props.scan_inputs_initial_values,
+                         attr={"num_scan_inputs": len(loop_props.scan_inputs)},
+                         outputs=outputs, op_name_scope="generic_scan",
+                         shapes=shapes, dtypes=dtypes,
+                         skip_conversion=False, branches={"body": scan_body_g})
+        logger.debug("rewrite successfully")
+        return REWRITER_RESULT.OK
+
     def _create_subgraph_initial_cond(self, cond_graph):
         """Create subgraph to calculate initial cond."""
         # copy condition subgraph to parent graph
@@ -144,6 +275,21 @@ class LoopRewriter(LoopRewriterBase):
         return init_cond_output
 
     def _create_loop_node(self, context, loop_props, init_cond_output, branches=None):
+        loop_outputs, loop_output_shapes, loop_output_dtypes = self._create_loop_outputs(loop_props)
+
+        # trip count and cond are not used, giving them values just because bug
+        # (https://github.com/Microsoft/onnxruntime/issues/255) of onnxruntime.
+        trip_cnt = self.g.make_const(utils.make_name("trip_count"), np.array(sys.maxsize, dtype=np.int64))
+        loop_node = self.g.make_node("Loop", [trip_cnt.output[0]] + [init_cond_output] +
+                                     loop_props.state_inputs_initial_values,  # ONNX Loop support state inputs only
+                                     outputs=loop_outputs, op_name_scope="generic_loop",
+                                     shapes=loop_output_shapes, dtypes=loop_output_dtypes,
+                                     skip_conversion=False, branches=branches)
+
+        return loop_node
+
+    def _create_loop_outputs(self, loop_props):
+        """Remove the nodes producing the loop outputs so their names can be reused by the new node."""
         loop_outputs = []
         loop_output_shapes = []
         loop_output_dtypes = []
@@ -158,14 +304,4 @@ class LoopRewriter(LoopRewriterBase):
                 loop_outputs.append(utils.make_name("unused_loop_output_"))
                 loop_output_shapes.append([-1])
                 loop_output_dtypes.append(None)
-
-        # trip count and cond are not used, giving them values just because bug
-        # (https://github.com/Microsoft/onnxruntime/issues/255) of onnxruntime.
-        trip_cnt = self.g.make_const(utils.make_name("trip_count"), np.array(sys.maxsize, dtype=np.int64))
-        loop_node = self.g.make_node("Loop", [trip_cnt.output[0]] + [init_cond_output] +
-                                     loop_props.state_inputs_initial_values,  # ONNX Loop support state inputs only
-                                     outputs=loop_outputs, op_name_scope="generic_loop",
-                                     shapes=loop_output_shapes, dtypes=loop_output_dtypes,
-                                     skip_conversion=False, branches=branches)
-
-        return loop_node
+        return loop_outputs, loop_output_shapes, loop_output_dtypes
@@ -12,7 +12,7 @@ from tf2onnx import utils
 # pylint: disable=missing-docstring
 
 def extract_numpy_array(node):
-    return np.frombuffer(node.attr["value"].t.raw_data, dtype="float32")
+    return node.get_tensor_value(as_list=False).astype(np.float32).flatten()
 
 def create_qdq_nodes(g, match_results):
 
@@ -77,7 +77,7 @@ def create_qdq_nodes(g, match_results):
                                          y_zero_point.output[0]],
                                  shapes=[qdq_node_output_shape],
                                  attr=attrs,
-                                 dtypes=[qdq_node_output_dtype],
+                                 dtypes=[utils.map_numpy_to_onnx_dtype(zero_point_dtype)],
                                  name=utils.make_name("QuantLinearNode"))
 
         g.set_shape(quant_node.output[0], qdq_node_output_shape)
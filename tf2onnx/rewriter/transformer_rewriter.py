@@ -0,0 +1,392 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.rewriter - rewrite transformer subgraphs to com.microsoft contrib ops:
+Attention, SkipLayerNormalization, Gelu, FastGelu and BiasGelu
+"""
+
+import numpy as np
+from onnx import onnx_pb
+from tf2onnx import constants, logging, utils
+from tf2onnx.graph_matcher import OpTypePattern, GraphMatcher
+from tf2onnx.rewriter.fusion_utils import ADD_OPS, is_alive, get_scalar_value, is_scalar_value, \
+    split_const_input, is_filled_with
+from tf2onnx.rewriter.layer_norm_rewriter import match_layer_norm, get_layer_norm_param
+
+logger = logging.getLogger(__name__)
+
+
+# pylint: disable=missing-docstring
+
+# dtypes supported by the contrib ops in onnxruntime
+_SUPPORTED_DTYPES = [onnx_pb.TensorProto.FLOAT, onnx_pb.TensorProto.FLOAT16]
+
+
+def rewrite_transformer(g, ops):
+    if not is_ms_domain_enabled(g):
+        return ops
+    rewrite_attention(g, ops)
+    rewrite_skip_layer_norm(g, ops)
+    rewrite_gelu(g, ops)
+    return ops
+
+
+def is_ms_domain_enabled(g):
+    return utils.has_opset_domain(g.extra_opset, constants.MICROSOFT_DOMAIN)
+
+
+def _get_bias(g, node, size):
+    """If node adds a 1-D const bias of the given size, return (input node, bias node)."""
+    if node is None or node.type not in ADD_OPS + ["BiasAdd"]:
+        return None, None
+    if node.type == "BiasAdd" and node.get_attr_value("data_format", b"NHWC") != b"NHWC":
+        return None, None
+    inp, bias = split_const_input(node)
+    if bias is None or g.get_shape(bias.output[0]) != [size]:
+        return None, None
+    return inp, bias
+
+
+def rewrite_skip_layer_norm(g, ops):
+    for node in list(ops):
+        if node.type not in ADD_OPS and node.type != "Mul" and node.type != "Reshape":
+            continue
+        if not is_alive(g, [node]):
+            continue
+        match = match_layer_norm(g, node)
+        if match is None or g.get_dtype(match["output"]) not in _SUPPORTED_DTYPES:
+            continue
+        shape = g.get_shape(match["input"])
+        if len(shape) != 3 or match["axis"] != 2 or shape[2] <= 0:
+            continue
+        # the residual connection, both sides of the add must have the same shape
+        add = g.get_node_by_output(match["input"])
+        if add is None or add.type not in ADD_OPS:
+            continue
+        if any(g.get_shape(inp) != shape for inp in add.input):
+            continue
+        if not g.is_safe_to_remove_nodes(match["nodes"] + [add], outputs_to_ignore=[match["output"]]):
+            continue
+        _make_skip_layer_norm(g, add, match, shape)
+    return ops
+
+
+def _make_skip_layer_norm(g, add, match, shape):
+    hidden_size = shape[2]
+    np_dtype = utils.map_onnx_to_numpy_type(g.get_dtype(match["output"]))
+    inputs = list(add.input)
+    for key, default in [("gamma", 1), ("beta", 0)]:
+        val = get_layer_norm_param(match[key], [hidden_size], default).astype(np_dtype)
+        inputs.append(g.make_const(utils.make_name(key), val).output[0])
+
+    output = match["output"]
+    name = g.get_node_by_output(output).name
+    logger.debug("fuse %s into SkipLayerNormalization", name)
+    fused = g.make_node("SkipLayerNormalization", inputs, attr={"epsilon": match["epsilon"]},
+                        op_name_scope=name, shapes=[shape], dtypes=[g.get_dtype(output)],
+                        domain=constants.MICROSOFT_DOMAIN)
+    g.replace_all_inputs(output, fused.output[0])
+    g.safe_remove_nodes(match["nodes"] + [add])
+
+
+# Gelu
+
+def _make_gelu_patterns():
+    # 0.5 * x * (1 + erf(x / sqrt(2))), as tf.nn.gelu computes it and as bert does: x * (0.5 * (1 + erf(...)))
+    def erf_part():
+        return OpTypePattern('Add|AddV2', name='add_one', inputs=[
+            OpTypePattern('Const', name='one'),
+            OpTypePattern('Erf', inputs=[
+                OpTypePattern('Mul|RealDiv', name='div', inputs=[
+                    OpTypePattern('*', name='x1'),
+                    OpTypePattern('Const', name='sqrt_two'),
+                ]),
+            ]),
+        ])
+
+    # 0.5 * x * (1 + tanh(sqrt(2 / pi) * (x + 0.044715 * x ^ 3)))
+    def tanh_part():
+        return OpTypePattern('Add|AddV2', name='add_one', inputs=[
+            OpTypePattern('Const', name='one'),
+            OpTypePattern('Tanh', inputs=[
+                OpTypePattern('Mul', name='mul_sqrt', inputs=[
+                    OpTypePattern('Const', name='sqrt_two_over_pi'),
+                    OpTypePattern('Add|AddV2', name='add_cube', inputs=[
+                        OpTypePattern('*', name='x1'),
+                        OpTypePattern('Mul', name='mul_coeff', inputs=[
+                            OpTypePattern('Const', name='coeff'),
+                            OpTypePattern('Pow', name='pow', inputs=[
+                                OpTypePattern('*', name='x2'),
+                                OpTypePattern('Const', name='three'),
+                            ]),
+                        ]),
+                    ]),
+                ]),
+            ]),
+        ])
+
+    patterns = []
+    for op_type, make_part in [("Gelu", erf_part), ("FastGelu", tanh_part)]:
+        half_x_first = OpTypePattern('Mul', name='output', inputs=[
+            OpTypePattern('Mul', name='mul_half', inputs=[
+                OpTypePattern('Const', name='half'),
+                OpTypePattern('*', name='x'),
+            ]),
+            make_part(),
+        ])
+        half_cdf_first = OpTypePattern('Mul', name='output', inputs=[
+            OpTypePattern('*', name='x'),
+            OpTypePattern('Mul', name='mul_half', inputs=[
+                OpTypePattern('Const', name='half'),
+                make_part(),
+            ]),
+        ])
+        patterns.extend([(op_type, half_x_first), (op_type, half_cdf_first)])
+    return patterns
+
+
+def _is_gelu_match(match, op_type):
+    x = match.get_op("x")
+    if len(x.output) != 1:
+        return False
+    if not is_scalar_value(match.get_op("half"), 0.5) or not is_scalar_value(match.get_op("one"), 1.0):
+        return False
+    if op_type == "Gelu":
+        div = match.get_op("div")
+        sqrt_two = np.sqrt(2.0) if div.type == "RealDiv" else 1 / np.sqrt(2.0)
+        return match.get_op("x1") is x and is_scalar_value(match.get_op("sqrt_two"), sqrt_two)
+    return match.get_op("x1") is x and match.get_op("x2") is x and \
+        is_scalar_value(match.get_op("sqrt_two_over_pi"), np.sqrt(2 / np.pi)) and \
+        is_scalar_value(match.get_op("coeff"), 0.044715) and is_scalar_value(match.get_op("three"), 3.0)
+
+
+def rewrite_gelu(g, ops):
+    for op_type, pattern in _make_gelu_patterns():
+        matcher = GraphMatcher(pattern, allow_reorder=True)
+        for match in list(matcher.match_ops(ops)):
+            output_node = match.get_op("output")
+            nodes = [n for n in match.get_nodes() if not n.is_const() and n is not match.get_op("x")]
+            if not is_alive(g, nodes) or not _is_gelu_match(match, op_type):
+                continue
+            x = match.get_op("x").output[0]
+            if g.get_dtype(x) not in _SUPPORTED_DTYPES:
+                continue
+            if not g.is_safe_to_remove_nodes(nodes, outputs_to_ignore=[output_node.output[0]]):
+                continue
+            _make_gelu(g, op_type, x, nodes, output_node)
+    return ops
+
+
+def _make_gelu(g, op_type, x, nodes, output_node):
+    inputs = [x]
+    shape = g.get_shape(x)
+    # fuse the bias added to x if x isn't used by anything else
+    x_node = g.get_node_by_output(x)
+    if shape and shape[-1] > 0:
+        inp, bias = _get_bias(g, x_node, shape[-1])
+        if inp is not None and set(g.find_output_consumers(x)).issubset(set(nodes)):
+            inputs = [inp_name for inp_name in x_node.input if inp_name != bias.output[0]] + [bias.output[0]]
+            nodes = nodes + [x_node]
+            if op_type == "Gelu":
+                op_type = "BiasGelu"
+
+    output = output_node.output[0]
+    logger.debug("fuse %s into %s", output_node.name, op_type)
+    fused = g.make_node(op_type, inputs, op_name_scope=output_node.name, shapes=[shape], dtypes=[g.get_dtype(x)],
+                        domain=constants.MICROSOFT_DOMAIN)
+    g.replace_all_inputs(output, fused.output[0])
+    g.safe_remove_nodes(nodes)
+
+
+# Attention
+
+def rewrite_attention(g, ops):
+    # the per-head context is transposed back and the heads are merged:
+    #   reshape(transpose(softmax(scores) x V, [0, 2, 1, 3]), [B, S, N * H])
+    # with scores = Q x K' * scale [+ mask] and Q, K, V projections of the same input, split into heads
+    pattern = \
+        OpTypePattern('Reshape', name='output', inputs=[
+            OpTypePattern('Transpose', name='context_transpose', inputs=[
+                OpTypePattern('BatchMatMul|BatchMatMulV2|MatMul', name='context', inputs=[
+                    OpTypePattern('Softmax', name='softmax'),
+                    OpTypePattern('Transpose', name='v'),
+                ]),
+                OpTypePattern('Const', name='context_perm'),
+            ]),
+            '*',
+        ])
+    matcher = GraphMatcher(pattern)
+    for match in list(matcher.match_ops(ops)):
+        if not is_alive(g, match.get_nodes()):
+            continue
+        attention = _match_attention(g, match)
+        if attention is None:
+            continue
+        # nodes computing the mask are usually shared by all the layers, they are removed with the last one
+        if not g.is_safe_to_remove_nodes(attention["nodes"], outputs_to_ignore=[attention["output"]]):
+            continue
+        _make_attention(g, attention, match.get_op("output"))
+    return ops
+
+
+def _is_transpose_with_perm(node, perm):
+    return node is not None and node.type == "Transpose" and node.inputs[1].is_const() and \
+        node.inputs[1].get_tensor_value() == perm
+
+
+def _match_projection(g, transpose, perm):
+    """Match transpose(reshape(x x W + b, [B, S, N, H]), perm), return x, W, b and [B, S, N, H]."""
+    if not _is_transpose_with_perm(transpose, perm):
+        return None
+    reshape = transpose.inputs[0]
+    if reshape is None or reshape.type != "Reshape" or not reshape.inputs[1].is_const():
+        return None
+    heads_shape = reshape.inputs[1].get_tensor_value()
+    if len(heads_shape) != 4 or heads_shape.count(-1) > 1 or heads_shape[2] <= 0 or heads_shape[3] <= 0:
+        return None
+    hidden_size = heads_shape[2] * heads_shape[3]
+    nodes = [transpose, reshape]
+    matmul, bias = _get_bias(g, reshape.inputs[0], hidden_size)
+    if matmul is None:
+        matmul = reshape.inputs[0]
+    else:
+        nodes.append(reshape.inputs[0])
+    if matmul is None or matmul.type != "MatMul" or matmul.get_attr_value("transpose_a"):
+        return None
+    weight = matmul.inputs[1]
+    if weight is None or not weight.is_const():
+        return None
+    weight_val = weight.get_tensor_value(as_list=False)
+    if matmul.get_attr_value("transpose_b"):
+        weight_val = weight_val.T
+    if weight_val.shape[1] != hidden_size:
+        return None
+    bias_val = bias.get_tensor_value(as_list=False) if bias is not None else np.zeros([hidden_size])
+    nodes.append(matmul)
+    return {"input": matmul.input[0], "weight": weight_val, "bias": bias_val, "heads_shape": heads_shape,
+            "nodes": nodes}
+
+
+def _match_mask(g, node):
+    """Match (1 - mask) * filter_value with mask broadcast from a [B, S] tensor, return mask and filter value."""
+    sub, filter_value = split_const_input(node)
+    filter_value = get_scalar_value(filter_value)
+    if node.type != "Mul" or sub is None or sub.type != "Sub" or filter_value is None:
+        return None
+    if not is_scalar_value(sub.inputs[0], 1.0):
+        return None
+    nodes = [node, sub]
+    cur = sub.inputs[1]
+    # go up to the [B, S] mask through the ops broadcasting it
+    while cur is not None:
+        shape = g.get_shape(cur.output[0])
+        if shape is not None and len(shape) == 2:
+            return {"mask": cur.output[0], "filter_value": filter_value, "nodes": nodes}
+        if cur.type in ["Cast", "Reshape", "ExpandDims", "Identity"]:
+            nodes.append(cur)
+            cur = cur.inputs[0]
+        elif cur.type == "Mul":
+            other, ones = split_const_input(cur)
+            if other is None or not is_filled_with(ones, 1):
+                return None
+            nodes.append(cur)
+            cur = other
+        else:
+            return None
+    return None
+
+
+def _match_attention(g, match):
+    context = match.get_op("context")
+    if context.get_attr_value("adj_x") or context.get_attr_value("adj_y") or \
+            context.get_attr_value("transpose_a") or context.get_attr_value("transpose_b"):
+        return None
+    if not _is_transpose_with_perm(match.get_op("context_transpose"), [0, 2, 1, 3]):
+        return None
+    if g.get_dtype(context.output[0]) not in _SUPPORTED_DTYPES:
+        return None
+    nodes = [match.get_op("context_transpose"), context, match.get_op("softmax")]
+
+    # scores, optionally masked
+    cur = match.get_op("softmax").inputs[0]
+    mask = None
+    if cur.type in ADD_OPS:
+        for scores, adder in [cur.inputs, cur.inputs[::-1]]:
+            mask = _match_mask(g, adder)
+            if mask is not None:
+                nodes.append(cur)
+                cur = scores
+                break
+        if mask is None:
+            return None
+    scale = 1.0
+    if cur.type in ["Mul", "RealDiv"]:
+        qk, scale_node = split_const_input(cur)
+        scale = get_scalar_value(scale_node)
+        if scale is None or (cur.type == "RealDiv" and cur.inputs[1] is not scale_node):
+            return None
+        if cur.type == "RealDiv":
+            scale = 1.0 / scale
+        nodes.append(cur)
+        cur = qk
+    if cur is None or cur.type not in ["BatchMatMul", "BatchMatMulV2", "MatMul"]:
+        return None
+    qk = cur
+    nodes.append(qk)
+    if qk.get_attr_value("adj_x") or qk.get_attr_value("transpose_a"):
+        return None
+    k_transposed = qk.get_attr_value("adj_y") or qk.get_attr_value("transpose_b")
+
+    q = _match_projection(g, qk.inputs[0], [0, 2, 1, 3])
+    k = _match_projection(g, qk.inputs[1], [0, 2, 1, 3] if k_transposed else [0, 2, 3, 1])
+    v = _match_projection(g, match.get_op("v"), [0, 2, 1, 3])
+    if q is None or k is None or v is None:
+        return None
+    if not q["input"] == k["input"] == v["input"]:
+        return None
+    if not q["heads_shape"] == k["heads_shape"] == v["heads_shape"]:
+        return None
+    for proj in [q, k, v]:
+        nodes.extend(proj["nodes"])
+    return {"input": q["input"], "heads_shape": q["heads_shape"], "scale": scale, "mask": mask,
+            "weight": np.concatenate([q["weight"], k["weight"], v["weight"]], axis=1),
+            "bias": np.concatenate([q["bias"], k["bias"], v["bias"]]),
+            "nodes": nodes, "output": match.get_op("context_transpose").output[0]}
+
+
+def _make_attention(g, attention, output_reshape):
+    batch_size, seq_len, num_heads, head_size = attention["heads_shape"]
+    hidden_size = num_heads * head_size
+    dtype = g.get_dtype(attention["output"])
+    np_dtype = utils.map_onnx_to_numpy_type(dtype)
+
+    # Attention takes the input as [B, S, hidden]
+    input_shape = [batch_size, seq_len, hidden_size]
+    shape_const = g.make_const(utils.make_name("attention_input_shape"), np.array(input_shape, dtype=np.int64))
+    reshape = g.make_node("Reshape", [attention["input"], shape_const.output[0]],
+                          shapes=[input_shape], dtypes=[dtype])
+    weight = g.make_const(utils.make_name("attention_weight"), attention["weight"].astype(np_dtype))
+    bias = g.make_const(utils.make_name("attention_bias"), attention["bias"].astype(np_dtype))
+    inputs = [reshape.output[0], weight.output[0], bias.output[0]]
+    attr = {"num_heads": num_heads}
+    if not np.isclose(attention["scale"], 1 / np.sqrt(head_size)):
+        attr["scale"] = attention["scale"]
+
+    mask = attention["mask"]
+    if mask is not None:
+        mask_index = mask["mask"]
+        if g.get_dtype(mask_index) != onnx_pb.TensorProto.INT32:
+            mask_index = g.make_node("Cast", [mask_index], attr={"to": onnx_pb.TensorProto.INT32},
+                                     shapes=[g.get_shape(mask_index)], dtypes=[onnx_pb.TensorProto.INT32]).output[0]
+        inputs.append(mask_index)
+        attr["mask_filter_value"] = mask["filter_value"]
+
+    logger.debug("fuse attention into %s", output_reshape.name)
+    fused = g.make_node("Attention", inputs, attr=attr, op_name_scope=output_reshape.name,
+                        shapes=[input_shape], dtypes=[dtype], domain=constants.MICROSOFT_DOMAIN)
+    g.replace_input(output_reshape, output_reshape.input[0], fused.output[0], 0)
+    nodes = attention["nodes"]
+    if attention["mask"] is not None:
+        nodes = nodes + attention["mask"]["nodes"]
+    g.safe_remove_nodes(nodes)
@@ -8,10 +8,16 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import hashlib
 import logging
+import os
+from collections import abc as collections_abc
 from distutils.version import LooseVersion
 
 import tensorflow as tf
+from tensorflow.core.framework import node_def_pb2
+from tensorflow.core.protobuf import saved_model_pb2, trackable_object_graph_pb2
+from tensorflow.python.framework import op_def_registry
 from tensorflow.python.ops import lookup_ops
 
 from tf2onnx import utils
@@ -203,9 +209,24 @@ def from_graphdef(model_path, input_names, output_names):
         input_names = inputs_without_resource(sess, input_names)
         frozen_graph = tf_optimize(input_names, output_names, frozen_graph)
     tf_reset_default_graph()
+    copy_output_shapes(graph_def, frozen_graph)
     return frozen_graph, input_names, output_names
 
 
+def copy_output_shapes(src_graph_def, dst_graph_def):
+    """
+    Copy the _output_shapes of the nodes of src_graph_def, written with add_shapes=True, to the nodes of
+    dst_graph_def with the same name and op. They are lost when tensorflow imports and optimizes the graph.
+    """
+    src_nodes = {n.name: n for n in src_graph_def.node if "_output_shapes" in n.attr}
+    if not src_nodes:
+        return
+    for node in dst_graph_def.node:
+        src_node = src_nodes.get(node.name)
+        if src_node is not None and src_node.op == node.op and "_output_shapes" not in node.attr:
+            node.attr["_output_shapes"].CopyFrom(src_node.attr["_output_shapes"])
+
+
 def from_checkpoint(model_path, input_names, output_names):
     """Load tensorflow graph from checkpoint."""
     # make sure we start with clean default graph
@@ -325,6 +346,146 @@ def _restore_captured_resources(concrete_func, graph_captures_copy, func_capture
         concrete_func._captured_inputs = func_captures_copy
 
 
+# nodes which are never merged, even with the same op, attrs and inputs
+_UNMERGEABLE_OPS = ["Placeholder", "PlaceholderV2", "PlaceholderWithDefault",
+                    "Enter", "Exit", "Merge", "Switch", "NextIteration", "LoopCond"]
+
+
+def _get_merge_key(node):
+    """Return what identifies the value node computes, None if it can't be merged with other nodes."""
+    if node.op in _UNMERGEABLE_OPS:
+        return None
+    op_def = op_def_registry.get(node.op)
+    if op_def is None or op_def.is_stateful:
+        return None
+    sha = hashlib.sha256()
+    for k in sorted(node.attr):
+        # attrs starting with _, like _output_shapes, don't change the value
+        if not k.startswith("_"):
+            sha.update(k.encode("utf-8"))
+            sha.update(node.attr[k].SerializeToString(deterministic=True))
+    # control inputs are ignored by the conversion
+    return node.op, tuple(i for i in node.input if not i.startswith("^")), sha.hexdigest()
+
+
+def merge_duplicated_nodes(graph_def, keep_names=None):
+    """
+    Merge the nodes of graph_def with the same op, attrs and data inputs into one, so that the consts and
+    subgraphs duplicated by freezing several functions are converted only once. Identities are bypassed first,
+    the ones left by inlining the function calls differ between the callers. The nodes in keep_names are kept.
+    """
+    keep_names = set(keep_names or [])
+    nodes = {node.name: node for node in graph_def.node}
+    consumers = {name: [] for name in nodes}
+    pending = {}
+    for node in graph_def.node:
+        input_names = set(utils.node_name(i.lstrip("^")) for i in node.input)
+        pending[node.name] = len(input_names)
+        for name in input_names:
+            consumers[name].append(node.name)
+
+    # key is a removed node, value is the node computing the same outputs
+    replaced = {}
+    # key is the output of a bypassed identity, value is its input
+    aliases = {}
+
+    def remap(inp):
+        if inp.startswith("^"):
+            name = inp[1:]
+            if name + ":0" in aliases:
+                name = utils.node_name(aliases[name + ":0"])
+            return "^" + replaced.get(name, name)
+        name, _, port = inp.partition(":")
+        if name + ":" + (port or "0") in aliases:
+            return aliases[name + ":" + (port or "0")]
+        return replaced.get(name, name) + (":" + port if port else "")
+
+    merge_keys = {}
+    ready = [node.name for node in graph_def.node if pending[node.name] == 0]
+    while ready:
+        name = ready.pop()
+        node = nodes[name]
+        node.input[:] = [remap(i) for i in node.input]
+        if name not in keep_names and node.op == "Identity":
+            aliases[name + ":0"] = node.input[0]
+        else:
+            key = _get_merge_key(node)
+            if key is not None:
+                if key in merge_keys and name not in keep_names:
+                    replaced[name] = merge_keys[key]
+                else:
+                    merge_keys.setdefault(key, name)
+        for consumer in consumers[name]:
+            pending[consumer] -= 1
+            if pending[consumer] == 0:
+                ready.append(consumer)
+
+    result = tf_graphdef()
+    result.versions.CopyFrom(graph_def.versions)
+    result.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if node.name in replaced or node.name + ":0" in aliases:
+            continue
+        new_node = result.node.add()
+        new_node.CopyFrom(node)
+        # nodes in loops weren't visited, and merged nodes can leave repeated control inputs
+        inputs = []
+        for inp in node.input:
+            inp = remap(inp)
+            if inp not in inputs and inp != "^" + node.name:
+                inputs.append(inp)
+        new_node.input[:] = inputs
+    logger.info("Bypassed %d identities and merged %d duplicated nodes", len(aliases), len(replaced))
+    return result
+
+
+def _make_signatures_function(imported, signatures):
+    """
+    Return a concrete function calling the signatures of imported, the model inputs are the union of their inputs,
+    the inputs with the same name are shared. The outputs are those of the signatures, in order, each sorted by key.
+    """
+    funcs = [imported.signatures[sig] for sig in signatures]
+    specs = {}
+    for sig, func in zip(signatures, funcs):
+        for name, spec in func.structured_input_signature[1].items():
+            if name in specs:
+                utils.make_sure(specs[name].dtype == spec.dtype and specs[name].shape.is_compatible_with(spec.shape),
+                                "Input %s of signature %s doesn't match the one of the other signatures", name, sig)
+                spec = tf.TensorSpec(specs[name].shape.most_specific_compatible_shape(spec.shape), spec.dtype)
+            specs[name] = spec
+    input_names = sorted(specs)
+
+    @tf.function(input_signature=[tf.TensorSpec(specs[name].shape, specs[name].dtype, name=name)
+                                  for name in input_names])
+    def call_signatures(*args):
+        feeds = dict(zip(input_names, args))
+        outputs = []
+        for func in funcs:
+            results = func(**{name: feeds[name] for name in func.structured_input_signature[1]})
+            outputs.extend(results[key] for key in sorted(results))
+        return outputs
+
+    output_keys = [(sig, key) for sig, func in zip(signatures, funcs) for key in sorted(func.structured_outputs)]
+    return call_signatures.get_concrete_function(), output_keys
+
+
+def _name_signature_outputs(frozen_graph, outputs, output_keys):
+    """Add an Identity named <signature>/<key> for each output, return the names of the new outputs."""
+    nodes = {node.name: node for node in frozen_graph.node}
+    new_outputs = []
+    for output, key in zip(outputs, output_keys):
+        name = "/".join(key)
+        utils.make_sure(name not in nodes, "Output name %s is already used in the graph", name)
+        src = nodes[utils.node_name(output)]
+        node = frozen_graph.node.add(name=name, op="Identity", input=[output])
+        node.attr["T"].type = src.attr["T"].type if "T" in src.attr else src.attr["dtype"].type
+        if "_output_shapes" in src.attr:
+            port = int(output.split(":")[1])
+            node.attr["_output_shapes"].list.shape.add().CopyFrom(src.attr["_output_shapes"].list.shape[port])
+        new_outputs.append(name + ":0")
+    return new_outputs
+
+
 def _from_saved_model_v2(model_path, input_names, output_names, tag, signature_def,
                          concrete_function_index, large_model):
     """Load tensorflow graph from saved_model."""
@@ -332,7 +493,6 @@ def _from_saved_model_v2(model_path, input_names, output_names, tag, signature_d
     wrn_no_tag = "'--tag' not specified for saved_model. Using --tag serve"
     wrn_empty_tag = "'--tag' value is empty string. Using tag =[[]]"
     wrn_sig_1 = "'--signature_def' not specified, using first signature: %s"
-    err_many_sig = "Cannot load multiple signature defs in TF2.x: %s"
     err_no_call = "Model doesn't contain usable concrete functions under  __call__. Try --signature-def instead."
     err_index = "Invalid concrete_function value: %i. Valid values are [0 to %i]"
     err_no_sig = "No signatures found in model. Try --concrete_function instead."
@@ -347,7 +507,6 @@ def _from_saved_model_v2(model_path, input_names, output_names, tag, signature_d
         tag = [[]]
         logger.warning(wrn_empty_tag)
 
-    utils.make_sure(len(signature_def) < 2, err_many_sig, str(signature_def))
     imported = tf.saved_model.load(model_path, tags=tag)  # pylint: disable=no-value-for-parameter
 
     all_sigs = imported.signatures.keys()
@@ -355,12 +514,18 @@ def _from_saved_model_v2(model_path, input_names, output_names, tag, signature_d
     logger.info("Signatures found in model: %s", "[" + ",".join(valid_sigs) + "].")
 
     concrete_func = None
+    output_keys = None
     if concrete_function_index is not None:
         utils.make_sure(hasattr(imported, "__call__"), err_no_call)
         utils.make_sure(concrete_function_index < len(imported.__call__.concrete_functions),
                         err_index, concrete_function_index, len(imported.__call__.concrete_functions) - 1)
         sig = imported.__call__.concrete_functions[concrete_function_index].structured_input_signature[0]
         concrete_func = imported.__call__.get_concrete_function(*sig)
+    elif len(signature_def) > 1:
+        for sig in signature_def:
+            utils.make_sure(sig in valid_sigs, err_sig_nomatch, sig)
+        # the signatures are frozen together, the variables they share become the same consts
+        concrete_func, output_keys = _make_signatures_function(imported, signature_def)
     elif signature_def:
         utils.make_sure(signature_def[0] in valid_sigs, err_sig_nomatch, signature_def[0])
         concrete_func = imported.signatures[signature_def[0]]
@@ -375,7 +540,12 @@ def _from_saved_model_v2(model_path, input_names, output_names, tag, signature_d
     # filter by user specified inputs/outputs
     if input_names:
         inputs = list(set(input_names) & set(inputs))
-    if output_names:
+    if output_names and output_keys is not None:
+        # the outputs of several signatures are named <signature>/<key>:0
+        kept = [(output, key) for output, key in zip(outputs, output_keys) if "/".join(key) + ":0" in output_names]
+        outputs = [output for output, _ in kept]
+        output_keys = [key for _, key in kept]
+    elif output_names:
         outputs = list(set(output_names) & set(outputs))
 
     # Avoid errors due to bug in TF freezing
@@ -392,6 +562,11 @@ def _from_saved_model_v2(model_path, input_names, output_names, tag, signature_d
     # We might be returning the concrete_func so let's put it back in working order
     _restore_captured_resources(concrete_func, graph_captures_copy, func_captures_copy)
 
+    if output_keys is not None:
+        outputs = _name_signature_outputs(frozen_graph, outputs, output_keys)
+        frozen_graph = merge_duplicated_nodes(frozen_graph, keep_names=[utils.node_name(i) for i in inputs + outputs])
+        frozen_graph = extract_sub_graph(frozen_graph, [utils.node_name(i) for i in inputs + outputs])
+
     table_names, key_dtypes, value_dtypes = get_hash_table_info(frozen_graph)
     placeholder_to_table_info = {}
     _get_hash_table_info_from_trackable(imported, table_names, key_dtypes, value_dtypes,
@@ -443,6 +618,275 @@ def from_saved_model(model_path, input_names, output_names, tag=None,
     return result
 
 
+class CheckpointValues(collections_abc.Mapping):
+    """
+    Maps the names of the const nodes which replace variable reads to the tensor_content of the variables,
+    like the dict returned by compress_graph_def. Values are read from the checkpoint when they are looked up.
+    """
+
+    def __init__(self, reader, node_to_key):
+        self._reader = reader
+        self._node_to_key = node_to_key
+
+    def __getitem__(self, name):
+        return self._reader.get_tensor(self._node_to_key[name]).tobytes()
+
+    def subset(self, names):
+        return CheckpointValues(self._reader, {n: self._node_to_key[n] for n in names if n in self._node_to_key})
+
+    def __iter__(self):
+        return iter(self._node_to_key)
+
+    def __len__(self):
+        return len(self._node_to_key)
+
+
+_CALL_OPS = ["PartitionedCall", "StatefulPartitionedCall"]
+_REF_VARIABLE_OPS = ["Variable", "VariableV2"]
+
+
+def _get_meta_graph(model_path, tag):
+    saved_model = saved_model_pb2.SavedModel()
+    with tf_gfile.GFile(os.path.join(model_path, "saved_model.pb"), "rb") as f:
+        saved_model.ParseFromString(f.read())
+    for meta_graph in saved_model.meta_graphs:
+        if set(meta_graph.meta_info_def.tags) == set(tag):
+            return meta_graph
+    raise ValueError("No meta graph with tags {} in saved_model {}".format(tag, model_path))
+
+
+def _get_variable_keys(meta_graph, object_graph, call_node):
+    """Return the checkpoint keys of the variables captured by call_node, by the names of their VarHandleOps."""
+    function_name = call_node.attr["f"].func.name
+    if function_name not in meta_graph.object_graph_def.concrete_functions:
+        return {}
+    # captures are the last inputs of the call
+    bound_inputs = meta_graph.object_graph_def.concrete_functions[function_name].bound_inputs
+    data_inputs = [i for i in call_node.input if not i.startswith("^")]
+    captures = data_inputs[len(data_inputs) - len(bound_inputs):]
+    variable_keys = {}
+    for capture, node_id in zip(captures, bound_inputs):
+        for attribute in object_graph.nodes[node_id].attributes:
+            if attribute.name == "VARIABLE_VALUE":
+                variable_keys[utils.node_name(capture)] = attribute.checkpoint_key
+    return variable_keys
+
+
+def _flatten_function_body(fdef):
+    """
+    Return copies of the nodes of fdef with the tensor names of a GraphDef, node:index instead of
+    node:output_arg:index, and the names of the tensors fdef returns.
+    """
+    flat_names = {arg.name: arg.name for arg in fdef.signature.input_arg}
+    for node in fdef.node_def:
+        op_def = op_def_registry.get(node.op)
+        utils.make_sure(op_def is not None, "Op %s in function %s is not registered", node.op, fdef.signature.name)
+        index = 0
+        for arg in op_def.output_arg:
+            if arg.number_attr:
+                count = node.attr[arg.number_attr].i
+            elif arg.type_list_attr:
+                count = len(node.attr[arg.type_list_attr].list.type)
+            else:
+                count = 1
+            for i in range(count):
+                flat_names["{}:{}:{}".format(node.name, arg.name, i)] = "{}:{}".format(node.name, index)
+                index += 1
+    nodes = []
+    for node in fdef.node_def:
+        new_node = node_def_pb2.NodeDef()
+        new_node.CopyFrom(node)
+        new_node.input[:] = [i if i.startswith("^") else flat_names[i] for i in node.input]
+        nodes.append(new_node)
+    return nodes, [flat_names[fdef.ret[arg.name]] for arg in fdef.signature.output_arg]
+
+
+def _inline_function_calls(nodes, functions):
+    """
+    Replace the calls of functions in nodes by the nodes of their bodies, scoped by the call name, recursively.
+    The arguments become Identity nodes and the call an IdentityN of the results, so the names used by the
+    consumers of the call and by the nodes of the body don't change.
+    """
+    new_nodes = []
+    for node in nodes:
+        function_name = node.attr["f"].func.name if node.op in _CALL_OPS else None
+        if function_name not in functions:
+            new_nodes.append(node)
+            continue
+        fdef = functions[function_name]
+        scope = node.name + "/"
+        data_inputs = [i for i in node.input if not i.startswith("^")]
+        control_inputs = [i for i in node.input if i.startswith("^")]
+
+        body_nodes, results = _flatten_function_body(fdef)
+        for body_node in body_nodes:
+            body_node.name = scope + body_node.name
+            body_node.input[:] = ["^" + scope + i[1:] if i.startswith("^") else scope + i for i in body_node.input]
+        for arg, inp in zip(fdef.signature.input_arg, data_inputs):
+            arg_node = node_def_pb2.NodeDef(name=scope + arg.name, op="Identity", input=[inp] + control_inputs)
+            arg_node.attr["T"].type = arg.type
+            body_nodes.append(arg_node)
+        new_nodes.extend(_inline_function_calls(body_nodes, functions))
+
+        result_node = node_def_pb2.NodeDef(name=node.name, op="IdentityN", input=[scope + r for r in results])
+        result_node.attr["T"].list.type.extend([arg.type for arg in fdef.signature.output_arg])
+        if not results:
+            result_node.op = "NoOp"
+            result_node.ClearField("attr")
+        new_nodes.append(result_node)
+    return new_nodes
+
+
+def _replace_variable_reads(nodes, variable_keys, reader):
+    """
+    Replace ReadVariableOp and ResourceGather of the variables in variable_keys by const nodes.
+    Return the nodes and a CheckpointValues with the values of the consts.
+    """
+    identity_inputs = {node.name: node.input[0] for node in nodes if node.op == "Identity"}
+
+    def find_variable(name):
+        name = utils.node_name(name)
+        while name in identity_inputs:
+            name = utils.node_name(identity_inputs[name])
+        return name
+
+    dtypes = reader.get_variable_to_dtype_map()
+    shapes = reader.get_variable_to_shape_map()
+    node_to_key = {}
+
+    def make_const(const_node, key):
+        dtype = dtypes[key]
+        const_node.op = "Const"
+        const_node.ClearField("attr")
+        const_node.attr["dtype"].type = dtype.as_datatype_enum
+        tensor = const_node.attr["value"].tensor
+        if dtype in [tf.string, tf.resource, tf.variant]:
+            tensor.CopyFrom(tf.make_tensor_proto(reader.get_tensor(key)))
+        else:
+            # the values are read from the checkpoint by the converter, like for compress_graph_def
+            tensor.dtype = dtype.as_datatype_enum
+            tensor.tensor_shape.CopyFrom(tf.TensorShape(shapes[key]).as_proto())
+            node_to_key[const_node.name] = key
+
+    new_nodes = []
+    for node in nodes:
+        key = None
+        if node.op in ["ReadVariableOp", "ResourceGather"]:
+            key = variable_keys.get(find_variable(node.input[0]))
+        elif node.op in _REF_VARIABLE_OPS:
+            key = variable_keys.get(node.name)
+        if key is None:
+            new_nodes.append(node)
+        elif node.op in _REF_VARIABLE_OPS:
+            # ref variables are read by Identity nodes, the variable itself becomes the const
+            make_const(node, key)
+            new_nodes.append(node)
+        elif node.op == "ReadVariableOp":
+            control_inputs = [i for i in node.input if i.startswith("^")]
+            make_const(node, key)
+            node.input[:] = control_inputs
+            new_nodes.append(node)
+        else:
+            value_node = node_def_pb2.NodeDef(name=node.name + "/value")
+            make_const(value_node, key)
+            axis_node = node_def_pb2.NodeDef(name=node.name + "/axis", op="Const")
+            axis_node.attr["dtype"].type = tf.int32.as_datatype_enum
+            axis_node.attr["value"].tensor.CopyFrom(tf.make_tensor_proto(0, dtype=tf.int32))
+            gather_node = node_def_pb2.NodeDef(name=node.name, op="GatherV2",
+                                               input=[value_node.name, node.input[1], axis_node.name])
+            gather_node.input.extend([i for i in node.input if i.startswith("^")])
+            gather_node.attr["Tparams"].type = dtypes[key].as_datatype_enum
+            gather_node.attr["Tindices"].CopyFrom(node.attr["Tindices"])
+            gather_node.attr["Taxis"].type = tf.int32.as_datatype_enum
+            gather_node.attr["batch_dims"].i = node.attr["batch_dims"].i
+            new_nodes.extend([value_node, axis_node, gather_node])
+    return new_nodes, CheckpointValues(reader, node_to_key)
+
+
+def _prune_library(graph_def):
+    """Remove the functions graph_def doesn't call anymore."""
+    functions = {f.signature.name: f for f in graph_def.library.function}
+    used = set()
+    todo = list(graph_def.node)
+    while todo:
+        node = todo.pop()
+        for attr in node.attr.values():
+            for func in [attr.func] + list(attr.list.func):
+                if func.name in functions and func.name not in used:
+                    used.add(func.name)
+                    todo.extend(functions[func.name].node_def)
+    kept = [functions[name] for name in functions if name in used]
+    del graph_def.library.function[:]
+    graph_def.library.function.extend(kept)
+
+
+def from_saved_model_checkpoint(model_path, input_names, output_names, tag=None, signature_def=None):
+    """
+    Load the graph of a signature of a saved_model without loading it in tensorflow or freezing it.
+    The function calls of the signature are inlined from saved_model.pb and the variables read by them are
+    replaced by const nodes without values. Their values are streamed from the checkpoint in variables/
+    while converting, they are returned as a mapping like the one of compress_graph_def.
+    Returns the graph_def, inputs, outputs and the const values.
+    """
+    if tag is None:
+        tag = ['serve']
+        logger.warning("'--tag' not specified for saved_model. Using --tag serve")
+    if not isinstance(tag, list):
+        tag = [tag]
+    meta_graph = _get_meta_graph(model_path, tag)
+
+    valid_sigs = [s for s in meta_graph.signature_def if not s.startswith("_")]
+    if signature_def:
+        utils.make_sure(len(signature_def) == 1, "Cannot load multiple signature defs: %s", signature_def)
+        utils.make_sure(signature_def[0] in valid_sigs, "Specified signature not in model %s", signature_def[0])
+        signature = signature_def[0]
+    else:
+        utils.make_sure(len(valid_sigs) > 0, "No signatures found in model.")
+        signature = valid_sigs[0]
+        logger.warning("'--signature_def' not specified, using first signature: %s", signature)
+    inputs = [t.name for t in meta_graph.signature_def[signature].inputs.values() if t.dtype != tf.resource]
+    outputs = [t.name for t in meta_graph.signature_def[signature].outputs.values() if t.dtype != tf.resource]
+    if input_names:
+        inputs = [i for i in inputs if i in input_names]
+    if output_names:
+        outputs = [o for o in outputs if o in output_names]
+
+    reader = tf.train.load_checkpoint(os.path.join(model_path, "variables", "variables"))
+    graph_def = meta_graph.graph_def
+    variable_keys = {}
+    if reader.has_tensor("_CHECKPOINTABLE_OBJECT_GRAPH"):
+        # tf2, the checkpoint keys come from the object graph
+        object_graph = trackable_object_graph_pb2.TrackableObjectGraph()
+        object_graph.ParseFromString(reader.get_tensor("_CHECKPOINTABLE_OBJECT_GRAPH"))
+        output_nodes = {utils.node_name(o) for o in outputs}
+        for node in graph_def.node:
+            if node.name in output_nodes and node.op in _CALL_OPS:
+                variable_keys.update(_get_variable_keys(meta_graph, object_graph, node))
+    else:
+        # tf1, variables are saved by their names
+        for node in graph_def.node:
+            if node.op in _REF_VARIABLE_OPS + ["VarHandleOp"] and reader.has_tensor(node.name):
+                variable_keys[node.name] = node.name
+
+    functions = {f.signature.name: f for f in graph_def.library.function}
+    nodes = _inline_function_calls(graph_def.node, functions)
+    nodes, const_node_values = _replace_variable_reads(nodes, variable_keys, reader)
+    new_graph_def = tf_graphdef()
+    new_graph_def.versions.CopyFrom(graph_def.versions)
+    new_graph_def.node.extend(nodes)
+    new_graph_def.library.CopyFrom(graph_def.library)
+    needed_names = [utils.node_name(i) for i in inputs + outputs]
+    new_graph_def = extract_sub_graph(new_graph_def, needed_names)
+    _prune_library(new_graph_def)
+
+    const_node_values = const_node_values.subset([node.name for node in new_graph_def.node])
+    unread = [node.name for node in new_graph_def.node if node.op in _REF_VARIABLE_OPS + ["VarHandleOp"]]
+    utils.make_sure(not unread, "Variables %s are used by ops which can't read them from the checkpoint, "
+                                "convert the model without --stream_variables", unread)
+    logger.info("Reading %d variables from the checkpoint of %s", len(const_node_values), model_path)
+    return new_graph_def, inputs, outputs, const_node_values
+
+
 def from_keras(model_path, input_names, output_names):
     """Load keras model - experimental for now."""
     from tensorflow.python import keras as _keras
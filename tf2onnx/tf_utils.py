@@ -10,13 +10,14 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import collections
+import collections.abc as collections_abc
 from distutils.version import LooseVersion
 
 import numpy as np
 import tensorflow as tf
 
 from tensorflow.core.framework import types_pb2, tensor_pb2, graph_pb2
-from tensorflow.python.framework import tensor_util
+from tensorflow.python.framework import op_def_registry, tensor_util
 
 from onnx import helper, onnx_pb, numpy_helper
 
@@ -49,8 +50,45 @@ TF_TO_ONNX_DTYPE = {
 }
 
 
-def tf_to_onnx_tensor(tensor, name=""):
-    """Convert tensorflow tensor to onnx tensor."""
+# dtypes whose tensor_content has the same layout as the raw_data of the onnx tensor
+_RAW_DATA_DTYPES = {
+    types_pb2.DT_FLOAT, types_pb2.DT_HALF, types_pb2.DT_DOUBLE, types_pb2.DT_INT32, types_pb2.DT_INT16,
+    types_pb2.DT_INT8, types_pb2.DT_UINT8, types_pb2.DT_UINT16, types_pb2.DT_INT64, types_pb2.DT_COMPLEX64,
+    types_pb2.DT_COMPLEX128, types_pb2.DT_BOOL, types_pb2.DT_QUINT8,
+}
+
+
+def _tf_to_onnx_tensor_raw(tensor, name, tensor_content):
+    """Copy tensor_content into the raw_data of an onnx tensor without decoding it, None if it can't be."""
+    if tensor.dtype not in _RAW_DATA_DTYPES:
+        return None
+    dims = [d.size for d in tensor.tensor_shape.dim]
+    itemsize = np.dtype(map_onnx_to_numpy_type(TF_TO_ONNX_DTYPE[tensor.dtype])).itemsize
+    # an empty tensor_content means the values are in the typed fields, maybe broadcasted
+    if not tensor_content or len(tensor_content) != int(np.prod(dims, dtype=np.int64)) * itemsize:
+        return None
+    onnx_tensor = onnx_pb.TensorProto()
+    onnx_tensor.name = name
+    onnx_tensor.data_type = TF_TO_ONNX_DTYPE[tensor.dtype]
+    onnx_tensor.dims.extend(dims)
+    onnx_tensor.raw_data = tensor_content
+    return onnx_tensor
+
+
+def tf_to_onnx_tensor(tensor, name="", tensor_content=None):
+    """Convert tensorflow tensor to onnx tensor.
+       tensor_content overrides the one of tensor, e.g. when it was moved out by compress_graph_def.
+    """
+    # tensorflow and onnx both store fixed width values little endian in row major order
+    onnx_tensor = _tf_to_onnx_tensor_raw(tensor, name,
+                                         tensor.tensor_content if tensor_content is None else tensor_content)
+    if onnx_tensor is not None:
+        return onnx_tensor
+    if tensor_content is not None:
+        tensor_copy = tensor_pb2.TensorProto()
+        tensor_copy.CopyFrom(tensor)
+        tensor_copy.tensor_content = tensor_content
+        tensor = tensor_copy
     np_data = get_tf_tensor_data(tensor)
     if np_data.dtype == np.object:
         # assume np_data is string, numpy_helper.from_array accepts ndarray,
@@ -141,6 +179,31 @@ def compress_graph_def(graph_def):
                 tensor.tensor_content = b''
     return const_node_values
 
+
+class GraphDefConstValues(collections_abc.Mapping):
+    """The values of the Const nodes of graph_def by node name as np.ndarray, as the converter reads them.
+       Values are only read when they are looked up, const_node_values holds the tensor_content of
+       compressed consts, see compress_graph_def.
+    """
+
+    def __init__(self, graph_def, const_node_values=None):
+        self._nodes = {node.name: node for node in graph_def.node if node.op == "Const"}
+        self._const_node_values = const_node_values or {}
+
+    def __getitem__(self, name):
+        tensor = self._nodes[name].attr["value"].tensor
+        return numpy_helper.to_array(tf_to_onnx_tensor(tensor, name, self._const_node_values.get(name)))
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+
 def get_index_from_strided_slice_of_shape(node, outputs_to_values):
     """Returns the  index of the dimension that the strided slice is reading from the shape node or None"""
     attr_vals = {
@@ -317,26 +380,27 @@ def replace_placeholders_with_tables(graph_def, placeholder_to_table_info):
             n.attr['key_dtype'].type = key_dtype
             n.attr['value_dtype'].type = val_dtype
 
+# tensorflow attributes which are not kept on the onnx nodes
+_IGNORED_ATTR = {"unknown_rank", "_class", "Tshape", "use_cudnn_on_gpu", "Index", "Tpaddings",
+                "TI", "Tparams", "Tindices", "Tlen", "Tdim", "Tin", "dynamic_size", "Tmultiples",
+                "Tblock_shape", "Tcrops", "index_type", "Taxis", "U", "maxval",
+                "Tout", "Tlabels", "Tindex", "element_shape", "Targmax", "Tperm", "Tcond",
+                "T_threshold", "element_dtype", "shape_type", "_lower_using_switch_merge",
+                "parallel_iterations", "_num_original_outputs", "output_types", "output_shapes",
+                "key_dtype", "value_dtype", "Tin", "Tout", "capacity", "component_types", "shapes",
+                "Toutput_types", "dense_shapes", "Tdense", "Tsegmentids", "Tshift", "Tnumsegments", "SrcT",
+                "Tcomplex", "Treal",  # For RFFT, Tcomplex is ignored because
+                                      # onnx.helper.make_node fails,
+                                      # TODO: it should be added back.
+                }
+
+
 def tflist_to_onnx(g, shape_override, const_node_values=None):
     """
     Convert the tf-node list into an onnx graph with minimal rewrites so
     we can use the onnx graph as intermediate graph.
     """
 
-    # ignore the following attributes
-    ignored_attr = {"unknown_rank", "_class", "Tshape", "use_cudnn_on_gpu", "Index", "Tpaddings",
-                    "TI", "Tparams", "Tindices", "Tlen", "Tdim", "Tin", "dynamic_size", "Tmultiples",
-                    "Tblock_shape", "Tcrops", "index_type", "Taxis", "U", "maxval",
-                    "Tout", "Tlabels", "Tindex", "element_shape", "Targmax", "Tperm", "Tcond",
-                    "T_threshold", "element_dtype", "shape_type", "_lower_using_switch_merge",
-                    "parallel_iterations", "_num_original_outputs", "output_types", "output_shapes",
-                    "key_dtype", "value_dtype", "Tin", "Tout", "capacity", "component_types", "shapes",
-                    "Toutput_types", "dense_shapes", "Tdense", "Tsegmentids", "Tshift", "Tnumsegments", "SrcT",
-                    "Tcomplex", "Treal",  # For RFFT, Tcomplex is ignored because
-                                          # onnx.helper.make_node fails,
-                                          # TODO: it should be added back.
-                    }
-
     node_list = g.get_operations()
     functions = {}
 
@@ -367,7 +431,7 @@ def tflist_to_onnx(g, shape_override, const_node_values=None):
         for a in node.node_def.attr:
             attr_cnt[a] += 1
             value = get_tf_node_attr(node, a)
-            if a in ignored_attr:
+            if a in _IGNORED_ATTR:
                 pass
             elif a == "T":
                 if value and not isinstance(value, list):
@@ -384,9 +448,8 @@ def tflist_to_onnx(g, shape_override, const_node_values=None):
             elif a == "DstT":
                 attr["to"] = map_tf_dtype(value)
             elif isinstance(value, tensor_pb2.TensorProto):
-                if const_node_values and node.name in const_node_values:
-                    value.tensor_content = const_node_values[node.name]
-                onnx_tensor = tf_to_onnx_tensor(value, name=port_name(node.name))
+                tensor_content = const_node_values.get(node.name) if const_node_values else None
+                onnx_tensor = tf_to_onnx_tensor(value, name=port_name(node.name), tensor_content=tensor_content)
                 attr[a] = onnx_tensor
             elif isinstance(value, tf.DType):
                 attr[a] = map_tf_dtype(value)
@@ -408,6 +471,175 @@ def tflist_to_onnx(g, shape_override, const_node_values=None):
     return onnx_nodes, op_cnt, attr_cnt, output_shapes, dtypes, functions
 
 
+def _get_node_attrs(node_def, op_def):
+    """Return the attributes of node_def completed with the defaults of op_def, as tf.import_graph_def does."""
+    attrs = {a.name: a.default_value for a in op_def.attr if a.HasField("default_value")}
+    attrs.update(node_def.attr)
+    return attrs
+
+
+def _get_output_dtypes(attrs, op_def):
+    """Return the tensorflow dtypes of the outputs of an op from its OpDef."""
+    dtypes = []
+    for arg in op_def.output_arg:
+        if arg.type_list_attr:
+            dtypes.extend(attrs[arg.type_list_attr].list.type)
+        else:
+            dtype = arg.type if arg.type else attrs[arg.type_attr].type
+            dtypes.extend([dtype] * (attrs[arg.number_attr].i if arg.number_attr else 1))
+    return dtypes
+
+
+def _get_attr_value(attr_value):
+    """Return the python value of an AttrValue like tf.Operation.get_attr, dtypes are left as DataType enums."""
+    field = attr_value.WhichOneof("value")
+    if field != "list":
+        return getattr(attr_value, field) if field else None
+    for list_field in ["s", "i", "f", "b", "type", "shape", "tensor", "func"]:
+        values = getattr(attr_value.list, list_field)
+        if values:
+            return list(values)
+    return []
+
+
+def _get_input_name(name):
+    # the first output of a node is referred to by the node name
+    return name if ":" in name else port_name(name)
+
+
+def _get_shape_from_proto(shape_proto):
+    if shape_proto.unknown_rank:
+        return None
+    return [d.size if d.size >= 0 else None for d in shape_proto.dim]
+
+
+def graph_def_has_output_shapes(graph_def):
+    """
+    Return True if graph_def can be converted by graphdef_to_onnx without importing it into tensorflow:
+    it has no functions, all its ops are registered and all nodes but Const carry _output_shapes.
+    Graphs written with as_graph_def(add_shapes=True) do.
+    """
+    if graph_def.library.function:
+        return False
+    for node_def in graph_def.node:
+        op_def = op_def_registry.get(node_def.op)
+        if op_def is None:
+            return False
+        if node_def.op in ["Const", "ConstV2"]:
+            continue
+        if "_output_shapes" not in node_def.attr:
+            return False
+        output_count = len(_get_output_dtypes(_get_node_attrs(node_def, op_def), op_def))
+        if len(node_def.attr["_output_shapes"].list.shape) != output_count:
+            return False
+    return True
+
+
+def graphdef_to_onnx(graph_def, shape_override, const_node_values=None):
+    """
+    Convert the nodes of a GraphDef into an onnx graph like tflist_to_onnx does, but straight from the
+    protobufs: shapes come from the _output_shapes attributes and dtypes from the OpDefs of the ops, so the
+    graph isn't imported into tensorflow. graph_def must pass graph_def_has_output_shapes.
+    """
+    op_cnt = collections.Counter()
+    attr_cnt = collections.Counter()
+    onnx_nodes = []
+    output_shapes = {}
+    dtypes = {}
+
+    for node_def in graph_def.node:
+        op_def = op_def_registry.get(node_def.op)
+        make_sure(op_def is not None, "Op %s of node %s is not registered in tensorflow", node_def.op, node_def.name)
+        attrs = _get_node_attrs(node_def, op_def)
+        output_dtypes = _get_output_dtypes(attrs, op_def)
+        output_names = ["{}:{}".format(node_def.name, i) for i in range(len(output_dtypes))]
+        if node_def.op in ["Const", "ConstV2"]:
+            shapes = [[d.size for d in attrs["value"].tensor.tensor_shape.dim]]
+        else:
+            shapes = [_get_shape_from_proto(shape) for shape in attrs["_output_shapes"].list.shape]
+        for name, dtype, shape in zip(output_names, output_dtypes, shapes):
+            dtypes[name] = TF_TO_ONNX_DTYPE[dtype]
+            output_shapes[name] = shape_override.get(name, shape)
+
+        attr = {}
+        op_cnt[node_def.op] += 1
+        for a, attr_value in attrs.items():
+            if a == "_output_shapes":
+                continue
+            attr_cnt[a] += 1
+            value = _get_attr_value(attr_value)
+            if a in _IGNORED_ATTR:
+                pass
+            elif a == "T":
+                if value and not isinstance(value, list):
+                    dtypes[node_def.name] = TF_TO_ONNX_DTYPE[value]
+            elif a == "shape":
+                if not value.unknown_rank:
+                    attr[a] = [int(d.size) for d in value.dim]
+            elif a == "DstT":
+                attr["to"] = TF_TO_ONNX_DTYPE[value]
+            elif isinstance(value, tensor_pb2.TensorProto):
+                tensor_content = const_node_values.get(node_def.name) if const_node_values else None
+                attr[a] = tf_to_onnx_tensor(value, name=port_name(node_def.name), tensor_content=tensor_content)
+            elif attr_value.WhichOneof("value") == "type":
+                attr[a] = TF_TO_ONNX_DTYPE[value]
+            elif attr_value.WhichOneof("value") == "list" and attr_value.list.type:
+                attr[a] = [TF_TO_ONNX_DTYPE[v] for v in value]
+            else:
+                attr[a] = value
+
+        # control inputs are dropped, like tf.Operation.inputs does
+        input_names = [_get_input_name(i) for i in node_def.input if not i.startswith("^")]
+        try:
+            onnx_node = helper.make_node(node_def.op, input_names, output_names, name=node_def.name, **attr)
+            onnx_nodes.append(onnx_node)
+        except Exception as ex:
+            logger.error("pass1 convert failed for %s, ex=%s", node_def, ex)
+            raise
+
+    return onnx_nodes, op_cnt, attr_cnt, output_shapes, dtypes
+
+
+def compute_const_folding_for_graph_def(graph_def, const_node_values, graph_outputs):
+    """
+    Run compute_const_folding_using_tf on graph_def if it has something to fold: an op other than Identity
+    with only constant inputs or a StridedSlice of a Shape. Otherwise tensorflow is not needed at all.
+    """
+    const_outputs = set()
+    shape_outputs = set()
+    for node_def in graph_def.node:
+        if node_def.op in ["Const", "ConstV2"]:
+            const_outputs.add(node_def.name + ":0")
+        elif node_def.op == "Shape":
+            shape_outputs.add(node_def.name + ":0")
+    identities = {node_def.name + ":0": _get_input_name(node_def.input[0]) for node_def in graph_def.node
+                  if node_def.op == "Identity"}
+
+    def is_const(name):
+        while name in identities:
+            name = identities[name]
+        return name in const_outputs
+
+    graph_outputs = set(graph_outputs or [])
+    needs_folding = False
+    for node_def in graph_def.node:
+        inputs = [_get_input_name(i) for i in node_def.input if not i.startswith("^")]
+        if node_def.op == "StridedSlice" and inputs and inputs[0] in shape_outputs:
+            needs_folding = True
+        elif node_def.op not in ["Const", "ConstV2", "Identity", "Enter"] and inputs and \
+                node_def.name + ":0" not in graph_outputs and all(is_const(i) for i in inputs):
+            needs_folding = True
+        if needs_folding:
+            logger.debug("Node %s needs tensorflow for constant folding", node_def.name)
+            break
+    if not needs_folding:
+        return {}, {}
+
+    with tf.Graph().as_default() as tf_graph:
+        tf.import_graph_def(graph_def, name='')
+    return compute_const_folding_using_tf(tf_graph, const_node_values, graph_outputs)
+
+
 def tensorflow_to_onnx(graph, shape_override, const_node_values=None):
     """
     Load tensorflow graph and do a conversion.
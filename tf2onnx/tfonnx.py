@@ -15,6 +15,8 @@ import traceback
 
 import numpy as np
 from onnx import onnx_pb
+import tensorflow as tf
+from tensorflow.core.framework import graph_pb2
 
 import tf2onnx
 import tf2onnx.onnx_opset  # pylint: disable=unused-import
@@ -24,8 +26,9 @@ from tf2onnx.rewriter import *  # pylint: disable=wildcard-import
 from tf2onnx.shape_inference import infer_shape
 from tf2onnx.tf_loader import is_function, resolve_functions, set_function
 from tf2onnx.tf_utils import tensorflow_to_onnx, get_tf_version, compute_const_folding_using_tf
+from tf2onnx.tf_utils import graphdef_to_onnx, graph_def_has_output_shapes, compute_const_folding_for_graph_def
 
-from . import constants, logging, schemas, utils, handler
+from . import constants, logging, provenance, schemas, utils, handler
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +36,21 @@ logger = logging.getLogger(__name__)
 # pylint: disable=useless-return,broad-except,logging-not-lazy,unused-argument,missing-docstring
 # pylint: disable=unused-variable
 
+def _taint_const_inputs(g, node):
+    """Taint the consts which node is computed from."""
+    stack = list(node.inputs)
+    seen = set()
+    while stack:
+        inp = stack.pop()
+        if inp is None or inp.name in seen:
+            continue
+        seen.add(inp.name)
+        if inp.is_const():
+            provenance.taint(g, inp.provenance)
+        else:
+            stack.extend(inp.inputs)
+
+
 def fold_constants_using_tf(g, outputs_to_values, outputs_to_dtypes):
     ops = list(g.get_nodes())
     # pylint: disable=too-many-nested-blocks
@@ -43,6 +61,8 @@ def fold_constants_using_tf(g, outputs_to_values, outputs_to_dtypes):
             if op.output and op.output[0] in outputs_to_values:
                 logger.info("folding node using tf type=%s, name=%s" % (op.type, op.name))
                 val = outputs_to_values[op.output[0]]
+                # tensorflow computed the value, it can't be replayed on new weights
+                _taint_const_inputs(g, op)
 
                 new_node_name = utils.make_name(op.name)
                 new_output_name = new_node_name
@@ -368,10 +388,12 @@ def process_tf_graph(tf_graph, continue_on_error=False, verbose=False, target=No
                      opset=None, custom_op_handlers=None, custom_rewriter=None,
                      extra_opset=None, shape_override=None, inputs_as_nchw=None,
                      input_names=None, output_names=None, is_subgraph=False, const_node_values=None,
-                     initialized_tables=None):
+                     initialized_tables=None, record_provenance=False):
     """Convert tensorflow graph to onnx graph.
         Args:
-            tf_graph: tensorflow graph
+            tf_graph: tensorflow graph, or a frozen GraphDef with _output_shapes which is converted
+                without importing it into tensorflow, see graph_def_has_output_shapes. With shape_override or
+                inputs_as_nchw the GraphDef is imported, its shapes are inferred again from the new inputs
             continue_on_error: if an op can't be processed (aka there is no mapping), continue
             verbose: print summary stats (deprecated)
             target: list of workarounds applied to help certain platforms
@@ -385,6 +407,8 @@ def process_tf_graph(tf_graph, continue_on_error=False, verbose=False, target=No
             output_names: list of output node names in graph, output name format as node_name:port_id
             const_node_values: a dict returned by compress_graph_def mapping node names to tensor values
             initialized_tables: mapping from table shared_names to tuple of keys and values of table
+            record_provenance: record how the initializers are computed from the consts of tf_graph,
+                see tf2onnx.provenance.make_provenance
         Return:
             onnx graph
     """
@@ -402,8 +426,18 @@ def process_tf_graph(tf_graph, continue_on_error=False, verbose=False, target=No
                            "please upgrade onnx package to avoid potential conversion issue.",
                            utils.get_onnx_version(), opset)
 
-    is_func = is_function(tf_graph)
-    if not is_func:
+    is_graph_def = isinstance(tf_graph, graph_pb2.GraphDef)
+    if is_graph_def and (shape_override or inputs_as_nchw):
+        # the _output_shapes after the overridden inputs don't hold anymore
+        graph_def = tf_graph
+        with tf.Graph().as_default() as tf_graph:
+            tf.import_graph_def(graph_def, name='')
+        is_graph_def = False
+    if is_graph_def:
+        utils.make_sure(graph_def_has_output_shapes(tf_graph),
+                        "GraphDef needs _output_shapes on its nodes and no functions to be converted directly, "
+                        "import it into a tf.Graph instead")
+    elif not is_function(tf_graph):
         tf_graph = infer_shape(tf_graph, shape_override)
 
     if shape_override is None:
@@ -413,11 +447,18 @@ def process_tf_graph(tf_graph, continue_on_error=False, verbose=False, target=No
     if target is None:
         target = constants.DEFAULT_TARGET
 
-    outputs_to_values, outputs_to_dtypes = compute_const_folding_using_tf(tf_graph, const_node_values, output_names)
-
-    onnx_nodes, op_cnt, attr_cnt, output_shapes, dtypes, _ = \
-        tensorflow_to_onnx(tf_graph, shape_override, const_node_values)
-    if not is_subgraph:
+    if is_graph_def:
+        # the shapes are already in the graph, tensorflow is only needed if there are constants to fold
+        outputs_to_values, outputs_to_dtypes = \
+            compute_const_folding_for_graph_def(tf_graph, const_node_values, output_names)
+        onnx_nodes, op_cnt, attr_cnt, output_shapes, dtypes = \
+            graphdef_to_onnx(tf_graph, shape_override, const_node_values)
+    else:
+        outputs_to_values, outputs_to_dtypes = \
+            compute_const_folding_using_tf(tf_graph, const_node_values, output_names)
+        onnx_nodes, op_cnt, attr_cnt, output_shapes, dtypes, _ = \
+            tensorflow_to_onnx(tf_graph, shape_override, const_node_values)
+    if not is_subgraph and not is_graph_def:
         # make tf2onnx internal subgraphs from the tensorflow subgraphs
         ordered_func = resolve_functions(tf_graph)
         for func in ordered_func:
@@ -448,6 +489,11 @@ def process_tf_graph(tf_graph, continue_on_error=False, verbose=False, target=No
             raise ValueError("Inputs/Outputs Not Found")
 
     g = Graph(onnx_nodes, output_shapes, dtypes, target, opset, extra_opset, output_names, is_subgraph=is_subgraph)
+    if record_provenance and not is_subgraph:
+        # trace the initializers back to the consts of the tensorflow graph
+        for node in g.get_nodes():
+            if node.is_const():
+                node.provenance = provenance.source(node.name)
 
     # create ops mapping for the desired opsets
     ops_mapping = handler.tf_op.create_mapping(g.opset, g.extra_opset)
@@ -512,8 +558,13 @@ def process_tf_graph(tf_graph, continue_on_error=False, verbose=False, target=No
         rewrite_single_direction_gru,
         rewrite_bi_direction_gru,
         rewrite_custom_rnn_cell,
+        # tf2 keras rnn layers
+        rewrite_keras_rnn,
         rewrite_generic_loop, rewrite_cond,
         rewrite_biasadd_with_conv2d,
+        # needs MatMul and its bias before they are merged into Gemm
+        rewrite_transformer,
+        rewrite_layer_norm,
         rewrite_gemm,
     ]
 
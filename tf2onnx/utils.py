@@ -9,6 +9,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import mmap
 import os
 import re
 import shutil
@@ -213,6 +214,104 @@ def save_onnx_zip(target_path, model_proto, external_tensor_storage):
         for k, v in external_tensor_storage.name_to_tensor_data.items():
             z.writestr(k, v)
 
+
+def _encode_varint(value):
+    """Encode value as protobuf varint."""
+    data = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            data.append(bits | 0x80)
+        else:
+            data.append(bits)
+            return bytes(data)
+
+
+def _field_key(message_type, field_name):
+    """Key of a length delimited field of message_type in the protobuf wire format."""
+    number = message_type.DESCRIPTOR.fields_by_name[field_name].number
+    return _encode_varint(number << 3 | 2)
+
+
+def save_onnx_model_streaming(target_path, model_proto, initializers):
+    """Save model_proto with initializers appended to its graph, serializing one initializer at a time.
+       Each initializer is written as a graph field of its own holding only that initializer. Protobuf
+       merges repeated occurrences of a message field, so the file loads as a model whose graph has
+       all the initializers, in order.
+    """
+    graph_key = _field_key(ModelProto, "graph")
+    initializer_key = _field_key(onnx_pb.GraphProto, "initializer")
+    dir_name = os.path.dirname(target_path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    with open(target_path, "wb") as f:
+        f.write(model_proto.SerializeToString())
+        for tensor in initializers:
+            data = tensor.SerializeToString()
+            data_size = _encode_varint(len(data))
+            f.write(graph_key)
+            f.write(_encode_varint(len(initializer_key) + len(data_size) + len(data)))
+            f.write(initializer_key)
+            f.write(data_size)
+            f.write(data)
+
+
+def get_external_tensors(graph_proto):
+    """Yield the tensors of graph_proto and of its subgraphs which have their data stored externally."""
+    tensors = list(graph_proto.initializer)
+    for node in graph_proto.node:
+        for attr in node.attribute:
+            if attr.HasField("t"):
+                tensors.append(attr.t)
+            tensors.extend(attr.tensors)
+            if attr.HasField("g"):
+                for t in get_external_tensors(attr.g):
+                    yield t
+            for g in attr.graphs:
+                for t in get_external_tensors(g):
+                    yield t
+    for t in tensors:
+        if t.data_location == onnx_pb.TensorProto.EXTERNAL:
+            yield t
+
+
+def save_onnx_external_data(target_path, model_proto, external_tensor_storage,
+                            alignment=constants.EXTERNAL_DATA_ALIGNMENT):
+    """Save model_proto to target_path in the standard onnx external data format: the tensors of
+       external_tensor_storage go to a single file target_path + ".data", next to the model, with offsets
+       aligned to alignment bytes so that runtimes can memory map them.
+    """
+    data_path = target_path + ".data"
+    data_location = os.path.basename(data_path)
+    dir_name = os.path.dirname(target_path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    offset = 0
+    with open(data_path, "wb") as f:
+        for tensor in get_external_tensors(model_proto.graph):
+            entries = {entry.key: entry.value for entry in tensor.external_data}
+            data = external_tensor_storage.name_to_tensor_data[entries["location"]]
+            padding = -offset % alignment
+            f.write(b"\0" * padding)
+            offset += padding
+            f.write(data)
+            set_external_data(tensor, data_location, offset, len(data))
+            offset += len(data)
+    save_protobuf(target_path, model_proto)
+
+
+def set_external_data(tensor, location, offset, length):
+    """Point tensor to length bytes at offset in the external data file location."""
+    del tensor.external_data[:]
+    for key, value in [("location", location), ("offset", str(offset)), ("length", str(length))]:
+        entry = tensor.external_data.add()
+        entry.key = key
+        entry.value = value
+    tensor.data_location = onnx_pb.TensorProto.EXTERNAL
+    tensor.ClearField("raw_data")
+
+
 def make_sure(bool_val, error_msg, *args):
     if not bool_val:
         raise ValueError("make_sure failure: " + error_msg % args)
@@ -235,8 +334,9 @@ def construct_graph_from_nodes(parent_g, nodes, outputs, shapes, dtypes):
                 body_graph.parent_graph = g
                 branches[attr_name] = body_graph
 
-        _ = g.make_node(op.type, op.input, outputs=op.output, attr=op.attr, name=op.name,
-                        skip_conversion=op.skip_conversion, infer_shape_dtype=False, branches=branches)
+        new_node = g.make_node(op.type, op.input, outputs=op.output, attr=op.attr, name=op.name,
+                               skip_conversion=op.skip_conversion, infer_shape_dtype=False, branches=branches)
+        new_node.provenance = op.provenance
 
     for i in all_outputs:
         if i not in g._output_shapes:
@@ -280,10 +380,81 @@ def save_protobuf(path, message, as_text=False):
         with open(path, "wb") as f:
             f.write(message.SerializeToString())
 
-def model_proto_from_file(model_path):
+def _decode_varint(data, pos):
+    """Decode the protobuf varint at pos in data, return its value and the position after it."""
+    value = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return value, pos
+        shift += 7
+
+
+def _iter_fields(data, start, end):
+    """Yield number, wire type, start of the key, start and end of the value of the fields in data[start:end].
+       The value of length delimited fields starts after their length.
+    """
+    pos = start
+    while pos < end:
+        key_start = pos
+        key, pos = _decode_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value_end = _decode_varint(data, pos)[1]
+        elif wire_type == 1:
+            value_end = pos + 8
+        elif wire_type == 2:
+            length, pos = _decode_varint(data, pos)
+            value_end = pos + length
+        elif wire_type == 5:
+            value_end = pos + 4
+        else:
+            raise ValueError("Unsupported protobuf wire type {} at offset {}".format(wire_type, key_start))
+        yield number, wire_type, key_start, pos, value_end
+        pos = value_end
+
+
+# messages which can hold tensors, only these are scanned for the values to skip
+_TENSOR_HOLDERS = {m.DESCRIPTOR.full_name: m.DESCRIPTOR for m in [
+    ModelProto, onnx_pb.GraphProto, onnx_pb.NodeProto, onnx_pb.AttributeProto, onnx_pb.TensorProto,
+    onnx_pb.SparseTensorProto]}
+
+_TENSOR_DATA_FIELDS = set(onnx_pb.TensorProto.DESCRIPTOR.fields_by_name[name].number for name in [
+    "raw_data", "float_data", "int32_data", "string_data", "int64_data", "double_data", "uint64_data"])
+
+
+def _strip_tensor_data(data, start, end, descriptor):
+    """Return the message of type descriptor serialized in data[start:end] without the values of its tensors."""
+    parts = []
+    for number, wire_type, key_start, value_start, value_end in _iter_fields(data, start, end):
+        if descriptor is onnx_pb.TensorProto.DESCRIPTOR and number in _TENSOR_DATA_FIELDS:
+            continue
+        field = descriptor.fields_by_number.get(number)
+        if wire_type == 2 and field is not None and field.message_type is not None \
+                and field.message_type.full_name in _TENSOR_HOLDERS:
+            value = _strip_tensor_data(data, value_start, value_end, _TENSOR_HOLDERS[field.message_type.full_name])
+            parts.extend([_encode_varint(number << 3 | 2), _encode_varint(len(value)), value])
+        else:
+            parts.append(data[key_start:value_end])
+    return b"".join(parts)
+
+
+def model_proto_from_file(model_path, skip_tensor_data=False):
+    """Load the ModelProto saved at model_path.
+       With skip_tensor_data the values of the tensors, in the graphs and in the attributes of the nodes, are
+       skipped while scanning the file instead of being parsed, their names, types, shapes and external data
+       are kept. The file is memory mapped, so only the structure of the model is ever read.
+    """
     model_proto = ModelProto()
     with open(model_path, "rb") as f:
-        model_proto.ParseFromString(f.read())
+        if not skip_tensor_data:
+            model_proto.ParseFromString(f.read())
+            return model_proto
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            model_proto.ParseFromString(_strip_tensor_data(data, 0, len(data), ModelProto.DESCRIPTOR))
     return model_proto
 
 def model_proto_from_zip(zip_path, external_tensor_storage):
@@ -380,6 +551,11 @@ def is_onnx_domain(domain):
     return False
 
 
+def has_opset_domain(opsets, domain):
+    """Check if one of the opsets is for domain."""
+    return any(opset.domain == domain for opset in opsets or [])
+
+
 def parse_bool(val):
     if val is None:
         return False
@@ -9,12 +9,10 @@ from contextlib import contextmanager
 import logging as _logging
 from logging import *  # pylint: disable=wildcard-import, unused-wildcard-import
 import os
+import sys
 import types
 
-import tensorflow as tf
-TF2 = tf.__version__.startswith("2.")
-
-from . import constants  # pylint: disable=wrong-import-position
+from . import constants
 
 VERBOSE = 15
 
@@ -67,9 +65,10 @@ def set_level(level):
 
 
 def set_tf_verbosity(level):
-    """ Set TF logging verbosity."""
+    """ Set TF logging verbosity. tensorflow isn't imported for it, call it again once tensorflow is loaded."""
     # TF log is too verbose, adjust it
-    if TF2:
+    tf = sys.modules.get("tensorflow")
+    if tf is None or tf.__version__.startswith("2."):
         return
 
     level = ERROR if level >= INFO else level
@@ -0,0 +1,86 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""
+tf2onnx.weight_store - persistent content addressed store for the external tensors of converted models.
+Each distinct tensor is written once to the data file of the store; all models saved into the store
+point to it through the offsets of the onnx external data format.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import json
+import logging
+import os
+
+from tf2onnx import constants, utils
+from tf2onnx.graph import ExternalTensorStorage
+
+logger = logging.getLogger(__name__)
+
+DATA_FILE = "weights.data"
+INDEX_FILE = "index.json"
+
+
+class WeightStore(ExternalTensorStorage):
+    """ExternalTensorStorage whose tensors are saved to the store in store_dir instead of a file per model.
+       The index maps the sha256 of the bytes of each tensor to their offset and length in the data file,
+       which is only ever appended to, so the offsets of models saved before stay valid.
+       Models must be saved into one store by one process at a time.
+    """
+
+    def __init__(self, store_dir, alignment=constants.EXTERNAL_DATA_ALIGNMENT):
+        super(WeightStore, self).__init__()
+        self.store_dir = store_dir
+        self.data_path = os.path.join(store_dir, DATA_FILE)
+        self.index_path = os.path.join(store_dir, INDEX_FILE)
+        self.alignment = alignment
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            utils.make_sure(index["alignment"] == alignment, "Weight store %s is aligned to %d bytes, not %d",
+                            store_dir, index["alignment"], alignment)
+            self.index = index["tensors"]
+
+    def _save_index(self):
+        # the index is replaced in one step, a failed save leaves the one of the previous model
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"alignment": self.alignment, "tensors": self.index}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def save_model(self, target_path, model_proto):
+        """Save model_proto to target_path, with its external tensors in the store.
+           Return the number of bytes added to the store.
+        """
+        os.makedirs(self.store_dir, exist_ok=True)
+        dir_name = os.path.dirname(os.path.abspath(target_path))
+        os.makedirs(dir_name, exist_ok=True)
+        # locations are relative to the directory of the model
+        location = os.path.relpath(os.path.abspath(self.data_path), dir_name).replace(os.sep, "/")
+        if location.startswith("../"):
+            logger.warning("Weight store %s is outside of the directory of %s, some runtimes refuse external "
+                           "data there", self.store_dir, target_path)
+        added = 0
+        with open(self.data_path, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            for tensor in utils.get_external_tensors(model_proto.graph):
+                entries = {entry.key: entry.value for entry in tensor.external_data}
+                data = self.name_to_tensor_data[entries["location"]]
+                key = hashlib.sha256(data).hexdigest()
+                if key not in self.index:
+                    padding = -offset % self.alignment
+                    f.write(b"\0" * padding)
+                    offset += padding
+                    f.write(data)
+                    self.index[key] = [offset, len(data)]
+                    offset += len(data)
+                    added += len(data)
+                utils.set_external_data(tensor, location, *self.index[key])
+        self._save_index()
+        utils.save_protobuf(target_path, model_proto)
+        return added
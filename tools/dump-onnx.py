@@ -14,10 +14,12 @@ import argparse
 import collections
 import re
 
+import numpy as np
 import onnx
-from onnx import ModelProto
 from onnx import helper, shape_inference
 
+from tf2onnx import utils
+
 
 def get_args():
     parser = argparse.ArgumentParser()
@@ -27,23 +29,58 @@ def get_args():
     parser.add_argument("--meta", help="include meta data", action="store_true")
     parser.add_argument("--check", help="check onnx model", action="store_true")
     parser.add_argument("--stats", help="collect stats", action="store_true")
+    parser.add_argument("--lazy", help="skip the values of the tensors while reading the model, "
+                                       "for the structure of large models", action="store_true")
     args = parser.parse_args()
+    if args.lazy and args.check:
+        parser.error("--check needs the values of the tensors, it can't be used with --lazy")
     return args
 
 
+# item sizes of the onnx types which have no numpy type in utils.ONNX_TO_NUMPY_DTYPE
+_ITEM_SIZES = {
+    onnx.TensorProto.UINT32: 4,
+    onnx.TensorProto.BFLOAT16: 2,
+}
+
+
+def tensor_size(tensor):
+    """Number of bytes of the values of tensor, from its external data or its type and shape,
+       None if the size of its type isn't known.
+    """
+    if tensor.data_location == onnx.TensorProto.EXTERNAL:
+        entries = {entry.key: entry.value for entry in tensor.external_data}
+        if "length" in entries:
+            return int(entries["length"])
+    if tensor.data_type == onnx.TensorProto.STRING:
+        # without their values, with --lazy, strings count as empty
+        return sum(len(s) for s in tensor.string_data)
+    if tensor.data_type in utils.ONNX_TO_NUMPY_DTYPE:
+        item_size = np.dtype(utils.map_onnx_to_numpy_type(tensor.data_type)).itemsize
+    else:
+        item_size = _ITEM_SIZES.get(tensor.data_type)
+        if item_size is None:
+            return None
+    return int(np.prod(tensor.dims)) * item_size
+
+
 def main():
     args = get_args()
 
-    with open(args.input, "rb") as f:
-        data = f.read()
-        model = ModelProto()
-        model.ParseFromString(data)
+    model = utils.model_proto_from_file(args.input, skip_tensor_data=args.lazy)
 
     if args.stats:
         ops = collections.Counter()
         for node in model.graph.node:
             ops[node.op_type] += 1
-        print(ops, "\n\n")
+        print(ops, "\n")
+        sizes = [tensor_size(t) for t in model.graph.initializer]
+        known_sizes = [size for size in sizes if size is not None]
+        print("{} initializers, {} bytes, the largest is {} bytes".format(len(sizes), sum(known_sizes),
+                                                                         max(known_sizes + [0])))
+        if len(known_sizes) != len(sizes):
+            print("{} initializers of unknown types aren't counted".format(len(sizes) - len(known_sizes)))
+        print("\n")
 
     if args.meta:
         fields = ["ir_version", "producer_name", "producer_version", "name", "opset_import"]